@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -5,7 +6,12 @@ from .views import (
     AdherenceStreakViewSet,
     record_adherence,
     adherence_summary,
+    adherence_summary_async,
     adherence_report,
+    adherence_report_async,
+    dashboard,
+    dashboard_async,
+    adherence_heatmap,
     sync_adherence_records
 )
 
@@ -14,13 +20,20 @@ router = DefaultRouter()
 router.register(r'records', AdherenceRecordViewSet, basename='adherence-records')
 router.register(r'streaks', AdherenceStreakViewSet, basename='adherence-streaks')
 
+if settings.ASYNC_READ_VIEWS:
+    summary_view, report_view, dashboard_view = adherence_summary_async, adherence_report_async, dashboard_async
+else:
+    summary_view, report_view, dashboard_view = adherence_summary, adherence_report, dashboard
+
 urlpatterns = [
     # Include router URLs
     path('', include(router.urls)),
     
     # Custom endpoints
     path('respond/', record_adherence, name='record-adherence'),
-    path('summary/', adherence_summary, name='adherence-summary'),
-    path('report/', adherence_report, name='adherence-report'),
+    path('summary/', summary_view, name='adherence-summary'),
+    path('report/', report_view, name='adherence-report'),
+    path('dashboard/', dashboard_view, name='adherence-dashboard'),
+    path('heatmap/', adherence_heatmap, name='adherence-heatmap'),
     path('sync/', sync_adherence_records, name='sync-adherence'),
 ]
@@ -0,0 +1,268 @@
+"""
+Per-day adherence calendars.
+
+``AdherenceCalendar`` keeps, for one (user, medication, year), how many
+doses were taken, missed and skipped on each day: three arrays of one
+unsigned byte per day of the year. The arrays are adjusted on every write of
+an ``AdherenceRecord`` (see ``AdherenceRecord.save``, the post_delete
+receiver in ``adherence.signals`` and the bulk jobs), so a year of history
+is a single row of about a kilobyte.
+
+For streaks the arrays are turned into bitsets held in Python ints (bit
+``i`` is day ``i``): a day is *good* when doses were taken and none were
+missed or skipped, *bad* when any were missed or skipped, and neutral when
+nothing was recorded. Streaks count good days over runs without a bad
+day, which is a handful of integer operations per run.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import AdherenceCalendar, AdherenceRecord
+
+User = get_user_model()
+
+COUNTED_STATUSES = ('taken', 'missed', 'skipped')
+DAYS = 366
+EMPTY_YEAR = bytes(DAYS)
+MAX_COUNT = 255
+
+# Rows locked per query when applying a batch of changes
+LOCK_CHUNK = 500
+
+# bytes.translate() table that turns per-day counts into '0'/'1' digits
+_TO_BINARY_DIGITS = bytes([ord('0')] + [ord('1')] * 255)
+
+
+def day_key(user_id, medication_id, scheduled_time):
+    """Calendar row key and day index of a dose scheduled at ``scheduled_time``"""
+    day = timezone.localtime(scheduled_time).date()
+    return (user_id, medication_id, day.year), day.timetuple().tm_yday - 1
+
+
+def apply_changes(changes):
+    """
+    Adjust the calendars for ``changes``, an iterable of
+    ``(user_id, medication_id, scheduled_time, status, delta)`` where
+    ``delta`` is +1 when a record starts counting under ``status`` and -1
+    when it stops. Rows are created as needed and locked in key order, so
+    concurrent writers cannot lose each other's updates or deadlock.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for user_id, medication_id, scheduled_time, status, delta in changes:
+        if status in COUNTED_STATUSES and delta:
+            key, index = day_key(user_id, medication_id, scheduled_time)
+            deltas[key][status, index] += delta
+    if not deltas:
+        return
+
+    keys = sorted(deltas)
+    with transaction.atomic():
+        rows = {}
+        for i in range(0, len(keys), LOCK_CHUNK):
+            rows.update(_lock(keys[i:i + LOCK_CHUNK]))
+        # Removing counts from a row that does not exist changes nothing, and
+        # its medication or user may be going away in the same transaction
+        missing = [key for key in keys if key not in rows and any(d > 0 for d in deltas[key].values())]
+        if missing:
+            AdherenceCalendar.objects.bulk_create(
+                [AdherenceCalendar(user_id=u, medication_id=m, year=y) for u, m, y in missing],
+                ignore_conflicts=True,
+            )
+            for i in range(0, len(missing), LOCK_CHUNK):
+                rows.update(_lock(missing[i:i + LOCK_CHUNK]))
+
+        now = timezone.now()
+        for key, row in rows.items():
+            arrays = {status: bytearray(getattr(row, status)) for status in COUNTED_STATUSES}
+            for (status, index), delta in deltas[key].items():
+                counts = arrays[status]
+                counts[index] = min(max(counts[index] + delta, 0), MAX_COUNT)
+            for status, counts in arrays.items():
+                setattr(row, status, bytes(counts))
+            row.updated_at = now
+        AdherenceCalendar.objects.bulk_update(
+            list(rows.values()), [*COUNTED_STATUSES, 'updated_at'], batch_size=LOCK_CHUNK
+        )
+
+
+def _lock(keys):
+    query = Q()
+    for user_id, medication_id, year in keys:
+        query |= Q(user_id=user_id, medication_id=medication_id, year=year)
+    rows = (
+        AdherenceCalendar.objects.select_for_update()
+        .filter(query)
+        .order_by('user_id', 'medication_id', 'year')
+    )
+    return {(row.user_id, row.medication_id, row.year): row for row in rows}
+
+
+def build_calendars(entries):
+    """
+    Unsaved calendar rows for ``entries``, an iterable of
+    ``(user_id, medication_id, day, status, count)``
+    """
+    arrays = {}
+    for user_id, medication_id, day, status, count in entries:
+        if status not in COUNTED_STATUSES:
+            continue
+        key = (user_id, medication_id, day.year)
+        if key not in arrays:
+            arrays[key] = {s: bytearray(DAYS) for s in COUNTED_STATUSES}
+        counts = arrays[key][status]
+        index = day.timetuple().tm_yday - 1
+        counts[index] = min(counts[index] + count, MAX_COUNT)
+    return [
+        AdherenceCalendar(
+            user_id=user_id, medication_id=medication_id, year=year,
+            **{status: bytes(counts) for status, counts in planes.items()}
+        )
+        for (user_id, medication_id, year), planes in arrays.items()
+    ]
+
+
+def rebuild_calendars(user_chunk=500, progress=None, users=None):
+    """
+    Recompute every calendar (or those of the ``users`` ids) from the
+    adherence records, one transaction per range of users. Used to backfill
+    history and to repair calendars after records were removed by raw
+    deletes, which send no signals (see ``users.deletion``).
+    Returns the number of rows written.
+    """
+    candidates = User.objects.all() if users is None else User.objects.filter(id__in=users)
+    written = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            candidates.filter(id__gt=last_user_id).order_by('id').values_list('id', flat=True)[:user_chunk]
+        )
+        if not user_ids:
+            return written
+        last_user_id = user_ids[-1]
+
+        with transaction.atomic():
+            # Hold the existing rows so writes in the meantime wait for the rebuild
+            list(
+                AdherenceCalendar.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .values_list('id', flat=True)
+            )
+            daily = (
+                AdherenceRecord.objects.filter(
+                    user_id__in=user_ids,
+                    status__in=COUNTED_STATUSES,
+                )
+                .annotate(day=TruncDate('scheduled_time'))
+                .values_list('user_id', 'medication_id', 'day', 'status')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            rows = build_calendars(daily.iterator(chunk_size=5000))
+            AdherenceCalendar.objects.filter(user_id__in=user_ids).delete()
+            AdherenceCalendar.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        if progress:
+            progress(last_user_id, written)
+
+
+def merge_counts(rows, year):
+    """Per-day ``{status: [count, ...]}`` of ``year``, summed over ``rows``"""
+    days = 366 if calendar.isleap(year) else 365
+    merged = {status: [0] * days for status in COUNTED_STATUSES}
+    for row in rows:
+        for status in COUNTED_STATUSES:
+            totals = merged[status]
+            for index, count in enumerate(bytes(getattr(row, status))[:days]):
+                if count:
+                    totals[index] += count
+    return merged
+
+
+def to_bits(counts):
+    """Bitset of the days in ``counts`` (bytes) with a non-zero count"""
+    return int(bytes(counts).translate(_TO_BINARY_DIGITS)[::-1] or b'0', 2)
+
+
+def day_bits(rows, year):
+    """``(good, bad)`` day bitsets of ``year`` over ``rows`` (any of the user's medications)"""
+    days = 366 if calendar.isleap(year) else 365
+    taken = bad = 0
+    for row in rows:
+        taken |= to_bits(bytes(row.taken)[:days])
+        bad |= to_bits(bytes(row.missed)[:days]) | to_bits(bytes(row.skipped)[:days])
+    return taken & ~bad, bad
+
+
+def _runs(mask):
+    """Yield each maximal run of set bits of ``mask`` as its own mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        # Adding the lowest bit carries through its run and clears it
+        run = mask & ~(mask + low)
+        yield run
+        mask ^= run
+
+
+def longest_streak(good, bad, days):
+    """Most good days in a run of ``days`` days without a bad day"""
+    clear = ((1 << days) - 1) & ~bad
+    return max(((good & run).bit_count() for run in _runs(clear)), default=0)
+
+
+def current_streak(good, bad, last_day):
+    """Good days in the run without a bad day that reaches day index ``last_day``"""
+    clear = ((1 << (last_day + 1)) - 1) & ~bad
+    if not clear >> last_day & 1:
+        return 0
+    for run in _runs(clear):
+        if run >> last_day & 1:
+            return (good & run).bit_count()
+    return 0
+
+
+def build_heatmap(rows, year, today=None):
+    """
+    Heatmap payload of ``year`` from the calendar rows of that year and,
+    for the current streak to carry over New Year, the year before.
+    """
+    today = today or timezone.localdate()
+    days = 366 if calendar.isleap(year) else 365
+    this_year = [row for row in rows if row.year == year]
+    good, bad = day_bits(this_year, year)
+
+    if year < today.year:
+        last_day = days - 1
+    elif year == today.year:
+        last_day = today.timetuple().tm_yday - 1
+    else:
+        last_day = -1
+
+    current = 0
+    if last_day >= 0:
+        # Prepend the previous year so a streak running since December counts
+        previous_days = 366 if calendar.isleap(year - 1) else 365
+        previous_good, previous_bad = day_bits([row for row in rows if row.year == year - 1], year - 1)
+        current = current_streak(
+            previous_good | good << previous_days,
+            previous_bad | bad << previous_days,
+            previous_days + last_day,
+        )
+
+    counts = merge_counts(this_year, year)
+    return {
+        'year': year,
+        'start_date': date(year, 1, 1),
+        'end_date': date(year, 1, 1) + timedelta(days=days - 1),
+        **counts,
+        'good_days': good.bit_count(),
+        'bad_days': bad.bit_count(),
+        'current_streak': current,
+        'longest_streak': longest_streak(good, bad, days),
+    }
@@ -0,0 +1,176 @@
+"""
+Periodic adherence maintenance, run from management commands.
+
+Jobs work in chunks, each committed in its own transaction, so they can run
+against a live database and be interrupted and restarted safely.
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from dosealert import metrics, versions
+from reminders.models import Reminder
+from webhooks import outbox
+
+from .calendars import apply_changes
+from .models import AdherenceRecord, AdherenceStreak
+
+User = get_user_model()
+
+# Users whose streaks one UPDATE selects: each adds a term to its WHERE
+# clause, and SQLite rejects expressions nested 1000 deep
+USERS_PER_UPDATE = 500
+
+
+def apply_missed_streaks(counts, now=None):
+    """
+    Add ``n`` missed doses to the streak of each ``(user_id, medication_id)``
+    in ``counts`` with one UPDATE per distinct ``n`` (and per
+    ``USERS_PER_UPDATE`` users).
+
+    Equivalent to calling ``AdherenceStreak.update_streak('missed')`` ``n``
+    times: every UPDATE expression reads the row's previous values, so the
+    longest missed streak becomes ``max(longest, current + n)``.
+    """
+    if not counts:
+        return
+    now = now or timezone.now()
+    AdherenceStreak.objects.bulk_create(
+        [AdherenceStreak(user_id=user_id, medication_id=medication_id) for user_id, medication_id in counts],
+        ignore_conflicts=True,
+    )
+
+    by_count = defaultdict(lambda: defaultdict(list))
+    for (user_id, medication_id), n in counts.items():
+        by_count[n][user_id].append(medication_id)
+    for n, medications in by_count.items():
+        users = list(medications)
+        for i in range(0, len(users), USERS_PER_UPDATE):
+            query = Q()
+            for user_id in users[i:i + USERS_PER_UPDATE]:
+                query |= Q(user_id=user_id, medication_id__in=medications[user_id])
+            AdherenceStreak.objects.filter(query).update(
+                current_missed_streak=F('current_missed_streak') + n,
+                current_taken_streak=0,
+                longest_missed_streak=Greatest('longest_missed_streak', F('current_missed_streak') + n),
+                total_missed=F('total_missed') + n,
+                total_scheduled=F('total_scheduled') + n,
+                last_updated=now,
+            )
+
+
+# One statement per chunk on PostgreSQL: lock, flip and report the swept rows
+SWEEP_SQL = """
+    UPDATE {table} SET status = 'missed', updated_at = %s
+    WHERE status = 'pending' AND id IN (
+        SELECT id FROM {table}
+        WHERE status = 'pending' AND scheduled_time < %s
+        ORDER BY scheduled_time, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, user_id, medication_id, reminder_id, scheduled_time
+"""
+
+
+def _sweep_chunk(cutoff, chunk_size, now):
+    if connection.vendor == 'postgresql':
+        sql = SWEEP_SQL.format(table=connection.ops.quote_name(AdherenceRecord._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [now, cutoff, chunk_size])
+            return cursor.fetchall()
+
+    rows = list(
+        AdherenceRecord.objects.filter(status='pending', scheduled_time__lt=cutoff)
+        .select_for_update(skip_locked=True)
+        .order_by('scheduled_time', 'id')
+        .values_list('id', 'user_id', 'medication_id', 'reminder_id', 'scheduled_time')[:chunk_size]
+    )
+    AdherenceRecord.objects.filter(id__in=[row[0] for row in rows]).update(status='missed', updated_at=now)
+    return rows
+
+
+def sweep_missed_doses(cutoff, chunk_size=5000, progress=None):
+    """
+    Mark pending records scheduled before ``cutoff`` as missed.
+
+    Each chunk locks its rows (skipping rows another sweeper holds), flips
+    them with a single UPDATE, applies the streak and calendar deltas per
+    (user, medication) and writes an ``adherence.missed`` webhook event per
+    record. Returns the number of records swept.
+    """
+    swept = 0
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            rows = _sweep_chunk(cutoff, chunk_size, now)
+            if not rows:
+                return swept
+            apply_missed_streaks(Counter((user_id, medication_id) for _, user_id, medication_id, _, _ in rows), now)
+            apply_changes(
+                (user_id, medication_id, scheduled_time, 'missed', 1)
+                for _, user_id, medication_id, _, scheduled_time in rows
+            )
+            outbox.add([outbox.missed_event(*row) for row in rows])
+            versions.bump({user_id for _, user_id, _, _, _ in rows}, 'adherence_records')
+        lag = metrics.JOB_LAG.labels('sweep_missed_doses')
+        for *_, scheduled_time in rows:
+            lag.observe((cutoff - scheduled_time).total_seconds())
+        swept += len(rows)
+        if progress:
+            progress(swept)
+
+
+def create_pending_records(now=None, since=None, user_chunk=500, batch_size=5000, progress=None):
+    """
+    Create the pending ``AdherenceRecord`` of every reminder that has come
+    due (``scheduled_at <= now``, and ``>= since`` when given) and has none.
+
+    Users are walked in keyset-paginated id ranges, one transaction per
+    range. Rows are inserted with ``ignore_conflicts`` (``ON CONFLICT DO
+    NOTHING``), so a record the user created concurrently through
+    ``record_adherence`` or a sync wins. Returns the number of rows sent to
+    the database, which counts conflicting rows as well.
+    """
+    now = now or timezone.now()
+    due = Reminder.objects.filter(scheduled_at__lte=now, adherence_record__isnull=True)
+    if since is not None:
+        due = due.filter(scheduled_at__gte=since)
+
+    submitted = 0
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(id__gt=last_user_id).order_by('id').values_list('id', flat=True)[:user_chunk]
+        )
+        if not user_ids:
+            return submitted
+        first_user_id, last_user_id = user_ids[0], user_ids[-1]
+
+        with transaction.atomic():
+            records = [
+                AdherenceRecord(
+                    user_id=user_id,
+                    # Reminders created before the direct link fall back to the schedule's medication
+                    medication_id=medication_id or schedule_medication_id,
+                    reminder_id=reminder_id,
+                    scheduled_time=scheduled_at,
+                    status='pending',
+                )
+                for reminder_id, user_id, medication_id, schedule_medication_id, scheduled_at in due.filter(
+                    schedule__user_id__gte=first_user_id,
+                    schedule__user_id__lte=last_user_id,
+                ).values_list('id', 'schedule__user_id', 'medication_id', 'schedule__medication_id', 'scheduled_at')
+            ]
+            AdherenceRecord.objects.bulk_create(records, batch_size=batch_size, ignore_conflicts=True)
+            versions.bump({record.user_id for record in records}, 'adherence_records')
+        lag = metrics.JOB_LAG.labels('create_pending_records')
+        for record in records:
+            lag.observe((now - record.scheduled_time).total_seconds())
+        submitted += len(records)
+        if progress:
+            progress(last_user_id, submitted)
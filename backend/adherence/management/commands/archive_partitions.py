@@ -0,0 +1,74 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from dosealert.partitioning import (
+    REMINDERS, add_months, archive_partition, archive_records, detach_partition,
+    is_partitioned, is_supported, list_partitions, month_start,
+)
+
+
+class Command(BaseCommand):
+    help = 'Archive monthly partitions older than N months to compressed NDJSON and detach them (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=settings.ARCHIVE_AFTER_MONTHS,
+            help='Archive months that ended more than this many months ago',
+        )
+        parser.add_argument(
+            '--output-dir',
+            default=settings.ARCHIVE_DIR,
+            help='Directory for the <partition>.ndjson.gz files',
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop each partition once it is archived and detached, instead of keeping it as a standalone table',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show which partitions would be archived without making changes',
+        )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING('Partitioning is only available on PostgreSQL; nothing to do.'))
+            return
+
+        cutoff = add_months(month_start(timezone.now().date()), -options['older_than'])
+        os.makedirs(options['output_dir'], exist_ok=True)
+        archived = 0
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor, REMINDERS.table):
+                self.stdout.write(self.style.WARNING(f'{REMINDERS.table} is not partitioned; run migrate first.'))
+                return
+            old = [(name, month) for name, month in list_partitions(cursor, REMINDERS.table) if month < cutoff]
+
+        for name, month in old:
+            if options['dry_run']:
+                self.stdout.write(f'  - DRY RUN: would archive {name} and the adherence records of its reminders')
+                continue
+            # The archives are complete on disk before the rows leave the tables. Records go
+            # first, so no record outlives its reminder in the database.
+            with transaction.atomic(), connection.cursor() as cursor:
+                records_path, records = archive_records(cursor, name, options['output_dir'])
+                path, rows = archive_partition(cursor, REMINDERS, name, options['output_dir'])
+                detach_partition(cursor, REMINDERS, name, drop=options['drop'])
+            archived += 1
+            action = 'dropped' if options['drop'] else 'detached'
+            self.stdout.write(f'  - {name}: {rows} rows written to {path}, {action}')
+            self.stdout.write(f'    {records} adherence records written to {records_path} and deleted')
+
+        if options['dry_run']:
+            return
+        if archived == 0:
+            self.stdout.write(self.style.SUCCESS(f'No partitions older than {cutoff:%Y-%m}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} partitions older than {cutoff:%Y-%m}.'))
@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from adherence.jobs import create_pending_records
+
+
+class Command(BaseCommand):
+    help = 'Create pending adherence records for reminders that have come due'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lookback-days',
+            type=int,
+            default=7,
+            help='Only consider reminders due within this many days (0 for all history)',
+        )
+        parser.add_argument(
+            '--user-chunk',
+            type=int,
+            default=500,
+            help='Users processed per transaction',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per INSERT statement',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Show progress after each user chunk',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(days=options['lookback_days']) if options['lookback_days'] else None
+
+        def progress(last_user_id, submitted):
+            if options['verbose']:
+                self.stdout.write(f'  users up to id {last_user_id}: {submitted} records')
+
+        started = time.monotonic()
+        submitted = create_pending_records(
+            now=now,
+            since=since,
+            user_chunk=options['user_chunk'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        if submitted == 0:
+            self.stdout.write(self.style.SUCCESS('No due reminders without an adherence record.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {submitted} pending adherence records in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dosealert.partitioning import PARTITIONED_TABLES, ensure_partitions, is_partitioned, is_supported
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly partitions of reminders ahead of time (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.PARTITION_MONTHS_AHEAD,
+            help='Months after the current one that must have a partition',
+        )
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING('Partitioning is only available on PostgreSQL; nothing to do.'))
+            return
+
+        for spec in PARTITIONED_TABLES:
+            with connection.cursor() as cursor:
+                if not is_partitioned(cursor, spec.table):
+                    self.stdout.write(self.style.WARNING(f'{spec.table} is not partitioned; run migrate first.'))
+                    continue
+            created = ensure_partitions(spec, options['months_ahead'])
+            for name in created:
+                self.stdout.write(f'  - created {name}')
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {connection.ops.quote_name(spec.table + "_default")}')
+                stray = cursor.fetchone()[0]
+            if stray:
+                self.stdout.write(self.style.WARNING(
+                    f'{spec.table}: {stray} rows are outside every monthly partition (in {spec.table}_default).'
+                ))
+            self.stdout.write(self.style.SUCCESS(f'{spec.table}: {len(created)} partitions created.'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from adherence.calendars import rebuild_calendars
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-day adherence calendars from the adherence records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-chunk',
+            type=int,
+            default=500,
+            help='Users processed per transaction',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Show progress after each user chunk',
+        )
+
+    def handle(self, *args, **options):
+        def progress(last_user_id, written):
+            if options['verbose']:
+                self.stdout.write(f'  users up to id {last_user_id}: {written} calendars')
+
+        started = time.monotonic()
+        written = rebuild_calendars(user_chunk=options['user_chunk'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} adherence calendars in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from adherence.jobs import sweep_missed_doses
+from adherence.models import AdherenceRecord
+
+
+class Command(BaseCommand):
+    help = 'Mark pending adherence records past the grace window as missed and update streaks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=settings.MISSED_DOSE_GRACE_HOURS,
+            help='Hours after the scheduled time before a pending dose counts as missed',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Records updated per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many records would be marked missed without making changes',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        if options['dry_run']:
+            count = AdherenceRecord.objects.filter(status='pending', scheduled_time__lt=cutoff).count()
+            self.stdout.write(
+                self.style.WARNING(f'DRY RUN: Would mark {count} pending records scheduled before {cutoff} as missed.')
+            )
+            return
+
+        started = time.monotonic()
+        swept = sweep_missed_doses(
+            cutoff,
+            chunk_size=options['chunk_size'],
+            progress=lambda n: self.stdout.write(f'  {n} records marked missed...'),
+        )
+        if swept == 0:
+            self.stdout.write(self.style.SUCCESS('No stale pending records found.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {swept} pending records as missed in {time.monotonic() - started:.1f}s.'
+        ))
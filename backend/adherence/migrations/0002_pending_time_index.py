@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adherence', '0001_initial'),
+        ('meds', '0003_rename_userid_medication_user_and_more'),
+        ('reminders', '0002_reminder_medication_alter_reminder_scheduled_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adherencerecord',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['scheduled_time'], name='adherence_pending_time_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
@@ -51,15 +51,60 @@ class AdherenceRecord(models.Model):
     class Meta:
         ordering = ['-scheduled_time']
         unique_together = ['user', 'reminder']
+        indexes = [
+            # Pending records awaiting a response, see adherence.jobs
+            models.Index(
+                fields=['scheduled_time'],
+                condition=models.Q(status='pending'),
+                name='adherence_pending_time_idx',
+            ),
+        ]
+    
+    CALENDAR_FIELDS = ('user_id', 'medication_id', 'scheduled_time', 'status')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the row counts in the calendars, so save() and the post_delete
+        # receiver (adherence.signals) know it without another query. None
+        # when a calendar field was deferred.
+        instance._counted = instance._calendar_entry()
+        return instance
+    
+    def _calendar_entry(self):
+        """What this record adds to the adherence calendar, None if it is not loaded"""
+        loaded = self.__dict__
+        if not all(f in loaded for f in self.CALENDAR_FIELDS):
+            return None
+        return (self.user_id, self.medication_id, self.scheduled_time, self.status)
     
     def save(self, *args, **kwargs):
+        from .calendars import apply_changes
+        
+        previous = getattr(self, '_counted', None)
+        if previous is None and hasattr(self, '_counted') and not self._state.adding and not any(
+            f in self.__dict__ for f in (*self.CALENDAR_FIELDS, 'actual_time')
+        ):
+            # Loaded with the calendar fields deferred and none of them set
+            # since, so neither the calendars nor the lateness can change
+            return super().save(*args, **kwargs)
+        
         # Calculate lateness if taken
         if self.status == 'taken' and self.actual_time:
             time_diff = self.actual_time - self.scheduled_time
             self.minutes_late = int(time_diff.total_seconds() / 60)
             self.is_late = self.minutes_late > 30
         
-        super().save(*args, **kwargs)
+        if previous is None and not self._state.adding:
+            # Built by hand for an existing row, or deferred fields were set
+            previous = AdherenceRecord.objects.filter(pk=self.pk).values_list(*self.CALENDAR_FIELDS).first()
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = tuple(getattr(self, f) for f in self.CALENDAR_FIELDS)
+            if current != previous:
+                apply_changes([*([(*previous, -1)] if previous else []), (*current, 1)])
+        self._counted = current
     
     def __str__(self):
         return f"{self.medication.name} - {self.scheduled_time.date()} ({self.status})"
@@ -118,4 +163,28 @@ class AdherenceStreak(models.Model):
         self.save()
     
     def __str__(self):
-        return f"{self.medication.name} - {self.adherence_percentage}% adherence"
\ No newline at end of file
+        return f"{self.medication.name} - {self.adherence_percentage}% adherence"
+
+
+class AdherenceCalendar(models.Model):
+    """
+    Taken/missed/skipped dose counts per day of one year for a medication,
+    one byte per day (index 0 is January 1st). Maintained on every
+    adherence write, see adherence.calendars.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="adherence_calendars")
+    medication = models.ForeignKey('meds.Medication', on_delete=models.CASCADE, related_name="adherence_calendars")
+    year = models.PositiveSmallIntegerField()
+    
+    taken = models.BinaryField(default=bytes(366))
+    missed = models.BinaryField(default=bytes(366))
+    skipped = models.BinaryField(default=bytes(366))
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'medication', 'year']
+    
+    def __str__(self):
+        return f"{self.medication.name} - {self.year}"
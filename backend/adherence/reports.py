@@ -0,0 +1,394 @@
+"""
+Builders for the adherence summary, report and dashboard payloads.
+
+The loaders fetch every row a payload needs in a handful of queries and the
+``build_*`` functions turn those rows into the response in plain Python, so
+the sync (WSGI) and async (ASGI) views share one implementation and return
+identical payloads.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from schedules.expansion import count_occurrences
+from schedules.models import Schedule
+
+from .models import AdherenceRecord, AdherenceStreak
+from .serializers import (
+    AdherenceRecordSerializer,
+    AdherenceStreakSerializer,
+    AdherenceSummarySerializer,
+)
+
+DEFAULT_REPORT_DAYS = 30
+
+
+def parse_days_back(value, default=DEFAULT_REPORT_DAYS):
+    """Parse the ``days`` query parameter, falling back to the default"""
+    try:
+        days_back = int(value)
+    except (ValueError, TypeError):
+        return default
+    return days_back if days_back > 0 else default
+
+
+def _rate(part, whole):
+    return round((part / whole * 100) if whole > 0 else 0, 2)
+
+
+# ---------------------------------------------------------------------------
+# Summary
+# ---------------------------------------------------------------------------
+
+def _streaks_queryset(user):
+    return AdherenceStreak.objects.filter(user=user).select_related('medication')
+
+
+def _recent_records_queryset(user, now):
+    return AdherenceRecord.objects.filter(
+        user=user,
+        scheduled_time__gte=now - timedelta(days=7)
+    ).select_related('medication', 'reminder')[:20]
+
+
+def _pending_counts(now):
+    """Pending and overdue counts as a single aggregate query"""
+    return {
+        'pending': Count('id', filter=Q(status='pending')),
+        'overdue': Count('id', filter=Q(status='pending', scheduled_time__lt=now - timedelta(hours=1))),
+    }
+
+
+def build_summary(streaks, counts, recent_records):
+    """Compose the ``adherence_summary`` payload from preloaded rows"""
+    total_taken = sum(streak.total_taken for streak in streaks)
+    total_scheduled = sum(streak.total_scheduled for streak in streaks)
+    overall_adherence = (total_taken / total_scheduled * 100) if total_scheduled > 0 else 0
+
+    summary_data = {
+        'total_medications': len(streaks),
+        'pending_responses': counts['pending'],
+        'overdue_responses': counts['overdue'],
+        'overall_adherence_percentage': round(overall_adherence, 2),
+        'recent_records': recent_records,
+        'streaks': streaks
+    }
+    return AdherenceSummarySerializer(summary_data).data
+
+
+def get_summary(user):
+    now = timezone.now()
+    counts = AdherenceRecord.objects.filter(user=user).aggregate(**_pending_counts(now))
+    return build_summary(
+        list(_streaks_queryset(user)),
+        counts,
+        list(_recent_records_queryset(user, now)),
+    )
+
+
+async def aget_summary(user):
+    now = timezone.now()
+    counts = await AdherenceRecord.objects.filter(user=user).aaggregate(**_pending_counts(now))
+    return build_summary(
+        [streak async for streak in _streaks_queryset(user)],
+        counts,
+        [record async for record in _recent_records_queryset(user, now)],
+    )
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _report_records_queryset(user, start_date, end_date):
+    return AdherenceRecord.objects.filter(
+        user=user,
+        scheduled_time__gte=start_date,
+        scheduled_time__lte=end_date
+    ).select_related('medication', 'reminder')
+
+
+def _report_schedules_queryset(user, now):
+    # Schedules that produced doses in the window: active ones, and those
+    # switched off because their medication ended (expansion stops at the end date)
+    return Schedule.objects.filter(
+        Q(active=True) | Q(medication__end_date__lt=timezone.localdate(now)),
+        user=user,
+    ).select_related('medication')
+
+
+def build_report(records, streaks, schedules, days_back, now):
+    """
+    Compose the ``adherence_report`` payload.
+
+    ``records`` are the user's adherence records inside the report window
+    (newest first), ``streaks`` the user's ``AdherenceStreak`` rows and
+    ``schedules`` the schedules whose expansion gives the expected doses.
+    Every statistic is derived from these three lists, so the report costs
+    three queries no matter how many medications or days it covers.
+    """
+    start_date = now - timedelta(days=days_back)
+    end_date = now
+    streaks_by_medication = {streak.medication_id: streak for streak in streaks}
+    expected = count_occurrences(schedules, start_date, end_date)
+    expected_total = sum(expected.values())
+
+    # Overall statistics
+    status_counts = Counter(record.status for record in records)
+    total_records = len(records)
+    taken_count = status_counts['taken']
+    missed_count = status_counts['missed']
+    skipped_count = status_counts['skipped']
+    pending_count = status_counts['pending']
+
+    # Calculate adherence rate (excluding pending)
+    completed_records = total_records - pending_count
+
+    daily_data = defaultdict(lambda: {'taken': 0, 'missed': 0, 'skipped': 0, 'pending': 0})
+    medication_data = {}
+    time_adherence = defaultdict(lambda: {'taken': 0, 'missed': 0, 'total': 0})
+
+    for record in records:
+        daily_data[record.scheduled_time.date().isoformat()][record.status] += 1
+
+        med = medication_data.setdefault(record.medication_id, {
+            'name': record.medication.name,
+            'counts': Counter(),
+        })
+        med['counts'][record.status] += 1
+
+        if record.status != 'pending':
+            hour = record.scheduled_time.hour
+            time_adherence[hour]['total'] += 1
+            if record.status == 'taken':
+                time_adherence[hour]['taken'] += 1
+            else:
+                time_adherence[hour]['missed'] += 1
+
+    # Daily adherence data for charts, sorted by date
+    daily_adherence = []
+    current_date = start_date.date()
+    while current_date <= end_date.date():
+        day_key = current_date.isoformat()
+        day_data = daily_data[day_key]
+        daily_total = sum(day_data.values())
+
+        daily_adherence.append({
+            'date': day_key,
+            'taken': day_data['taken'],
+            'missed': day_data['missed'],
+            'skipped': day_data['skipped'],
+            'pending': day_data['pending'],
+            'total': daily_total,
+            'adherence_rate': _rate(day_data['taken'], daily_total)
+        })
+        current_date += timedelta(days=1)
+
+    # Medication-specific adherence
+    medication_adherence = []
+    for medication_id, med in medication_data.items():
+        counts = med['counts']
+        med_total = sum(counts.values())
+        streak = streaks_by_medication.get(medication_id)
+
+        medication_adherence.append({
+            'medication_id': medication_id,
+            'medication_name': med['name'],
+            'total_doses': med_total,
+            'taken': counts['taken'],
+            'missed': counts['missed'],
+            'skipped': counts['skipped'],
+            'pending': counts['pending'],
+            'expected_doses': expected[medication_id],
+            'adherence_rate': _rate(counts['taken'], med_total - counts['pending']),
+            'expected_adherence_rate': _rate(counts['taken'], expected[medication_id]),
+            'current_taken_streak': streak.current_taken_streak if streak else 0,
+            'current_missed_streak': streak.current_missed_streak if streak else 0,
+            'longest_taken_streak': streak.longest_taken_streak if streak else 0,
+            'longest_missed_streak': streak.longest_missed_streak if streak else 0
+        })
+
+    # Time of day analysis
+    time_of_day_data = []
+    for hour in range(24):
+        data = time_adherence[hour]
+        time_of_day_data.append({
+            'hour': hour,
+            'taken': data['taken'],
+            'missed': data['missed'],
+            'total': data['total'],
+            'adherence_rate': _rate(data['taken'], data['total'])
+        })
+
+    # Recent missed doses (last 7 days for immediate attention)
+    recent_missed = sorted(
+        (r for r in records
+         if r.status in ('missed', 'skipped') and r.scheduled_time >= now - timedelta(days=7)),
+        key=lambda r: r.scheduled_time,
+        reverse=True
+    )[:10]
+
+    # Pending responses that need attention
+    pending_responses = sorted(
+        (r for r in records if r.status == 'pending' and r.scheduled_time < now),
+        key=lambda r: r.scheduled_time
+    )[:10]
+
+    # Overdue responses (more than 2 hours late)
+    overdue_responses = sum(
+        1 for r in records
+        if r.status == 'pending' and r.scheduled_time < now - timedelta(hours=2)
+    )
+
+    # Weekly trend (last 4 weeks)
+    weekly_data = []
+    for week in range(4):
+        week_start = now - timedelta(weeks=week + 1)
+        week_end = now - timedelta(weeks=week)
+        week_statuses = [r.status for r in records if week_start <= r.scheduled_time < week_end]
+        week_total = len(week_statuses)
+        week_taken = week_statuses.count('taken')
+
+        weekly_data.append({
+            'week_number': week + 1,
+            'week_start': week_start.date().isoformat(),
+            'week_end': week_end.date().isoformat(),
+            'total_doses': week_total,
+            'taken': week_taken,
+            'adherence_rate': _rate(week_taken, week_total)
+        })
+
+    return {
+        'report_period': {
+            'start_date': start_date.date().isoformat(),
+            'end_date': end_date.date().isoformat(),
+            'days_covered': days_back
+        },
+        'overall_statistics': {
+            'total_scheduled_doses': total_records,
+            'doses_taken': taken_count,
+            'doses_missed': missed_count,
+            'doses_skipped': skipped_count,
+            'pending_responses': pending_count,
+            'overdue_responses': overdue_responses,
+            'overall_adherence_rate': _rate(taken_count, completed_records),
+            'completion_rate': _rate(completed_records, total_records),
+            'expected_doses': expected_total,
+            'expected_adherence_rate': _rate(taken_count, expected_total)
+        },
+        'daily_adherence': daily_adherence,
+        'medication_breakdown': medication_adherence,
+        'time_of_day_analysis': time_of_day_data,
+        'weekly_trends': weekly_data,
+        'recent_missed_doses': AdherenceRecordSerializer(recent_missed, many=True).data,
+        'pending_responses': AdherenceRecordSerializer(pending_responses, many=True).data,
+        'insights': {
+            'best_adherence_medication': max(medication_adherence, key=lambda x: x['adherence_rate'])['medication_name'] if medication_adherence else None,
+            'worst_adherence_medication': min(medication_adherence, key=lambda x: x['adherence_rate'])['medication_name'] if medication_adherence else None,
+            'best_time_of_day': max(time_of_day_data, key=lambda x: x['adherence_rate'])['hour'] if any(t['total'] > 0 for t in time_of_day_data) else None,
+            'improvement_trend': 'improving' if len(weekly_data) >= 2 and weekly_data[0]['adherence_rate'] > weekly_data[1]['adherence_rate'] else 'declining' if len(weekly_data) >= 2 else 'stable'
+        }
+    }
+
+
+def get_report(user, days_back):
+    now = timezone.now()
+    records = list(_report_records_queryset(user, now - timedelta(days=days_back), now))
+    streaks = list(AdherenceStreak.objects.filter(user=user))
+    schedules = list(_report_schedules_queryset(user, now))
+    return build_report(records, streaks, schedules, days_back, now)
+
+
+async def aget_report(user, days_back):
+    now = timezone.now()
+    records = [r async for r in _report_records_queryset(user, now - timedelta(days=days_back), now)]
+    streaks = [s async for s in AdherenceStreak.objects.filter(user=user)]
+    schedules = [s async for s in _report_schedules_queryset(user, now)]
+    return build_report(records, streaks, schedules, days_back, now)
+
+
+# ---------------------------------------------------------------------------
+# Dashboard
+# ---------------------------------------------------------------------------
+
+DASHBOARD_SECTIONS = ('summary', 'report', 'analytics', 'streaks')
+
+
+def parse_sections(value):
+    """
+    Parse the comma-separated ``sections`` query parameter.
+
+    Missing or empty means every section. Raises ``ValueError`` naming the
+    unknown sections otherwise.
+    """
+    if not value:
+        return list(DASHBOARD_SECTIONS)
+    sections = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown dashboard sections: {', '.join(unknown)}")
+    return [s for s in DASHBOARD_SECTIONS if s in sections]
+
+
+def _dashboard_plan(user, sections, days_back, now):
+    """
+    Map each dataset the requested sections need to how it is fetched.
+
+    Every dataset is loaded once and shared: the streak rows feed the
+    summary, report and streak list. The summary's recent records are
+    fetched like /summary/ does, since the report window ends now and
+    leaves out upcoming records.
+    """
+    from analytics.api import REMINDER_COUNTS
+    from reminders.models import Reminder
+
+    plan = {}
+    if {'summary', 'report', 'streaks'} & set(sections):
+        plan['streaks'] = ('rows', _streaks_queryset(user))
+    if 'report' in sections:
+        plan['records'] = ('rows', _report_records_queryset(user, now - timedelta(days=days_back), now))
+    if 'report' in sections:
+        plan['schedules'] = ('rows', _report_schedules_queryset(user, now))
+    if 'summary' in sections:
+        plan['pending_counts'] = ('aggregate', AdherenceRecord.objects.filter(user=user), _pending_counts(now))
+        plan['recent_records'] = ('rows', _recent_records_queryset(user, now))
+    if 'analytics' in sections:
+        plan['reminder_counts'] = ('aggregate', Reminder.objects.filter(schedule__user=user), REMINDER_COUNTS)
+    return plan
+
+
+def build_dashboard(data, sections, days_back, now):
+    """Compose the dashboard payload from the datasets fetched for its plan"""
+    payload = {}
+    streaks = data.get('streaks', [])
+
+    if 'summary' in sections:
+        payload['summary'] = build_summary(streaks, data['pending_counts'], data['recent_records'])
+    if 'report' in sections:
+        payload['report'] = build_report(data['records'], streaks, data['schedules'], days_back, now)
+    if 'analytics' in sections:
+        payload['analytics'] = data['reminder_counts']
+    if 'streaks' in sections:
+        payload['streaks'] = AdherenceStreakSerializer(streaks, many=True).data
+    return payload
+
+
+def get_dashboard(user, sections, days_back):
+    now = timezone.now()
+    data = {}
+    for name, (kind, queryset, *aggregates) in _dashboard_plan(user, sections, days_back, now).items():
+        data[name] = list(queryset) if kind == 'rows' else queryset.aggregate(**aggregates[0])
+    return build_dashboard(data, sections, days_back, now)
+
+
+async def aget_dashboard(user, sections, days_back):
+    now = timezone.now()
+    data = {}
+    for name, (kind, queryset, *aggregates) in _dashboard_plan(user, sections, days_back, now).items():
+        if kind == 'rows':
+            data[name] = [row async for row in queryset]
+        else:
+            data[name] = await queryset.aaggregate(**aggregates[0])
+    return build_dashboard(data, sections, days_back, now)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from dosealert.fastlists import ValuesSerializer
 from .models import AdherenceRecord, AdherenceStreak
 
 class AdherenceRecordSerializer(serializers.ModelSerializer):
@@ -14,6 +15,9 @@ class AdherenceRecordSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ('user', 'is_late', 'minutes_late', 'created_at', 'updated_at')
 
+class AdherenceRecordValuesSerializer(ValuesSerializer):
+    serializer_class = AdherenceRecordSerializer
+
 class AdherenceResponseSerializer(serializers.Serializer):
     """Serializer for user responses about medication adherence"""
     reminder_id = serializers.IntegerField()
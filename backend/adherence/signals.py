@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .calendars import apply_changes
+from .models import AdherenceRecord
+
+
+@receiver(post_delete, sender=AdherenceRecord)
+def uncount_deleted_record(sender, instance, **kwargs):
+    # Also fired for records deleted by the cascade from a reminder, schedule
+    # or medication, which never call AdherenceRecord.delete()
+    counted = getattr(instance, '_counted', None) or instance._calendar_entry()
+    if counted:
+        apply_changes([(*counted, -1)])
+    instance._counted = None
@@ -1,3 +1,259 @@
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from meds.models import Medication
+from reminders.models import Reminder
+from schedules.models import Schedule
+
+from . import jobs
+from .calendars import rebuild_calendars
+from .jobs import apply_missed_streaks, sweep_missed_doses
+from .models import AdherenceCalendar, AdherenceRecord, AdherenceStreak
+
+User = get_user_model()
+
+
+class AdherenceTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='correct-horse-9')
+        self.medication = self.make_medication(self.user)
+        self.schedule = self.make_schedule(self.medication)
+
+    def make_medication(self, user, name='Aspirin'):
+        return Medication.objects.create(user=user, name=name)
+
+    def make_schedule(self, medication):
+        return Schedule.objects.create(user=medication.user, medication=medication, time_of_day=time(8))
+
+    def make_record(self, scheduled_time, status='pending', schedule=None):
+        schedule = schedule or self.schedule
+        reminder = Reminder.objects.create(
+            schedule=schedule, medication=schedule.medication, scheduled_at=scheduled_time,
+        )
+        return AdherenceRecord.objects.create(
+            user=schedule.user,
+            medication=schedule.medication,
+            reminder=reminder,
+            scheduled_time=scheduled_time,
+            status=status,
+        )
+
+
+class SweepMissedDosesTests(AdherenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cutoff = timezone.now() - timedelta(hours=12)
+
+    def test_marks_stale_pending_records_missed(self):
+        stale = [self.make_record(self.cutoff - timedelta(hours=h)) for h in (1, 25, 49)]
+        recent = self.make_record(self.cutoff + timedelta(hours=1))
+        taken = self.make_record(self.cutoff - timedelta(hours=2), status='taken')
+
+        self.assertEqual(sweep_missed_doses(self.cutoff), 3)
+
+        statuses = dict(AdherenceRecord.objects.values_list('id', 'status'))
+        self.assertEqual({statuses[record.id] for record in stale}, {'missed'})
+        self.assertEqual(statuses[recent.id], 'pending')
+        self.assertEqual(statuses[taken.id], 'taken')
+
+        streak = AdherenceStreak.objects.get(user=self.user, medication=self.medication)
+        self.assertEqual(streak.total_missed, 3)
+        self.assertEqual(streak.total_scheduled, 3)
+        self.assertEqual(streak.current_missed_streak, 3)
+        self.assertEqual(streak.longest_missed_streak, 3)
+
+    def test_second_sweep_finds_nothing(self):
+        self.make_record(self.cutoff - timedelta(hours=1))
+        self.assertEqual(sweep_missed_doses(self.cutoff), 1)
+        self.assertEqual(sweep_missed_doses(self.cutoff), 0)
+        streak = AdherenceStreak.objects.get(user=self.user, medication=self.medication)
+        self.assertEqual(streak.total_missed, 1)
+
+    def test_sweeps_in_chunks(self):
+        for h in range(5):
+            self.make_record(self.cutoff - timedelta(hours=h + 1))
+        progress = []
+
+        self.assertEqual(sweep_missed_doses(self.cutoff, chunk_size=2, progress=progress.append), 5)
+
+        self.assertEqual(progress, [2, 4, 5])
+        streak = AdherenceStreak.objects.get(user=self.user, medication=self.medication)
+        self.assertEqual(streak.total_missed, 5)
+
+    def test_counts_swept_doses_in_the_calendar(self):
+        scheduled_time = datetime(2024, 3, 1, 8, tzinfo=dt_timezone.utc)
+        self.make_record(scheduled_time)
+        self.make_record(scheduled_time + timedelta(hours=4))
+
+        sweep_missed_doses(self.cutoff)
+
+        row = AdherenceCalendar.objects.get(user=self.user, medication=self.medication, year=2024)
+        day = scheduled_time.timetuple().tm_yday - 1
+        self.assertEqual(row.missed[day], 2)
+        self.assertEqual(sum(row.taken), 0)
+
+
+class ApplyMissedStreaksTests(AdherenceTestCase):
+    def assertStreakEqual(self, streak, expected):
+        fields = [
+            'current_taken_streak', 'current_missed_streak', 'longest_taken_streak',
+            'longest_missed_streak', 'total_taken', 'total_missed', 'total_scheduled',
+        ]
+        streak.refresh_from_db()
+        expected.refresh_from_db()
+        self.assertEqual(
+            {f: getattr(streak, f) for f in fields},
+            {f: getattr(expected, f) for f in fields},
+        )
+
+    def test_matches_update_streak(self):
+        other = self.make_medication(self.user, name='Ibuprofen')
+        streak = AdherenceStreak.objects.create(user=self.user, medication=self.medication)
+        expected = AdherenceStreak.objects.create(user=self.user, medication=other)
+        for status in ('missed', 'missed', 'taken', 'missed'):
+            streak.update_streak(status)
+            expected.update_streak(status)
+
+        apply_missed_streaks({(self.user.id, self.medication.id): 3})
+        for _ in range(3):
+            expected.update_streak('missed')
+
+        self.assertStreakEqual(streak, expected)
+
+    def test_creates_missing_streaks(self):
+        apply_missed_streaks({(self.user.id, self.medication.id): 2})
+
+        streak = AdherenceStreak.objects.get(user=self.user, medication=self.medication)
+        self.assertEqual(streak.total_missed, 2)
+        self.assertEqual(streak.longest_missed_streak, 2)
+
+    def test_updates_only_the_given_pairs(self):
+        bob = User.objects.create_user(username='bob', password='correct-horse-9')
+        other = self.make_medication(self.user, name='Ibuprofen')
+        for user in (self.user, bob):
+            for medication in (self.medication, other):
+                AdherenceStreak.objects.create(user=user, medication=medication)
+
+        apply_missed_streaks(Counter({(self.user.id, self.medication.id): 2, (bob.id, other.id): 1}))
+
+        missed = {
+            (user_id, medication_id): total
+            for user_id, medication_id, total in AdherenceStreak.objects.values_list(
+                'user_id', 'medication_id', 'total_missed',
+            )
+        }
+        self.assertEqual(missed, {
+            (self.user.id, self.medication.id): 2,
+            (self.user.id, other.id): 0,
+            (bob.id, self.medication.id): 0,
+            (bob.id, other.id): 1,
+        })
+
+    def test_splits_updates_by_users(self):
+        users = [User.objects.create_user(username=f'user{i}', password='correct-horse-9') for i in range(3)]
+        counts = {(user.id, self.medication.id): 1 for user in users}
+
+        with mock.patch.object(jobs, 'USERS_PER_UPDATE', 2):
+            apply_missed_streaks(counts)
+
+        self.assertEqual(
+            sorted(AdherenceStreak.objects.filter(user__in=users).values_list('total_missed', flat=True)),
+            [1, 1, 1],
+        )
+
+
+class CalendarConsistencyTests(AdherenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduled_time = datetime(2024, 5, 10, 8, tzinfo=dt_timezone.utc)
+        self.day = self.scheduled_time.timetuple().tm_yday - 1
+
+    def calendar(self):
+        return AdherenceCalendar.objects.filter(user=self.user, medication=self.medication, year=2024).first()
+
+    def assertMatchesRebuild(self):
+        """The maintained calendars equal the ones rebuilt from the records"""
+        maintained = {
+            (row.user_id, row.medication_id, row.year): (bytes(row.taken), bytes(row.missed), bytes(row.skipped))
+            for row in AdherenceCalendar.objects.filter(user=self.user)
+        }
+        rebuild_calendars(users=[self.user.id])
+        rebuilt = {
+            (row.user_id, row.medication_id, row.year): (bytes(row.taken), bytes(row.missed), bytes(row.skipped))
+            for row in AdherenceCalendar.objects.filter(user=self.user)
+        }
+        # Rows emptied by deletes are kept; the rebuild leaves them out
+        empty = (bytes(366),) * 3
+        self.assertEqual({k: v for k, v in maintained.items() if v != empty}, rebuilt)
+
+    def test_status_change_moves_the_count(self):
+        record = self.make_record(self.scheduled_time, status='taken')
+        self.assertEqual(self.calendar().taken[self.day], 1)
+
+        record.status = 'missed'
+        record.save()
+
+        row = self.calendar()
+        self.assertEqual(row.taken[self.day], 0)
+        self.assertEqual(row.missed[self.day], 1)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_record(self):
+        record = self.make_record(self.scheduled_time, status='taken')
+        self.make_record(self.scheduled_time + timedelta(hours=4), status='taken')
+
+        record.delete()
+
+        self.assertEqual(self.calendar().taken[self.day], 1)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_queryset_of_records(self):
+        for h in range(3):
+            self.make_record(self.scheduled_time + timedelta(hours=h), status='skipped')
+
+        AdherenceRecord.objects.filter(user=self.user).delete()
+
+        self.assertEqual(self.calendar().skipped[self.day], 0)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_reminder_cascades(self):
+        record = self.make_record(self.scheduled_time, status='taken')
+
+        record.reminder.delete()
+
+        self.assertEqual(self.calendar().taken[self.day], 0)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_schedule_cascades(self):
+        other = self.make_schedule(self.medication)
+        self.make_record(self.scheduled_time, status='taken')
+        self.make_record(self.scheduled_time + timedelta(hours=1), status='missed', schedule=other)
+
+        self.schedule.delete()
+
+        row = self.calendar()
+        self.assertEqual(row.taken[self.day], 0)
+        self.assertEqual(row.missed[self.day], 1)
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_medication_cascades(self):
+        self.make_record(self.scheduled_time, status='taken')
+
+        self.medication.delete()
+
+        self.assertFalse(AdherenceCalendar.objects.filter(user=self.user).exists())
+
+    def test_saving_a_deferred_record_keeps_the_calendar(self):
+        self.make_record(self.scheduled_time, status='taken')
+        record = AdherenceRecord.objects.only('id', 'notes').get()
+
+        record.notes = 'With food'
+        record.save()
 
-# Create your tests here.
+        self.assertEqual(self.calendar().taken[self.day], 1)
+        self.assertMatchesRebuild()
@@ -1,12 +1,27 @@
-
+from django.db.models import Count, Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from dosealert.asyncapi import async_api_view
+from dosealert.replicas import replica_reads
 from reminders.models import Reminder
 
+# Total and sent reminder counts in a single aggregate query
+REMINDER_COUNTS = {
+    'total_reminders': Count('id'),
+    'sent_reminders': Count('id', filter=Q(status="sent")),
+}
+
+@replica_reads
 class AnalyticsView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        total = Reminder.objects.filter(schedule__user=request.user).count()
-        sent = Reminder.objects.filter(schedule__user=request.user, status="sent").count()
-        return Response({"total_reminders": total, "sent_reminders": sent})
+        counts = Reminder.objects.filter(schedule__user=request.user).aggregate(**REMINDER_COUNTS)
+        return Response(counts)
+
+
+@replica_reads
+@async_api_view(['GET'])
+async def analytics_summary_async(request):
+    """Async variant of ``AnalyticsView`` for ASGI deployments"""
+    return await Reminder.objects.filter(schedule__user=request.user).aaggregate(**REMINDER_COUNTS)
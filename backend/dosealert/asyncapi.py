@@ -0,0 +1,107 @@
+"""
+DRF request handling for the native async read views.
+
+DRF views are sync-only, so the async summary, report, dashboard and
+analytics views (``ASYNC_READ_VIEWS``) are plain Django views.
+``async_api_view`` gives them what DRF's ``api_view`` gives the sync
+variants, in the same order:
+
+1. Content negotiation over the JSON and MessagePack renderers of
+   ``DEFAULT_RENDERER_CLASSES``, including ``?format=``. A client that
+   accepts neither gets 406.
+2. JWT authentication (``users.authentication.aauthenticate``): 401 with
+   ``WWW-Authenticate`` when it fails.
+3. ``DEFAULT_THROTTLE_CLASSES``: 429 with ``Retry-After``.
+4. The allowed methods: 405 with ``Allow``.
+
+The view returns the data to render, or ``(data, status)``. Error bodies
+are DRF's ``{"detail": ...}``, except that a rejected token gets the same
+401 as a missing one. The browsable API and ``OPTIONS`` metadata are not
+available.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from users.authentication import aauthenticate
+
+_negotiation = DefaultContentNegotiation()
+
+
+def _renderers():
+    # Read on every request, like the throttle rates, so settings overrides apply
+    return [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.format != 'api']
+
+
+def _response(renderer, media_type, data, status_code, headers=None):
+    response = HttpResponse(
+        renderer.render(data, media_type, {}),
+        status=status_code,
+        content_type=media_type,
+        headers=headers,
+    )
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def _error(renderer, media_type, exc, headers=None):
+    return _response(renderer, media_type, {'detail': exc.detail}, exc.status_code, headers)
+
+
+def _throttled(request):
+    """``Throttled`` if a throttle rejects ``request``, else None"""
+    rejected = False
+    durations = []
+    for throttle in (throttle_class() for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES):
+        if not throttle.allow_request(request, None):
+            rejected = True
+            durations.append(throttle.wait())
+    if not rejected:
+        return None
+    return exceptions.Throttled(max((d for d in durations if d is not None), default=None))
+
+
+def async_api_view(methods):
+    """Serve an async view that returns data like an ``api_view(methods)``, see the module docstring"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            drf_request = Request(request, authenticators=())
+            renderers = _renderers()
+            try:
+                renderer, media_type = _negotiation.select_renderer(drf_request, renderers)
+            except exceptions.NotAcceptable as e:
+                return _error(renderers[0], renderers[0].media_type, e)
+
+            user = await aauthenticate(request)
+            if user is None:
+                return _error(
+                    renderer, media_type, exceptions.NotAuthenticated(),
+                    {'WWW-Authenticate': 'Bearer realm="api"'},
+                )
+            request.user = drf_request.user = user
+
+            if api_settings.DEFAULT_THROTTLE_CLASSES:
+                # Throttles read and write the cache synchronously
+                throttled = await sync_to_async(_throttled)(drf_request)
+                if throttled is not None:
+                    headers = {'Retry-After': '%d' % throttled.wait} if throttled.wait is not None else None
+                    return _error(renderer, media_type, throttled, headers)
+
+            if request.method not in methods:
+                return _error(
+                    renderer, media_type, exceptions.MethodNotAllowed(request.method),
+                    {'Allow': ', '.join(methods)},
+                )
+
+            result = await view(request, *args, **kwargs)
+            data, status_code = result if isinstance(result, tuple) else (result, status.HTTP_200_OK)
+            return _response(renderer, media_type, data, status_code)
+        return wrapper
+    return decorator
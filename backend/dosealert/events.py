@@ -0,0 +1,221 @@
+"""
+Per-user change notifications, pushed over server-sent events.
+
+Instead of polling the list endpoints, a client keeps ``GET /api/events/``
+open. Whenever ``dosealert.versions`` gives some of a user's collections a
+new version (after every committed write, including the sync endpoints and
+the scheduled jobs), the user's streams get a ``changed`` event naming them:
+
+    event: changed
+    data: {"collections": ["reminders", "adherence_records"]}
+
+and the client revalidates those lists with ``If-None-Match``. A
+``resync`` event asks the client to revalidate everything it shows: it is
+the first event of every stream (changes made while the client was not
+connected are not replayed) and replaces events that could not be
+delivered. A comment is sent every ``EVENTS_KEEPALIVE_SECONDS`` so proxies
+keep idle streams open, and a stream ends when its access token expires;
+the client reconnects with a fresh one.
+
+Streams subscribe an ``asyncio.Queue`` in their worker. ``publish`` runs
+in whatever thread committed the write and hands the event to each queue's
+event loop. With ``EVENTS_BACKEND`` "local" only streams in the same
+process are reached; with "redis" events go through a Redis channel per
+user, and every worker with streams relays the channels to its own, so
+writes in any worker or cron command reach streams in all of them.
+
+Streams hold a connection for their whole life, so the endpoint is only
+routed under ASGI (``EVENTS_ENABLED``).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from users.authentication import async_jwt_required
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'dosealert-events:'
+# Events a stream can fall behind by before they are replaced with a resync
+QUEUE_SIZE = 100
+RESYNC = None
+RELAY_MAX_DELAY = 30
+
+
+class _Subscribers:
+    """The queues of the open streams in this process, by user id"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = defaultdict(set)
+
+    def add(self, user_id, loop, queue):
+        with self.lock:
+            self.queues[user_id].add((loop, queue))
+
+    def remove(self, user_id, loop, queue):
+        with self.lock:
+            queues = self.queues[user_id]
+            queues.discard((loop, queue))
+            if not queues:
+                del self.queues[user_id]
+
+    def count(self, user_id):
+        with self.lock:
+            return len(self.queues.get(user_id, ()))
+
+    def deliver(self, user_id, message):
+        with self.lock:
+            targets = list(self.queues.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # The loop of a worker that is shutting down
+                pass
+
+    def resync_all(self):
+        with self.lock:
+            user_ids = list(self.queues)
+        for user_id in user_ids:
+            self.deliver(user_id, RESYNC)
+
+
+_subscribers = _Subscribers()
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # The client is not reading; whatever it missed, it refetches
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC)
+
+
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def publish(user_ids, collections):
+    """
+    Send a ``changed`` event for ``collections`` to the streams of
+    ``user_ids``. Called once the write is committed.
+    """
+    message = list(collections)
+    if settings.EVENTS_BACKEND != 'redis':
+        for user_id in user_ids:
+            _subscribers.deliver(user_id, message)
+        return
+
+    payload = json.dumps(message)
+    try:
+        pipe = _redis_client().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.publish(f'{CHANNEL_PREFIX}{user_id}', payload)
+        pipe.execute()
+    except Exception:
+        logger.error('Could not publish change events for users %s', user_ids, exc_info=True)
+
+
+_relay_task = None
+
+
+async def _relay():
+    """Deliver the events of all workers, received from Redis, to the streams of this one"""
+    import redis.asyncio as aioredis
+
+    delay = 1
+    while True:
+        client = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+            delay = 1
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    user_id = int(message['channel'].removeprefix(CHANNEL_PREFIX))
+                    _subscribers.deliver(user_id, json.loads(message['data']))
+        except Exception:
+            logger.warning('Lost the Redis connection for change events, reconnecting in %ss', delay, exc_info=True)
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+        # Events published while disconnected are lost
+        _subscribers.resync_all()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RELAY_MAX_DELAY)
+
+
+def _start_relay():
+    global _relay_task
+    if settings.EVENTS_BACKEND == 'redis' and (_relay_task is None or _relay_task.done()):
+        _relay_task = asyncio.get_running_loop().create_task(_relay())
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _stream(user_id, expires_at):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _subscribers.add(user_id, loop, queue)
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n' + _event('resync', {})
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(queue.get(), min(settings.EVENTS_KEEPALIVE_SECONDS, remaining))
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+
+            # Send what queued up meanwhile as one event
+            collections = set()
+            while message is not RESYNC:
+                collections.update(message)
+                if queue.empty():
+                    break
+                message = queue.get_nowait()
+            if message is RESYNC:
+                yield _event('resync', {})
+            else:
+                yield _event('changed', {'collections': sorted(collections)})
+    finally:
+        _subscribers.remove(user_id, loop, queue)
+
+
+@require_GET
+@async_jwt_required
+async def events_view(request):
+    """Server-sent change events for the authenticated user"""
+    # Only this worker's streams count towards the limit
+    if _subscribers.count(request.user.id) >= settings.EVENTS_MAX_STREAMS_PER_USER:
+        return JsonResponse({'detail': 'Too many open event streams.'}, status=429)
+    _start_relay()
+    response = StreamingHttpResponse(
+        _stream(request.user.id, request.auth['exp']), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Do not let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
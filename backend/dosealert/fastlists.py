@@ -0,0 +1,143 @@
+"""
+Read-only fast path for list endpoints.
+
+A ``ModelSerializer`` with ``many=True`` builds a model instance per row and
+then walks every field of every row through DRF. For lists of thousands of
+rows that is most of the request's CPU time. ``ValuesSerializer`` produces
+the same dicts from one ``values_list()`` query instead:
+
+- The columns come from the serializer's fields: each field's ``source``
+  becomes a lookup (``medication.name`` -> ``medication__name``), in the
+  serializer's field order.
+- Dates, times, decimals and UUIDs are formatted by the serializer field's
+  own ``to_representation``, so the output is the same as the serializer's;
+  aware datetimes, the most common column, are formatted inline with the
+  field's timezone looked up once per list. Other plain fields (strings,
+  numbers, booleans, primary keys, JSON) are passed through as the database
+  returns them.
+- Fields that need the model instance, such as properties, method fields or
+  nested serializers, must be listed in ``computed_fields`` (filled by
+  ``compute_<name>(row)`` from the converted row) or ``related_fields``
+  (filled by ``fetch_<name>(pks)``, one query for all rows, returning
+  ``{pk: value}``). Anything else is an ``ImproperlyConfigured`` error.
+
+Views opt in with ``ValuesListMixin`` and ``values_serializer_class``; the
+regular serializer still handles detail views, writes and paginated lists.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+)
+# Fields formatted by their to_representation
+FORMATTED_FIELDS = (
+    serializers.DateField,
+    serializers.DateTimeField,
+    serializers.DecimalField,
+    serializers.DurationField,
+    serializers.TimeField,
+    serializers.UUIDField,
+)
+
+
+def _formatter(field):
+    if not isinstance(field, serializers.DateTimeField) or not settings.USE_TZ:
+        return field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def format_datetime(value):
+        # DateTimeField.to_representation for aware values
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return format_datetime
+
+
+class ValuesSerializer:
+    serializer_class = None
+    computed_fields = ()
+    related_fields = ()
+
+    @classmethod
+    def get_plan(cls):
+        # Built once per class, on first use, when all apps are loaded
+        if '_plan' not in cls.__dict__:
+            cls._plan = cls._build_plan()
+        return cls._plan
+
+    @classmethod
+    def _build_plan(cls):
+        names, lookups, formatted = [], [], []
+        for name, field in cls.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            names.append(name)
+            if name in cls.related_fields:
+                lookups.append('pk')
+                continue
+            if field.source == '*':
+                raise ImproperlyConfigured(f'{cls.__name__}.{name} has no column; make it a computed field.')
+            lookups.append(field.source.replace('.', '__'))
+            if name in cls.computed_fields:
+                continue
+            if isinstance(field, FORMATTED_FIELDS):
+                formatted.append((name, field))
+            elif not isinstance(field, PASSTHROUGH_FIELDS):
+                raise ImproperlyConfigured(
+                    f'{cls.__name__} cannot read {name} ({type(field).__name__}) from values; '
+                    f'add it to computed_fields or related_fields.'
+                )
+        return names, lookups, formatted
+
+    def serialize(self, queryset):
+        """The serializer's ``many=True`` output for ``queryset``, as a list of dicts"""
+        names, lookups, formatted = self.get_plan()
+        formatters = [(name, _formatter(field)) for name, field in formatted]
+        rows = []
+        for values in queryset.values_list(*lookups):
+            row = dict(zip(names, values))
+            for name, formatter in formatters:
+                value = row[name]
+                if value is not None:
+                    row[name] = formatter(value)
+            rows.append(row)
+
+        for name in self.computed_fields:
+            compute = getattr(self, f'compute_{name}')
+            for row in rows:
+                row[name] = compute(row)
+        for name in self.related_fields:
+            # Until here the column holds the row's primary key
+            by_pk = getattr(self, f'fetch_{name}')([row[name] for row in rows])
+            for row in rows:
+                row[name] = by_pk.get(row[name], [])
+        return rows
+
+
+class ValuesListMixin:
+    """Serve unpaginated ``list`` requests of a ``GenericViewSet`` through ``values_serializer_class``"""
+    values_serializer_class = None
+
+    def values_response(self, queryset):
+        return Response(self.values_serializer_class().serialize(queryset))
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return self.values_response(self.filter_queryset(self.get_queryset()))
@@ -0,0 +1,244 @@
+"""
+Prometheus metrics, served at ``/metrics``.
+
+``MetricsMiddleware`` times every request and counts the database queries
+it runs, labelled with the route's URL name. The sync endpoints, dose
+responses, reminder generation, the adherence jobs and webhook delivery
+update their own collectors below.
+
+Under gunicorn each worker is a separate process with its own counters.
+When ``PROMETHEUS_MULTIPROC_DIR`` names a directory, every process (workers
+and management commands alike) writes its values to files there and
+``/metrics`` adds them up, whichever worker answers the scrape. The
+variable must be set in the environment gunicorn starts with, since the
+master clears the directory on start and cleans up after exited workers
+(see gunicorn.conf.py). Without it each worker reports only its own
+numbers, and job metrics are lost when the command exits.
+"""
+import collections
+import hmac
+import os
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+from schedules.recurrence import compile_rule
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Webhooks are sent within seconds; minutes to hours are retries
+WEBHOOK_BUCKETS = (1, 2, 5, 10, 30, 60, 300, 1800, 3600, 6 * 3600, 24 * 3600)
+# Jobs run every few minutes; a lag of hours means a job is not running
+LAG_BUCKETS = (60, 300, 600, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600, 72 * 3600)
+
+REQUEST_LATENCY = Histogram(
+    'dosealert_http_request_duration_seconds', 'Time to respond to a request, by route',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'dosealert_http_requests_total', 'Requests by route and response status',
+    ['method', 'route', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'dosealert_http_request_db_queries', 'Database queries run by a request, by route',
+    ['route'], buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'dosealert_http_request_db_seconds', 'Time a request spent in database queries, by route',
+    ['route'], buckets=LATENCY_BUCKETS,
+)
+SYNC_BATCH_SIZE = Histogram(
+    'dosealert_sync_batch_items', 'Items sent in one sync request, by resource',
+    ['resource'], buckets=BATCH_BUCKETS,
+)
+SYNC_ITEMS = Counter(
+    'dosealert_sync_items_total', 'Sync items by resource and outcome (created, updated, deleted, error)',
+    ['resource', 'outcome'],
+)
+SYNC_BATCHES = Counter(
+    'dosealert_sync_batches_total', 'Sync requests by resource and whether they were committed or rolled back',
+    ['resource', 'result'],
+)
+DOSE_RESPONSES = Counter(
+    'dosealert_dose_responses_total', 'Doses answered through /api/adherence/respond/, by status',
+    ['status'],
+)
+REMINDERS_WRITTEN = Counter(
+    'dosealert_reminders_written_total', 'Reminder rows written by Schedule reminder generation',
+    ['source'],
+)
+JOB_LAG = Histogram(
+    'dosealert_job_lag_seconds',
+    'How late the adherence jobs processed a dose: due time to pending record '
+    '(create_pending_records), end of the grace period to missed (sweep_missed_doses)',
+    ['job'], buckets=LAG_BUCKETS,
+)
+WEBHOOK_EVENTS = Counter(
+    'dosealert_webhook_events_total', 'Webhook event deliveries by result (delivered, retried, failed)',
+    ['result'],
+)
+WEBHOOK_LATENCY = Histogram(
+    'dosealert_webhook_delivery_seconds', 'Time from an adherence change to its webhook delivery',
+    buckets=WEBHOOK_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'dosealert_cache_requests_total', 'In-process cache lookups by cache and result (hit, miss)',
+    ['cache', 'result'],
+)
+
+HTTP_METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# In-process caches whose hit rates are exported, by name
+LRU_CACHES = {
+    'recurrence_rules': compile_rule,
+}
+
+_request_db = ContextVar('metrics_request_db', default=None)
+# cache name -> (hits, misses) already counted by this process
+_published = {}
+_publish_lock = threading.Lock()
+
+
+class _QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _request_db.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += perf_counter() - start
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+# Every connection gets the wrapper once; it only counts inside a request
+connection_created.connect(_install_query_timer)
+
+
+def record_sync(resource, results, committed):
+    """Count a sync request's items by outcome"""
+    SYNC_BATCH_SIZE.labels(resource).observe(len(results))
+    for outcome, count in collections.Counter(result['status'] for result in results).items():
+        SYNC_ITEMS.labels(resource, outcome).inc(count)
+    SYNC_BATCHES.labels(resource, 'committed' if committed else 'rolled_back').inc()
+
+
+def publish_cache_stats():
+    """Add the lookups the cached functions served since the last call"""
+    with _publish_lock:
+        for name, func in LRU_CACHES.items():
+            info = func.cache_info()
+            hits, misses = _published.get(name, (0, 0))
+            # cache_clear() starts the counts again
+            if info.hits < hits or info.misses < misses:
+                hits = misses = 0
+            if info.hits > hits:
+                CACHE_REQUESTS.labels(name, 'hit').inc(info.hits - hits)
+            if info.misses > misses:
+                CACHE_REQUESTS.labels(name, 'miss').inc(info.misses - misses)
+            _published[name] = (info.hits, info.misses)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """Time each request and count its queries. Goes first in ``MIDDLEWARE``."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened before the signal handler was connected
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(None, connection)
+
+    def _observe(self, request, response, elapsed, stats):
+        route = _route(request)
+        # Clients can send any method; keep the label set bounded
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        REQUEST_LATENCY.labels(method, route).observe(elapsed)
+        REQUESTS.labels(method, route, str(response.status_code)).inc()
+        REQUEST_QUERIES.labels(route).observe(stats.count)
+        REQUEST_DB_TIME.labels(route).observe(stats.seconds)
+        publish_cache_stats()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        stats = _QueryStats()
+        token = _request_db.set(stats)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._observe(request, response, perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        # Sync views and sync_to_async ORM calls run with a copy of this
+        # context, so their queries land in the same stats object
+        stats = _QueryStats()
+        token = _request_db.set(stats)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_db.reset(token)
+        self._observe(request, response, perf_counter() - start, stats)
+        return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Metrics in the Prometheus text format, behind ``METRICS_TOKEN``. Without
+    a token they are only served with ``DEBUG``, and are otherwise a 404.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'.encode()
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    elif not settings.DEBUG:
+        return HttpResponse(status=404)
+
+    publish_cache_stats()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,45 @@
+"""
+Fast request parsers, the counterparts of ``dosealert.renderers``.
+
+``ORJSONParser`` replaces DRF's ``JSONParser`` for ``application/json``;
+``MessagePackParser`` accepts ``application/msgpack`` bodies, so sync
+clients can send their batches as MessagePack.
+"""
+import msgpack
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .renderers import MSGPACK_MEDIA_TYPE, MessagePackRenderer, ORJSONRenderer
+
+UTF8 = {'utf-8', 'utf8'}
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            # orjson reads UTF-8 only
+            if encoding.lower() not in UTF8:
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            # Some unpack errors carry no message
+            raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
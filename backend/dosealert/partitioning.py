@@ -0,0 +1,367 @@
+"""
+Monthly range partitioning of the reminders table on PostgreSQL.
+
+``reminders_reminder`` is converted into a table partitioned by
+``scheduled_at`` by a migration, with one partition per calendar month
+(UTC) named ``reminders_reminder_pYYYYMM`` and a ``reminders_reminder_default``
+partition that catches rows outside every month. ``maintain_partitions``
+creates the months ahead and ``archive_partitions`` writes old months to
+compressed NDJSON and detaches them.
+
+PostgreSQL requires unique constraints of a partitioned table to include the
+partition key, so the primary key becomes ``(id, <key>)`` and every unique
+constraint gains the key column: it then only holds among rows with the same
+key, and is no longer enforced as declared. For the same reason no foreign
+key can point at a partitioned table: the one from
+``adherence_adherencerecord.reminder_id`` is dropped, and deletes still
+cascade through Django's collector.
+
+``adherence_adherencerecord`` is not partitioned. One record per reminder
+(``reminder`` is one-to-one, and ``(user, reminder)`` unique) is what
+``create_pending_records`` and ``record_adherence`` rely on when they race,
+and it would only hold per ``scheduled_time``.
+``archive_partitions`` archives a month's records together with the
+reminders they belong to, deleting them from the table.
+
+On other databases every function here is a no-op.
+"""
+import gzip
+import logging
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the months created when converting a table, so a stray
+# very old row lands in the default partition instead of creating hundreds
+MAX_INITIAL_MONTHS = 240
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    table: str
+    key: str
+
+
+REMINDERS = PartitionedTable('reminders_reminder', 'scheduled_at')
+ADHERENCE_RECORDS = PartitionedTable('adherence_adherencerecord', 'scheduled_time')
+PARTITIONED_TABLES = (REMINDERS,)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(cursor, table):
+    """``(name, month)`` of the monthly partitions of ``table``, oldest first"""
+    cursor.execute(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        [table],
+    )
+    prefix = f'{table}_p'
+    partitions = []
+    for (name,) in cursor.fetchall():
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((name, date(int(suffix[:4]), int(suffix[4:]), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def create_partition(cursor, spec, month):
+    """
+    Create the partition of ``month`` unless it exists. Rows of that month
+    that already sit in the default partition are moved into it.
+    Returns whether a partition was created.
+    """
+    name = partition_name(spec.table, month)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+    if cursor.fetchone()[0]:
+        return False
+
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    default = f'{spec.table}_default'
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {_q(default)} WHERE {_q(spec.key)} >= %s AND {_q(spec.key)} < %s)",
+        [lower, upper],
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            f"CREATE TABLE {_q(name)} PARTITION OF {_q(spec.table)} FOR VALUES FROM (%s) TO (%s)",
+            [lower, upper],
+        )
+        return True
+
+    # Attaching over rows still in the default partition would fail, so
+    # build the partition standalone, move the rows, then attach it
+    cursor.execute(
+        f"CREATE TABLE {_q(name)} (LIKE {_q(spec.table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {_q(default)} WHERE {_q(spec.key)} >= %s AND {_q(spec.key)} < %s RETURNING *) "
+        f"INSERT INTO {_q(name)} SELECT * FROM moved",
+        [lower, upper],
+    )
+    cursor.execute(
+        f"ALTER TABLE {_q(spec.table)} ATTACH PARTITION {_q(name)} FOR VALUES FROM (%s) TO (%s)",
+        [lower, upper],
+    )
+    return True
+
+
+def ensure_partitions(spec, months_ahead, today=None):
+    """Create the partitions from the current month through ``months_ahead`` months ahead"""
+    if not is_supported():
+        return []
+    this_month = month_start(today or datetime.now(dt_timezone.utc).date())
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor, spec.table):
+            return []
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            if create_partition(cursor, spec, month):
+                created.append(partition_name(spec.table, month))
+    return created
+
+
+def _table_ddl(cursor, table):
+    """
+    Index and outgoing foreign key definitions of ``table``, to recreate
+    them. Indexes are ``(name, definition, unique, columns)``, with the
+    columns only for indexes on plain columns without a predicate.
+    """
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisunique,
+            CASE WHEN x.indexprs IS NULL AND x.indpred IS NULL THEN array(
+                SELECT a.attname::text FROM unnest(x.indkey::int2[]) WITH ORDINALITY AS k(attnum, n)
+                JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+                ORDER BY k.n
+            ) END
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary
+        """,
+        [table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        """,
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT conname, conrelid::regclass::text FROM pg_constraint
+        WHERE confrelid = to_regclass(%s) AND contype = 'f'
+        """,
+        [table],
+    )
+    incoming = cursor.fetchall()
+    return indexes, foreign_keys, incoming
+
+
+def _index_on(definition, table):
+    """``definition`` of an index (``CREATE [UNIQUE] INDEX name ON ...``), moved to ``table``"""
+    head, _, tail = definition.partition(' ON ')
+    # pg_get_indexdef() schema-qualifies the table, and says ONLY for the
+    # index of a partitioned table: "... ON [ONLY] public.t USING btree (a, b) WHERE ..."
+    tail = tail.removeprefix('ONLY ').split(' ', 1)[1]
+    return f'{head} ON {_q(table)} {tail}'
+
+
+def _recreate_indexes(cursor, table, indexes, unique_columns):
+    """
+    Recreate ``indexes`` (from ``_table_ddl``) on ``table``. Unique indexes
+    on plain columns become unique constraints, the way Django creates
+    them, on the columns ``unique_columns(columns)`` returns.
+    """
+    for name, definition, unique, columns in indexes:
+        if unique and columns is not None:
+            columns = ', '.join(_q(column) for column in unique_columns(columns))
+            cursor.execute(f"ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(name)} UNIQUE ({columns})")
+        elif unique:
+            raise ImproperlyConfigured(f'Cannot move unique index {name} on expressions or with a predicate')
+        else:
+            cursor.execute(_index_on(definition, table))
+
+
+def _swap(cursor, table, staging, identity, sequence):
+    """Copy the rows of ``table`` into ``staging`` and put ``staging`` in its place"""
+    cursor.execute(f"INSERT INTO {_q(staging)} SELECT * FROM {_q(table)}")
+    if identity:
+        # The copied identity column got a fresh sequence
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {_q(table)}",
+            [staging],
+        )
+    else:
+        # A serial column's sequence would be dropped with the old table
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {_q(staging)}.id")
+    cursor.execute(f"DROP TABLE {_q(table)} CASCADE")
+    cursor.execute(f"ALTER TABLE {_q(staging)} RENAME TO {_q(table)}")
+    cursor.execute(f"ALTER TABLE {_q(table)} RENAME CONSTRAINT {_q(staging + '_pkey')} TO {_q(table + '_pkey')}")
+
+
+def _id_sequence(cursor, table):
+    cursor.execute(
+        "SELECT attidentity, pg_get_serial_sequence(%s, 'id') FROM pg_attribute "
+        "WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+        [table, table],
+    )
+    return cursor.fetchone()
+
+
+def partition_table(spec, months_ahead, today=None):
+    """
+    Convert ``spec.table`` into a table partitioned by month on ``spec.key``,
+    keeping its rows, indexes, identity sequence and outgoing foreign keys.
+    Unique constraints gain the key (see the module docstring). Does nothing
+    if it is already partitioned or the database is not PostgreSQL. Must run
+    inside a transaction.
+    """
+    if not is_supported():
+        return
+    table, key = spec.table, spec.key
+    staging = f'{table}_partitioned'
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return
+        indexes, foreign_keys, incoming = _table_ddl(cursor, table)
+        identity, sequence = _id_sequence(cursor, table)
+        for name, referencing in incoming:
+            logger.warning('Dropping foreign key %s of %s: it cannot reference a partitioned table', name, referencing)
+
+        cursor.execute(
+            f"CREATE TABLE {_q(staging)} (LIKE {_q(table)} INCLUDING DEFAULTS INCLUDING IDENTITY "
+            f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({_q(key)})"
+        )
+        cursor.execute(f"ALTER TABLE {_q(staging)} ADD PRIMARY KEY (id, {_q(key)})")
+        cursor.execute(f"CREATE TABLE {_q(staging + '_default')} PARTITION OF {_q(staging)} DEFAULT")
+
+        cursor.execute(f"SELECT min({_q(key)}) FROM {_q(table)}")
+        oldest = cursor.fetchone()[0]
+        last = add_months(month_start(today or datetime.now(dt_timezone.utc).date()), months_ahead)
+        first = month_start(oldest.astimezone(dt_timezone.utc).date()) if oldest else last
+        first = max(first, add_months(last, -MAX_INITIAL_MONTHS))
+        month = first
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {_q(partition_name(table, month))} PARTITION OF {_q(staging)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [_bound(month), _bound(add_months(month, 1))],
+            )
+            month = add_months(month, 1)
+
+        _swap(cursor, table, staging, identity, sequence)
+        cursor.execute(f"ALTER TABLE {_q(staging + '_default')} RENAME TO {_q(table + '_default')}")
+        _recreate_indexes(
+            cursor, table, indexes, lambda columns: columns if key in columns else [*columns, key],
+        )
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(name)} {definition}")
+
+
+def _write_archive(cursor, statement, path):
+    """
+    Write the lines ``COPY (<statement>) TO STDOUT`` returns to the gzipped
+    ``path``, which appears only once complete. Returns the number of lines.
+    """
+    partial = path + '.partial'
+    rows = 0
+    with open(partial, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            with cursor.copy(f"COPY ({statement}) TO STDOUT") as copy:
+                # Typed rows undo COPY's text escaping of backslashes in the JSON
+                copy.set_types(['text'])
+                for (line,) in copy.rows():
+                    archive.write(line.encode())
+                    archive.write(b'\n')
+                    rows += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return rows
+
+
+def archive_partition(cursor, spec, name, directory):
+    """
+    Write every row of partition ``name`` as one JSON object per line to
+    ``<directory>/<name>.ndjson.gz``. The file appears only once complete.
+    Returns its path and the number of rows written.
+    """
+    path = os.path.join(directory, f'{name}.ndjson.gz')
+    rows = _write_archive(cursor, f"SELECT row_to_json(t)::text FROM {_q(name)} t ORDER BY {_q(spec.key)}, id", path)
+    return path, rows
+
+
+def archive_records(cursor, name, directory):
+    """
+    Delete the adherence records of the reminders in partition ``name`` of
+    the reminders table, writing them like ``archive_partition`` to
+    ``<directory>/adherence_adherencerecord_pYYYYMM.ndjson.gz``. Returns
+    its path and the number of records.
+    """
+    records = ADHERENCE_RECORDS.table
+    path = os.path.join(directory, f'{records}{name.removeprefix(REMINDERS.table)}.ndjson.gz')
+    rows = _write_archive(
+        cursor,
+        f"DELETE FROM {_q(records)} t WHERE reminder_id IN (SELECT id FROM {_q(name)}) RETURNING row_to_json(t)::text",
+        path,
+    )
+    return path, rows
+
+
+def detach_partition(cursor, spec, name, drop=False):
+    """
+    Detach partition ``name`` and drop it, or keep it as a standalone table
+    without the foreign keys it inherited, which would otherwise block
+    deleting the users, medications and schedules its rows point to.
+    """
+    cursor.execute(f"ALTER TABLE {_q(spec.table)} DETACH PARTITION {_q(name)}")
+    if drop:
+        cursor.execute(f"DROP TABLE {_q(name)}")
+        return
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [name],
+    )
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {_q(name)} DROP CONSTRAINT {_q(constraint)}")
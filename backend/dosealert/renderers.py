@@ -0,0 +1,61 @@
+"""
+Fast renderers for the API, configured in ``REST_FRAMEWORK``.
+
+``ORJSONRenderer`` produces the same JSON as DRF's ``JSONRenderer`` with
+orjson doing the encoding. Dates and times, and anything orjson does not
+encode natively, go through DRF's ``JSONEncoder``, so timestamps keep DRF's
+format.
+
+``MessagePackRenderer`` answers clients that send
+``Accept: application/msgpack`` (or ``?format=msgpack``) with the same data
+as MessagePack, which is smaller and faster to decode for large bodies
+such as sync results and reports. See ``dosealert.parsers`` for the
+request side.
+"""
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    encoder = JSONEncoder()
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        if accepted_media_type:
+            # Same negotiation as JSONRenderer, e.g. 'application/json; indent=4'
+            params = dict(
+                param.strip().split('=', 1)
+                for param in accepted_media_type.split(';')[1:]
+                if '=' in param
+            )
+            if params.get('indent'):
+                return True
+        return bool(renderer_context and renderer_context.get('indent'))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type, renderer_context):
+            # orjson only indents by two spaces
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self.encoder.default, option=option)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder.default, use_bin_type=True, datetime=False)
@@ -0,0 +1,231 @@
+"""
+Read replica routing.
+
+Replicas are configured with ``DATABASE_REPLICA_URLS`` and show up as the
+``replica0``, ``replica1``, ... database aliases. Only requests that are
+both read-only (``GET``/``HEAD``/``OPTIONS``) and served by a view marked
+with ``@replica_reads`` read from a replica; everything else, including
+management commands and background jobs, stays on ``default``.
+
+A request is kept on the primary when:
+
+- its user wrote within the last ``REPLICA_PIN_SECONDS``, so clients see
+  their own writes. The pin is kept in the shared cache, keyed by the user
+  id of the request's access token.
+- every replica lags more than ``REPLICA_MAX_LAG_SECONDS`` (checked at most
+  every ``REPLICA_LAG_CHECK_SECONDS`` per process) or cannot be reached.
+- it already wrote something, or the read runs inside a transaction on
+  ``default``.
+
+One replica is picked per request, so all reads of a request see the same
+snapshot age.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica'
+
+# Lag in seconds, 0 when the replica has replayed everything it received.
+# pg_last_xact_replay_timestamp() alone keeps growing on an idle primary.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_state = ContextVar('replica_state', default=None)
+# alias -> (monotonic time of the check, healthy)
+_health = {}
+
+
+class _RequestState:
+    __slots__ = ('alias', 'wrote')
+
+    def __init__(self):
+        self.alias = None
+        self.wrote = False
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def replica_reads(view):
+    """Let the read-only requests of a view (function or class) use a replica"""
+    view.replica_reads = True
+    return view
+
+
+def _allows_replica(view_func):
+    return getattr(view_func, 'replica_reads', False) or getattr(getattr(view_func, 'cls', None), 'replica_reads', False)
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def token_user_id(request):
+    """User id of the request's access token, without touching the database"""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        return auth.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+
+def replica_lag(alias):
+    """Replication lag of ``alias`` in seconds (0 for non-PostgreSQL replicas)"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def _healthy(alias):
+    now = time.monotonic()
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < settings.REPLICA_LAG_CHECK_SECONDS:
+        return checked[1]
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        logger.warning('Replica %s is unreachable, reading from the primary', alias, exc_info=True)
+        healthy = False
+    else:
+        healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if not healthy:
+            logger.warning('Replica %s lags %.1fs, reading from the primary', alias, lag)
+    _health[alias] = (now, healthy)
+    return healthy
+
+
+def _pinned(user_id):
+    try:
+        return cache.get(_pin_key(user_id)) is not None
+    except Exception:
+        # Without the pin we cannot promise read-your-writes
+        logger.warning('Could not read the replica pin of user %s', user_id, exc_info=True)
+        return True
+
+
+def pin_to_primary(user_id):
+    """Keep the user's reads on the primary for ``REPLICA_PIN_SECONDS``"""
+    try:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+    except Exception:
+        logger.warning('Could not pin user %s to the primary', user_id, exc_info=True)
+
+
+def reading_replica():
+    """True when the current request's reads go to a replica"""
+    state = _state.get()
+    return state is not None and state.alias is not None and not state.wrote
+
+
+def choose_replica(request):
+    """The replica alias the request reads from, or ``None`` for the primary"""
+    user_id = token_user_id(request)
+    if user_id is None or _pinned(user_id):
+        return None
+    healthy = [alias for alias in replica_aliases() if _healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.alias is None or state.wrote:
+            return None
+        # Reads inside a transaction must see its uncommitted writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    Choose the database of each request and pin users to the primary after
+    they write. Must come after ``AuthenticationMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _wrote(self, request, response, state):
+        return response.status_code < 400 and (state.wrote or request.method not in SAFE_METHODS)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self._wrote(request, response, state):
+            user_id = token_user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self._wrote(request, response, state):
+            user_id = token_user_id(request)
+            if user_id is not None:
+                await sync_to_async(pin_to_primary)(user_id)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Django runs this in a worker thread under ASGI; the state object is
+        # shared with the request's context, so setting its alias is enough
+        state = _state.get()
+        if state is not None and request.method in SAFE_METHODS and _allows_replica(view_func):
+            state.alias = choose_replica(request)
+        return None
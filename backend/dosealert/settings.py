@@ -52,12 +52,37 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
-    "users","meds","schedules","reminders","analytics","adherence",
+    "users","meds","schedules","reminders","analytics","adherence","webhooks","perf",
 ]
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
+    # orjson for JSON, MessagePack when the client asks for it (dosealert.renderers)
+    "DEFAULT_RENDERER_CLASSES": (
+        "dosealert.renderers.ORJSONRenderer",
+        "dosealert.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "dosealert.parsers.ORJSONParser",
+        "dosealert.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # Token buckets (dosealert.throttling): "10/min" allows a burst of 10,
+    # refilled at 10 per minute. An empty value turns a scope off.
+    "DEFAULT_THROTTLE_RATES": {
+        # Login, registration and token endpoints, per client IP and per username
+        "auth_ip": env("THROTTLE_AUTH_IP_RATE", default="30/min") or None,
+        "auth_username": env("THROTTLE_AUTH_USERNAME_RATE", default="10/min") or None,
+        # /sync/ endpoints, per user
+        "sync": env("THROTTLE_SYNC_RATE", default="120/min") or None,
+    },
+    # Proxies in front of the app. With 0 the client IP is REMOTE_ADDR;
+    # otherwise it is read from X-Forwarded-For, which clients can forge
+    # unless that many proxies really rewrite it
+    "NUM_PROXIES": env.int("NUM_PROXIES", default=0),
 }
 
 # JWT Configuration
@@ -67,9 +92,27 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': False,
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.FilteredTokenRefreshSerializer',
 }
 
+# Refresh tokens are checked against the blacklist through a per-process
+# bloom filter (users.blacklist), synced with the table at most every
+# TOKEN_BLACKLIST_SYNC_SECONDS and rebuilt after CAPACITY new entries.
+TOKEN_BLACKLIST_FILTER_CAPACITY = env.int("TOKEN_BLACKLIST_FILTER_CAPACITY", default=1_000_000)
+TOKEN_BLACKLIST_SYNC_SECONDS = env.int("TOKEN_BLACKLIST_SYNC_SECONDS", default=5)
+
+# Users resolved from access tokens are cached this long (0 disables it), see
+# users.authentication. Profile updates and deactivation clear the entry; with
+# per-process caches (no REDIS_URL) other workers see them after the TTL.
+AUTH_USER_CACHE_SECONDS = env.int("AUTH_USER_CACHE_SECONDS", default=60)
+
+# Per-user collection versions (dosealert.versions) behind the ETag and
+# Last-Modified of list endpoints expire after this many seconds unchanged;
+# clients then download the list once more.
+COLLECTION_VERSION_SECONDS = env.int("COLLECTION_VERSION_SECONDS", default=7 * 24 * 3600)
+
 MIDDLEWARE = [
+    'dosealert.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,8 +121,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'perf.middleware.ProfilingMiddleware',
 ]
 
+# Request profiling (perf.middleware): staff users send the header to profile
+# a request; PROFILING_SAMPLE_RATE profiles a random share of all requests.
+# The newest PROFILING_BUFFER_SIZE profiles are kept, see the Perf admin.
+PROFILING_HEADER = env("PROFILING_HEADER", default="X-Profile")
+PROFILING_SAMPLE_RATE = env.float("PROFILING_SAMPLE_RATE", default=0.0)
+PROFILING_BUFFER_SIZE = env.int("PROFILING_BUFFER_SIZE", default=200)
+
+# Prometheus metrics at /metrics (dosealert.metrics). Scrapes must send
+# METRICS_TOKEN as a bearer token; without one the endpoint answers 404
+# unless DEBUG.
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
 ROOT_URLCONF = 'dosealert.urls'
 
 TEMPLATES = [
@@ -99,6 +155,60 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'dosealert.wsgi.application'
 
+# "wsgi" (gunicorn sync workers) or "asgi" (gunicorn + uvicorn workers),
+# see gunicorn.conf.py. Async read views default to on under ASGI.
+SERVER_MODE = env("SERVER_MODE", default="wsgi")
+ASYNC_READ_VIEWS = env.bool("ASYNC_READ_VIEWS", default=SERVER_MODE == "asgi")
+
+# Pending adherence records older than this are marked missed by the
+# sweep_missed_doses command.
+MISSED_DOSE_GRACE_HOURS = env.int("MISSED_DOSE_GRACE_HOURS", default=12)
+
+# Medications projected to run out within this many days are reported by
+# the check_low_supply command and /api/meds/low-supply/.
+LOW_SUPPLY_DAYS = env.int("LOW_SUPPLY_DAYS", default=7)
+
+# On PostgreSQL, reminders are partitioned by month; maintain_partitions keeps
+# this many months ahead of the current one, and archive_partitions writes
+# months older than ARCHIVE_AFTER_MONTHS, with their adherence records, to ARCHIVE_DIR.
+PARTITION_MONTHS_AHEAD = env.int("PARTITION_MONTHS_AHEAD", default=3)
+ARCHIVE_AFTER_MONTHS = env.int("ARCHIVE_AFTER_MONTHS", default=24)
+ARCHIVE_DIR = env("ARCHIVE_DIR", default=str(BASE_DIR / "archive"))
+
+# Removals of more than DELETION_INLINE_LIMIT reminders (deleting all reminders
+# or a medication) are queued for the process_deletions command instead of
+# running in the request; both delete DELETION_CHUNK_SIZE rows per transaction.
+DELETION_INLINE_LIMIT = env.int("DELETION_INLINE_LIMIT", default=5000)
+DELETION_CHUNK_SIZE = env.int("DELETION_CHUNK_SIZE", default=2000)
+
+# Sync request bodies are parsed while they are read and applied
+# SYNC_BATCH_SIZE items at a time (dosealert.syncbody). Bodies, item counts
+# and single items above these limits are rejected with 413.
+SYNC_MAX_BYTES = env.int("SYNC_MAX_BYTES", default=20 * 1024 * 1024)
+SYNC_MAX_ITEMS = env.int("SYNC_MAX_ITEMS", default=10000)
+SYNC_MAX_ITEM_BYTES = env.int("SYNC_MAX_ITEM_BYTES", default=64 * 1024)
+SYNC_BATCH_SIZE = env.int("SYNC_BATCH_SIZE", default=200)
+
+
+# Adherence events for integrators' webhooks (webhooks app). Writes add them to
+# an outbox in their own transaction; deliver_webhooks polls it every
+# WEBHOOK_POLL_SECONDS and POSTs signed batches of up to WEBHOOK_BATCH_SIZE
+# events per endpoint, WEBHOOK_CONCURRENCY endpoints at a time. Failed batches
+# are retried with exponential backoff from WEBHOOK_RETRY_BASE_SECONDS up to
+# WEBHOOK_RETRY_MAX_SECONDS, WEBHOOK_MAX_ATTEMPTS times in all. Sent events are
+# kept WEBHOOK_RETENTION_DAYS. Endpoints need https unless WEBHOOK_ALLOW_HTTP,
+# and public addresses unless WEBHOOK_ALLOW_PRIVATE_ADDRESSES (loopback and
+# private networks, for a local receiver).
+WEBHOOK_POLL_SECONDS = env.float("WEBHOOK_POLL_SECONDS", default=2)
+WEBHOOK_BATCH_SIZE = env.int("WEBHOOK_BATCH_SIZE", default=100)
+WEBHOOK_CONCURRENCY = env.int("WEBHOOK_CONCURRENCY", default=8)
+WEBHOOK_TIMEOUT_SECONDS = env.int("WEBHOOK_TIMEOUT_SECONDS", default=10)
+WEBHOOK_RETRY_BASE_SECONDS = env.int("WEBHOOK_RETRY_BASE_SECONDS", default=30)
+WEBHOOK_RETRY_MAX_SECONDS = env.int("WEBHOOK_RETRY_MAX_SECONDS", default=6 * 3600)
+WEBHOOK_MAX_ATTEMPTS = env.int("WEBHOOK_MAX_ATTEMPTS", default=10)
+WEBHOOK_RETENTION_DAYS = env.int("WEBHOOK_RETENTION_DAYS", default=7)
+WEBHOOK_ALLOW_HTTP = env.bool("WEBHOOK_ALLOW_HTTP", default=DEBUG)
+WEBHOOK_ALLOW_PRIVATE_ADDRESSES = env.bool("WEBHOOK_ALLOW_PRIVATE_ADDRESSES", default=DEBUG)
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -110,6 +220,64 @@ DATABASES = {
     )
 }
 
+# Persistent connections are per-thread and the async ORM hops threads, so
+# under ASGI connections are closed at the end of each request instead.
+if SERVER_MODE == "asgi":
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Optional read replicas (comma-separated database URLs), see dosealert/replicas.py.
+# GET requests to report and list endpoints read from a replica unless the user
+# wrote within REPLICA_PIN_SECONDS or the replica lags more than
+# REPLICA_MAX_LAG_SECONDS, re-checked every REPLICA_LAG_CHECK_SECONDS.
+DATABASE_REPLICA_URLS = env.list("DATABASE_REPLICA_URLS", default=[])
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=10)
+REPLICA_MAX_LAG_SECONDS = env.int("REPLICA_MAX_LAG_SECONDS", default=5)
+REPLICA_LAG_CHECK_SECONDS = env.int("REPLICA_LAG_CHECK_SECONDS", default=5)
+
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    replica = dj_database_url.parse(url, conn_max_age=DATABASES['default']['CONN_MAX_AGE'])
+    # Tests read the replica through the test primary
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{index}'] = replica
+
+if DATABASE_REPLICA_URLS:
+    DATABASE_ROUTERS = ['dosealert.replicas.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'dosealert.replicas.ReplicaMiddleware',
+    )
+
+# Cache shared by all workers when REDIS_URL is set. Replica pins live here,
+# so with several workers and replicas REDIS_URL should be set; otherwise
+# each process has its own in-memory cache.
+REDIS_URL = env("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Change events over server-sent events at /api/events/ (dosealert.events),
+# routed under ASGI. EVENTS_BACKEND "redis" relays events between workers and
+# from cron commands (the default with REDIS_URL); "local" reaches streams in
+# the writing process only. Streams send a keepalive every
+# EVENTS_KEEPALIVE_SECONDS. EVENTS_MAX_STREAMS_PER_USER is counted per worker
+# process, with either backend: a user can open that many streams on every
+# worker, so up to workers x EVENTS_MAX_STREAMS_PER_USER in all.
+EVENTS_ENABLED = env.bool("EVENTS_ENABLED", default=SERVER_MODE == "asgi")
+EVENTS_BACKEND = env("EVENTS_BACKEND", default="redis" if REDIS_URL else "local")
+EVENTS_KEEPALIVE_SECONDS = env.int("EVENTS_KEEPALIVE_SECONDS", default=20)
+EVENTS_MAX_STREAMS_PER_USER = env.int("EVENTS_MAX_STREAMS_PER_USER", default=5)
+EVENTS_RETRY_MS = env.int("EVENTS_RETRY_MS", default=5000)
+
 # Development: Disable password validation for easier testing
 if DEBUG:
     AUTH_PASSWORD_VALIDATORS = []
@@ -157,6 +325,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Production Security Settings
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
+    # Prometheus usually scrapes workers directly over plain HTTP
+    SECURE_REDIRECT_EXEMPT = [r'^metrics$']
     SECURE_HSTS_SECONDS = 31536000  # 1 year
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
@@ -0,0 +1,226 @@
+"""
+Streaming parser for the bodies of the ``/sync/`` endpoints.
+
+A client that was offline for a long time can send a batch of many
+thousands of items. ``request.data`` would read and parse the whole body
+before the view can look at it, so the sync views read it through
+``sync_batches`` instead: the JSON array (or MessagePack array) is parsed
+one item at a time while the body is read in ``READ_SIZE`` chunks, and
+handed to the view in lists of ``SYNC_BATCH_SIZE`` items. Memory stays at
+about one batch plus one read, however large the body is.
+
+Limits, each answered with 413 as soon as it is crossed:
+
+- ``SYNC_MAX_BYTES`` for the whole body (checked against ``Content-Length``
+  before anything is read, and again while reading),
+- ``SYNC_MAX_ITEMS`` items per request,
+- ``SYNC_MAX_ITEM_BYTES`` for a single item.
+
+Malformed bodies and items that are not objects are answered with 400.
+Both are raised from the iteration, so a view has usually applied part of
+the batch by then; the sync views run inside a transaction and roll back.
+"""
+import codecs
+import json
+import re
+
+import msgpack
+from django.conf import settings
+from django.utils.http import parse_header_parameters
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+from .renderers import MSGPACK_MEDIA_TYPE
+
+READ_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class SyncBodyTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Sync batch is too large.'
+    default_code = 'sync_body_too_large'
+
+
+class _CappedStream:
+    """Counts the bytes read from the request and stops at SYNC_MAX_BYTES"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.read_bytes = 0
+
+    def read(self, size):
+        data = self.stream.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > settings.SYNC_MAX_BYTES:
+            raise SyncBodyTooLarge(f'Sync bodies are limited to {settings.SYNC_MAX_BYTES} bytes.')
+        return data
+
+
+def _item_too_large():
+    return SyncBodyTooLarge(f'Sync items are limited to {settings.SYNC_MAX_ITEM_BYTES} bytes.')
+
+
+class _JSONArray:
+    def __init__(self, stream, encoding):
+        self.stream = stream
+        try:
+            self.text = codecs.getincrementaldecoder(encoding)()
+        except LookupError:
+            raise ParseError(f'JSON parse error - unknown encoding {encoding}')
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        data = self.stream.read(READ_SIZE)
+        try:
+            text = self.text.decode(data, final=not data)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        # Drop what was parsed already
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        self.eof = not data
+
+    def _peek(self):
+        """Next character that is not whitespace, '' at the end of the body"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def start(self):
+        if self._peek() != '[':
+            return False
+        self.pos += 1
+        return True
+
+    def _decode(self):
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next read
+                if end < len(self.buffer) or self.eof:
+                    if end - self.pos > settings.SYNC_MAX_ITEM_BYTES:
+                        raise _item_too_large()
+                    self.pos = end
+                    return item
+            except json.JSONDecodeError as exc:
+                if self.eof:
+                    raise ParseError(f'JSON parse error - {exc}')
+            if len(self.buffer) - self.pos > settings.SYNC_MAX_ITEM_BYTES:
+                raise _item_too_large()
+            self._fill()
+
+    def __iter__(self):
+        first = True
+        while True:
+            char = self._peek()
+            if char == ']':
+                self.pos += 1
+                if self._peek():
+                    raise ParseError('JSON parse error - extra data after the array')
+                return
+            if not first:
+                if char != ',':
+                    raise ParseError("JSON parse error - expected ',' or ']' between items")
+                self.pos += 1
+                self._peek()
+            yield self._decode()
+            first = False
+
+
+class _MessagePackArray:
+    def __init__(self, stream):
+        read_size = min(READ_SIZE, settings.SYNC_MAX_ITEM_BYTES)
+        # The buffer holds at most one item beyond what was already unpacked
+        self.unpacker = msgpack.Unpacker(
+            stream, read_size=read_size, max_buffer_size=settings.SYNC_MAX_ITEM_BYTES + read_size, raw=False,
+        )
+        self.length = 0
+
+    def start(self):
+        try:
+            self.length = self.unpacker.read_array_header()
+        except (ValueError, msgpack.OutOfData):
+            return False
+        if self.length > settings.SYNC_MAX_ITEMS:
+            raise SyncBodyTooLarge(f'Sync batches are limited to {settings.SYNC_MAX_ITEMS} items.')
+        return True
+
+    def __iter__(self):
+        for _ in range(self.length):
+            start = self.unpacker.tell()
+            try:
+                item = self.unpacker.unpack()
+            except msgpack.BufferFull:
+                raise _item_too_large()
+            except (ValueError, TypeError, msgpack.UnpackException, msgpack.OutOfData) as exc:
+                raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
+            if self.unpacker.tell() - start > settings.SYNC_MAX_ITEM_BYTES:
+                raise _item_too_large()
+            yield item
+
+
+def _batches(items):
+    batch = []
+    for count, item in enumerate(items, 1):
+        if count > settings.SYNC_MAX_ITEMS:
+            raise SyncBodyTooLarge(f'Sync batches are limited to {settings.SYNC_MAX_ITEMS} items.')
+        if not isinstance(item, dict):
+            raise ParseError('Sync items must be objects.')
+        batch.append(item)
+        if len(batch) == settings.SYNC_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_batches(request):
+    """
+    Iterator over the items of a sync body in lists of up to
+    ``SYNC_BATCH_SIZE``, or None when the body is not an array.
+    """
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > settings.SYNC_MAX_BYTES:
+        raise SyncBodyTooLarge(f'Sync bodies are limited to {settings.SYNC_MAX_BYTES} bytes.')
+
+    stream = request.stream
+    if stream is None:
+        return None
+    media_type, params = parse_header_parameters(request.content_type or '')
+    if media_type == 'application/json':
+        items = _JSONArray(_CappedStream(stream), params.get('charset') or settings.DEFAULT_CHARSET)
+    elif media_type == MSGPACK_MEDIA_TYPE:
+        items = _MessagePackArray(_CappedStream(stream))
+    else:
+        return None
+    if not items.start():
+        return None
+    return _batches(items)
+
+
+class ExistingRows:
+    """
+    The rows of ``queryset`` that the items of ``batch`` refer to, loaded
+    with one query. Lookups take the ids as items send them (5 or "5");
+    both return None for rows that do not exist or were popped.
+    """
+
+    def __init__(self, queryset, batch):
+        self.pk = queryset.model._meta.pk
+        self.rows = queryset.in_bulk({item['id'] for item in batch if item.get('id')})
+
+    def get(self, item_id):
+        return self.rows.get(self.pk.to_python(item_id))
+
+    def pop(self, item_id):
+        """Take a row that is being deleted, so later items do not see it"""
+        return self.rows.pop(self.pk.to_python(item_id), None)
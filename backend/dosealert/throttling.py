@@ -0,0 +1,109 @@
+"""
+Token-bucket throttles for DRF views.
+
+Each throttle scope has a rate in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``
+such as ``"10/min"``: a bucket per key holds up to 10 requests and refills
+at 10 per minute, so a client can burst up to the full budget and then
+continues at the refill rate. Buckets live in the default cache, shared by
+all workers when ``REDIS_URL`` is set. Without it every worker keeps its
+own buckets, which multiplies the budgets by the worker count;
+``warn_unshared_cache`` logs that at startup unless DEBUG.
+
+A bucket is stored as the time at which it will be full again (GCRA), one
+cache value per key. The read and write are not atomic, so concurrent
+requests can overshoot a budget by a few requests.
+
+Rejected requests get DRF's 429 response with ``Retry-After``. They are
+turned away before the view runs, so a flood of logins costs no password
+hashing.
+
+- ``AuthIPThrottle`` and ``AuthUsernameThrottle`` guard the endpoints that
+  check passwords, per client IP and per submitted username.
+- ``SyncThrottle`` budgets the ``/sync/`` endpoints per user.
+"""
+import hashlib
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """``SimpleRateThrottle`` with a token bucket instead of a request log"""
+
+    def get_rate(self):
+        # Read on every request, so tests and benchmarks can override the rates
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        interval = self.duration / self.num_requests
+        full_at = max(self.cache.get(self.key, now), now) + interval
+        # The bucket holds num_requests tokens: it may be at most a whole
+        # duration from being full again
+        if full_at - now > self.duration:
+            self.retry_after = full_at - now - self.duration
+            return False
+        self.cache.set(self.key, full_at, math.ceil(full_at - now))
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class AuthIPThrottle(TokenBucketThrottle):
+    scope = 'auth_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class AuthUsernameThrottle(TokenBucketThrottle):
+    """Budget per target account, however many addresses the attempts come from"""
+    scope = 'auth_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not isinstance(username, str) or not username:
+            return None
+        ident = hashlib.sha256(username.strip().lower().encode()).hexdigest()[:32]
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class SyncThrottle(TokenBucketThrottle):
+    scope = 'sync'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+AUTH_THROTTLES = [AuthIPThrottle, AuthUsernameThrottle]
+
+
+def warn_unshared_cache():
+    """Log a warning when the buckets are kept per process outside DEBUG"""
+    if settings.DEBUG or not isinstance(caches['default'], LocMemCache):
+        return
+    if not any(api_settings.DEFAULT_THROTTLE_RATES.values()):
+        return
+    logger.warning(
+        'Throttle buckets are kept in a per-process cache: every worker counts '
+        'requests on its own, so the rate limits are multiplied by the worker '
+        'count. Set REDIS_URL to share them.'
+    )
@@ -1,12 +1,16 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from analytics.api import AnalyticsView
+from analytics.api import AnalyticsView, analytics_summary_async
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
 from django.http import JsonResponse
+from dosealert.events import events_view
+from dosealert.metrics import metrics_view
+from dosealert.throttling import AUTH_THROTTLES
 
 router = DefaultRouter()
 
@@ -16,15 +20,25 @@ def custom_bad_request(request, exception):
 
 handler400 = custom_bad_request
 
+# Under ASGI the read-heavy dashboard endpoints are served by native async
+# views so a request waiting on the database does not pin a worker thread.
+analytics_summary_view = analytics_summary_async if settings.ASYNC_READ_VIEWS else AnalyticsView.as_view()
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("api/", include(router.urls)),
     path("api/meds/", include("meds.api")),
     path("api/schedules/", include("schedules.api")),
     path("api/reminders/", include("reminders.api")),
     path("api/users/", include("users.urls")),
     path("api/adherence/", include("adherence.api")),
-    path("api/analytics/summary/", AnalyticsView.as_view(), name="analytics-summary"),
-    path("api/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("api/auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-]
\ No newline at end of file
+    path("api/webhooks/", include("webhooks.api")),
+    path("api/analytics/summary/", analytics_summary_view, name="analytics-summary"),
+    path("api/auth/token/", TokenObtainPairView.as_view(throttle_classes=AUTH_THROTTLES), name="token_obtain_pair"),
+    path("api/auth/refresh/", TokenRefreshView.as_view(throttle_classes=AUTH_THROTTLES), name="token_refresh"),
+]
+
+# Event streams hold their connection open, which only async workers can afford
+if settings.EVENTS_ENABLED:
+    urlpatterns.append(path("api/events/", events_view, name="events"))
@@ -0,0 +1,143 @@
+"""
+Per-user collection versions, for conditional GETs of list endpoints.
+
+Every user has a version per collection (medications, schedules,
+reminders, adherence records, streaks), kept in the default cache. Writes
+give the collections they touch a new version: the viewsets through
+``VersionedListMixin``, the sync views and ``record_adherence`` with
+``bump``, and the background jobs for the users they changed. Versions are
+written when the transaction commits, so a list that still shows the old
+rows is never served under the new version. The same commit sends the
+user's event streams a ``changed`` event, see ``dosealert.events``.
+
+``VersionedListMixin`` sends the version as ``ETag`` and ``Last-Modified``
+on list responses, and answers ``If-None-Match``/``If-Modified-Since`` with
+304 before the list query runs.
+
+A version is the time of the write in nanoseconds, moved to a later second
+than the previous version so ``Last-Modified`` changes too. A version
+missing from the cache (evicted, expired, cache flushed) is recreated as the
+current time, so clients only ever refetch, never keep stale lists.
+Conditional responses are skipped while a recent version is read from a
+replica that may not have the write yet.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.permissions import SAFE_METHODS
+
+from . import events
+from .replicas import reading_replica
+
+logger = logging.getLogger(__name__)
+
+NANOSECONDS = 10 ** 9
+
+COLLECTIONS = ('medications', 'schedules', 'reminders', 'adherence_records', 'streaks')
+
+# Collections whose lists can change when a resource is written: deleting a
+# medication removes its schedules, reminders and history, schedules are
+# listed with their medication, reminders cascade to adherence records, and
+# medication names appear in records and streaks.
+AFFECTED_COLLECTIONS = {
+    'medications': COLLECTIONS,
+    'schedules': ('schedules', 'reminders', 'medications', 'adherence_records'),
+    'reminders': ('reminders', 'adherence_records'),
+    'adherence_records': ('adherence_records', 'streaks'),
+}
+
+
+def _key(user_id, collection):
+    return f'collection-version:{user_id}:{collection}'
+
+
+def _store_new_versions(keys):
+    now = time.time_ns()
+    try:
+        current = cache.get_many(keys)
+        cache.set_many(
+            {
+                key: max(now, (current.get(key, 0) // NANOSECONDS + 1) * NANOSECONDS)
+                for key in keys
+            },
+            settings.COLLECTION_VERSION_SECONDS,
+        )
+    except Exception:
+        logger.error('Could not store new collection versions for %s', keys, exc_info=True)
+
+
+def _changed(user_ids, collections):
+    _store_new_versions([_key(user_id, collection) for user_id in user_ids for collection in collections])
+    events.publish(user_ids, collections)
+
+
+def bump(user_ids, resource):
+    """
+    Give the collections ``resource`` affects a new version for each of
+    ``user_ids`` (one id or several) once the current transaction commits,
+    and tell their event streams.
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: _changed(user_ids, AFFECTED_COLLECTIONS[resource]))
+
+
+def get_version(user_id, collection):
+    """The current version of the user's collection, None when the cache is unavailable"""
+    key = _key(user_id, collection)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), settings.COLLECTION_VERSION_SECONDS)
+            version = cache.get(key)
+    except Exception:
+        logger.warning('Could not read the %s version of user %s', collection, user_id, exc_info=True)
+        return None
+    return version
+
+
+class VersionedListMixin:
+    """
+    Conditional ``list`` responses for a viewset whose list is the user's
+    ``version_collection``; successful writes bump ``version_resource``.
+    """
+    version_collection = None
+    version_resource = None
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(request.user.id, self.version_collection)
+        if version is None or (
+            reading_replica() and time.time_ns() - version < settings.REPLICA_MAX_LAG_SECONDS * NANOSECONDS
+        ):
+            return super().list(request, *args, **kwargs)
+
+        # JSON and MessagePack bodies of the same version are different representations
+        etag = f'"{self.version_collection}-{version:x}-{request.accepted_renderer.format}"'
+        last_modified = version // NANOSECONDS
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # Revalidate on every use; lists are per user
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            self.version_resource is not None
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            bump(request.user.id, self.version_resource)
+        return super().finalize_response(request, response, *args, **kwargs)
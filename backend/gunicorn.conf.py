@@ -0,0 +1,46 @@
+"""
+Gunicorn configuration for DoseAlert.
+
+SERVER_MODE selects how the app is served:
+
+- ``wsgi`` (default): ``dosealert.wsgi`` on sync workers.
+- ``asgi``: ``dosealert.asgi`` on uvicorn workers, so the async read views
+  (adherence summary/report, analytics) can interleave many in-flight
+  requests per worker while they wait on the database.
+
+With PROMETHEUS_MULTIPROC_DIR set, the workers share their metrics through
+files in that directory (see dosealert.metrics); the hooks below clear it
+on start and clean up after each exited worker.
+"""
+import glob
+import os
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 3))
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "dosealert.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "dosealert.wsgi:application"
+    worker_class = "sync"
+
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    # Imported up front: child_exit runs in a signal handler
+    from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to the new run's counts
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,3 +1,16 @@
 from django.contrib import admin
-from .models import Medication
+from .inventory import restock
+from .models import Medication, MedicationInventory
 admin.site.register(Medication)
+
+
+@admin.register(MedicationInventory)
+class MedicationInventoryAdmin(admin.ModelAdmin):
+    list_display = ('medication', 'quantity', 'daily_usage', 'projected_runout_date', 'refill_alerted_at')
+    list_select_related = ('medication',)
+    raw_id_fields = ('medication',)
+    readonly_fields = ('daily_usage', 'projected_runout_date', 'refill_alerted_at', 'updated_at')
+
+    def save_model(self, request, obj, form, change):
+        # Same path as a refill through the API, so the projection follows the quantity
+        restock(obj.medication, obj.quantity)
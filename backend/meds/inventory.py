@@ -0,0 +1,99 @@
+"""
+Pill inventory bookkeeping.
+
+A taken dose takes ``dosage_amount`` off the supply under a row lock and
+moves the projected run-out date along using the stored daily usage. The
+daily usage itself comes from the medication's active schedules, not from
+adherence history, and is recomputed only when those schedules, the
+dosage or the supply change.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from schedules.expansion import count_occurrences
+from schedules.models import Schedule
+
+from .models import MedicationInventory
+
+# Days of schedule averaged into the daily usage, so weekly patterns even out
+USAGE_WINDOW_DAYS = 28
+
+
+def daily_usage(medication, today=None):
+    """Dosage units per day that ``medication``'s active schedules call for"""
+    today = today or timezone.localdate()
+    start = datetime.combine(today, time.min, tzinfo=timezone.get_current_timezone())
+    schedules = Schedule.objects.active().filter(medication=medication)
+    doses = sum(count_occurrences(schedules, start, start + timedelta(days=USAGE_WINDOW_DAYS)).values())
+    return (Decimal(medication.dosage_amount) * doses / USAGE_WINDOW_DAYS).quantize(Decimal('0.001'))
+
+
+def _locked(medication_id):
+    # of=('self',) keeps the medication row itself unlocked on PostgreSQL
+    return (
+        MedicationInventory.objects.select_for_update(of=('self',))
+        .select_related('medication')
+        .filter(medication_id=medication_id)
+        .first()
+    )
+
+
+def consume_doses(medication_id, doses, today=None):
+    """
+    Take ``doses`` doses (negative to put them back) off the medication's
+    supply and move its projection. Returns the inventory, or ``None`` when
+    the medication's supply is not tracked.
+    """
+    with transaction.atomic():
+        inventory = _locked(medication_id)
+        if inventory is None:
+            return None
+        used = Decimal(inventory.medication.dosage_amount) * doses
+        inventory.quantity = max(Decimal(inventory.quantity) - used, Decimal(0))
+        inventory.project(today or timezone.localdate())
+        inventory.save(update_fields=['quantity', 'projected_runout_date', 'updated_at'])
+    return inventory
+
+
+def refresh_daily_usage(medication_id, today=None):
+    """Recompute the daily usage and projection after schedules or the dosage changed"""
+    # Most medications have no tracked supply: don't open a transaction and
+    # take a row lock on every schedule or medication write for them
+    if not MedicationInventory.objects.filter(medication_id=medication_id).exists():
+        return None
+    with transaction.atomic():
+        inventory = _locked(medication_id)
+        if inventory is None:
+            return None
+        today = today or timezone.localdate()
+        inventory.daily_usage = daily_usage(inventory.medication, today)
+        inventory.project(today)
+        inventory.save(update_fields=['daily_usage', 'projected_runout_date', 'updated_at'])
+    return inventory
+
+
+def restock(medication, quantity, today=None):
+    """Set the supply on hand (a refill or a recount), starting to track it if needed"""
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        inventory = _locked(medication.id) or MedicationInventory(medication=medication)
+        inventory.quantity = quantity
+        inventory.daily_usage = daily_usage(medication, today)
+        inventory.refill_alerted_at = None
+        inventory.project(today)
+        inventory.save()
+    return inventory
+
+
+def low_supply(days=None, today=None):
+    """Inventories projected to run out within ``days`` that have not been reported yet"""
+    today = today or timezone.localdate()
+    days = settings.LOW_SUPPLY_DAYS if days is None else days
+    return MedicationInventory.objects.filter(
+        refill_alerted_at__isnull=True,
+        projected_runout_date__lte=today + timedelta(days=days),
+    )
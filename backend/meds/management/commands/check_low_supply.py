@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from meds.inventory import low_supply, refresh_daily_usage
+from meds.models import MedicationInventory
+
+
+class Command(BaseCommand):
+    help = 'Report medications projected to run out soon, across all users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.LOW_SUPPLY_DAYS,
+            help='Report supplies projected to run out within this many days',
+        )
+        parser.add_argument(
+            '--refresh-usage',
+            action='store_true',
+            help='Recompute every daily usage from the active schedules first (e.g. after medications ended)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List low supplies without marking them as reported',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['refresh_usage']:
+            medication_ids = MedicationInventory.objects.values_list('medication_id', flat=True)
+            for medication_id in medication_ids.iterator(chunk_size=2000):
+                refresh_daily_usage(medication_id, today)
+
+        inventories = list(
+            low_supply(options['days'], today)
+            .select_related('medication__user')
+            .order_by('projected_runout_date', 'id')
+        )
+        if not inventories:
+            self.stdout.write(self.style.SUCCESS('No medications running low.'))
+            return
+
+        prefix = 'DRY RUN: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.WARNING(
+            f"{prefix}{len(inventories)} medications run out within {options['days']} days:"
+        ))
+        for inventory in inventories:
+            medication = inventory.medication
+            self.stdout.write(
+                f'  - {medication.name} for {medication.user.username}: '
+                f'{inventory.quantity} {medication.dosage_unit} left, '
+                f'runs out {inventory.projected_runout_date}'
+            )
+
+        if not options['dry_run']:
+            # Reported rows leave the partial index until a refill clears the mark
+            MedicationInventory.objects.filter(id__in=[i.id for i in inventories]).update(
+                refill_alerted_at=timezone.now()
+            )
+            self.stdout.write(self.style.SUCCESS(f'Marked {len(inventories)} medications as reported.'))
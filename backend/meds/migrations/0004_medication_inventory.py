@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:41
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meds', '0003_rename_userid_medication_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicationInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0, message='Quantity cannot be negative')])),
+                ('daily_usage', models.DecimalField(decimal_places=3, default=0, max_digits=10)),
+                ('projected_runout_date', models.DateField(blank=True, null=True)),
+                ('refill_alerted_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='meds.medication')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refill_alerted_at__isnull', True)), fields=['projected_runout_date'], name='meds_inventory_runout_idx')],
+            },
+        ),
+    ]
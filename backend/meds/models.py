@@ -3,7 +3,8 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 from django.core.exceptions import ValidationError
-from datetime import date
+from datetime import date, timedelta
+from decimal import Decimal
 User = get_user_model()
 
 class Medication(models.Model):
@@ -42,6 +43,22 @@ class Medication(models.Model):
     end_date = models.DateField(blank=True, null=True)
     frequency = models.CharField(max_length=120, blank=True)  # e.g., "Once daily", "Twice a week"
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # What the daily usage of a tracked supply depends on (meds.inventory)
+    USAGE_FIELDS = ('dosage_amount', 'start_date', 'end_date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The usage fields as loaded, so save() can tell whether they changed
+        instance._loaded_usage = instance._usage()
+        return instance
+
+    def _usage(self):
+        """The values of the USAGE_FIELDS, None if one is deferred"""
+        if not all(f in self.__dict__ for f in self.USAGE_FIELDS):
+            return None
+        return tuple(getattr(self, f) for f in self.USAGE_FIELDS)
     
     def clean(self):
         """Custom validation for the model"""
@@ -59,5 +76,58 @@ class Medication(models.Model):
                 'start_date': 'Start date cannot be in the past.'
             })
     
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        super().save(*args, **kwargs)
+        usage = self._usage()
+        changed = usage is None or usage != getattr(self, '_loaded_usage', None)
+        self._loaded_usage = usage
+        if not is_new and changed:
+            from .inventory import refresh_daily_usage
+            refresh_daily_usage(self.pk)
+    
     def __str__(self):
         return f"{self.name} ({self.user})"
+
+
+class MedicationInventory(models.Model):
+    """
+    Supply on hand for a medication, in its ``dosage_unit``.
+
+    ``daily_usage`` is derived from the active schedules and only changes
+    when they (or the dosage) do; ``projected_runout_date`` is moved forward
+    from it whenever the quantity changes, so neither needs the adherence
+    history.
+    """
+    medication = models.OneToOneField(Medication, on_delete=models.CASCADE, related_name="inventory")
+    quantity = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0, message="Quantity cannot be negative")]
+    )
+    daily_usage = models.DecimalField(max_digits=10, decimal_places=3, default=0)
+    projected_runout_date = models.DateField(null=True, blank=True)
+    # Set when the low-supply job reports this row, cleared by a refill
+    refill_alerted_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The low-supply job only looks at rows it has not reported yet
+            models.Index(
+                fields=['projected_runout_date'],
+                name='meds_inventory_runout_idx',
+                condition=models.Q(refill_alerted_at__isnull=True),
+            ),
+        ]
+
+    def project(self, today=None):
+        """Recompute ``projected_runout_date`` from the quantity and ``daily_usage``"""
+        if self.daily_usage > 0:
+            today = today or date.today()
+            self.projected_runout_date = today + timedelta(days=int(Decimal(self.quantity) / self.daily_usage))
+        else:
+            self.projected_runout_date = None
+
+    def __str__(self):
+        return f"{self.medication.name}: {self.quantity} {self.medication.dosage_unit}"
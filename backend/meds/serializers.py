@@ -1,6 +1,9 @@
+from collections import defaultdict
 
 from rest_framework import serializers
-from .models import Medication
+from dosealert.fastlists import ValuesSerializer
+from schedules.models import Schedule
+from .models import Medication, MedicationInventory
 
 class MedicationSerializer(serializers.ModelSerializer):
     # Include related schedules (which contain reminder information)
@@ -10,3 +13,27 @@ class MedicationSerializer(serializers.ModelSerializer):
         model = Medication
         fields = "__all__"
         read_only_fields = ("user","created_at")
+
+class MedicationValuesSerializer(ValuesSerializer):
+    serializer_class = MedicationSerializer
+    related_fields = ('schedules',)
+
+    def fetch_schedules(self, pks):
+        labels = defaultdict(list)
+        for schedule in Schedule.objects.filter(medication__in=pks).select_related('medication'):
+            labels[schedule.medication_id].append(str(schedule))
+        return labels
+
+class MedicationInventorySerializer(serializers.ModelSerializer):
+    medication_name = serializers.CharField(source='medication.name', read_only=True)
+    dosage_unit = serializers.CharField(source='medication.dosage_unit', read_only=True)
+
+    class Meta:
+        model = MedicationInventory
+        fields = (
+            "medication", "medication_name", "quantity", "dosage_unit", "daily_usage",
+            "projected_runout_date", "refill_alerted_at", "updated_at",
+        )
+        read_only_fields = (
+            "medication", "daily_usage", "projected_runout_date", "refill_alerted_at", "updated_at",
+        )
@@ -1,13 +1,19 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from django.db import transaction
+from dosealert import metrics, versions
+from dosealert.syncbody import ExistingRows, sync_batches
+from dosealert.throttling import SyncThrottle
+from users.deletion import delete_medication
 from .models import Medication
 from .serializers import MedicationSerializer
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SyncThrottle])
 def sync_meds(request):
     """
     Synchronize a batch of medications from a client.
@@ -17,64 +23,73 @@ def sync_meds(request):
     - If ID is provided and 'is_deleted' is False/missing, updates the medication
     - If ID is null/missing and 'is_deleted' is False/missing, creates a new medication
     """
-    data = request.data
-    if not isinstance(data, list):
+    batches = sync_batches(request)
+    if batches is None:
         return Response({"error": "Request body must be a list of medication objects."}, status=status.HTTP_400_BAD_REQUEST)
 
     results = []
     
     try:
         with transaction.atomic():
-            for item_data in data:
-                med_id = item_data.get('id')
-                is_deleted = item_data.get('is_deleted', False)
+            for batch in batches:
+                # One query for the existing rows the batch refers to
+                meds = ExistingRows(Medication.objects.filter(user=request.user), batch)
+                for item_data in batch:
+                    med_id = item_data.get('id')
+                    is_deleted = item_data.get('is_deleted', False)
 
-                if is_deleted and med_id:
-                    # DELETE logic
-                    try:
-                        med = Medication.objects.get(id=med_id, user=request.user)
-                        med.delete()
-                        results.append({'status': 'deleted', 'id': med_id})
-                    except Medication.DoesNotExist:
-                        results.append({'status': 'error', 'id': med_id, 'errors': 'Medication not found for deletion.'})
-                elif is_deleted and not med_id:
-                    # Can't delete without an ID
-                    results.append({'status': 'error', 'id': None, 'errors': 'Cannot delete medication without ID.'})
-                elif med_id and not is_deleted:
-                    # UPDATE logic
-                    try:
-                        med = Medication.objects.get(id=med_id, user=request.user)
-                        # Remove sync-specific fields that shouldn't be saved to the model
-                        clean_data = {k: v for k, v in item_data.items() if k not in ['user', 'is_deleted']}
-                        serializer = MedicationSerializer(instance=med, data=clean_data, partial=True)
+                    if is_deleted and med_id:
+                        # DELETE logic
+                        med = meds.pop(med_id)
+                        if med is not None:
+                            delete_medication(med.id)
+                            results.append({'status': 'deleted', 'id': med_id})
+                        else:
+                            results.append({'status': 'error', 'id': med_id, 'errors': 'Medication not found for deletion.'})
+                    elif is_deleted and not med_id:
+                        # Can't delete without an ID
+                        results.append({'status': 'error', 'id': None, 'errors': 'Cannot delete medication without ID.'})
+                    elif med_id and not is_deleted:
+                        # UPDATE logic
+                        med = meds.get(med_id)
+                        if med is not None:
+                            # Remove sync-specific fields that shouldn't be saved to the model
+                            clean_data = {k: v for k, v in item_data.items() if k not in ['user', 'is_deleted']}
+                            serializer = MedicationSerializer(instance=med, data=clean_data, partial=True)
+                            if serializer.is_valid():
+                                serializer.save()
+                                results.append({'status': 'updated', 'id': med.id})
+                            else:
+                                results.append({'status': 'error', 'id': med_id, 'errors': serializer.errors})
+                        else:
+                            results.append({'status': 'error', 'id': med_id, 'errors': 'Medication not found.'})
+                    elif not med_id and not is_deleted:
+                        # CREATE logic
+                        clean_data = {k: v for k, v in item_data.items() if k not in ['id', 'user', 'is_deleted']}
+                        serializer = MedicationSerializer(data=clean_data)
                         if serializer.is_valid():
-                            serializer.save()
-                            results.append({'status': 'updated', 'id': med.id})
+                            new_med = serializer.save(user=request.user)
+                            results.append({'status': 'created', 'id': new_med.id})
                         else:
-                            results.append({'status': 'error', 'id': med_id, 'errors': serializer.errors})
-                    except Medication.DoesNotExist:
-                        results.append({'status': 'error', 'id': med_id, 'errors': 'Medication not found.'})
-                elif not med_id and not is_deleted:
-                    # CREATE logic
-                    clean_data = {k: v for k, v in item_data.items() if k not in ['id', 'user', 'is_deleted']}
-                    serializer = MedicationSerializer(data=clean_data)
-                    if serializer.is_valid():
-                        new_med = serializer.save(user=request.user)
-                        results.append({'status': 'created', 'id': new_med.id})
-                    else:
-                        results.append({'status': 'error', 'id': None, 'errors': serializer.errors})
+                            results.append({'status': 'error', 'id': None, 'errors': serializer.errors})
 
             # Check if any errors occurred during the loop
             has_errors = any(r['status'] == 'error' for r in results)
             if has_errors:
                 # If there are errors, roll back the entire transaction
                 raise Exception("Errors occurred during sync, rolling back all changes.")
+            versions.bump(request.user.id, 'medications')
 
     except Exception as e:
         # The transaction is rolled back here
+        metrics.record_sync('medications', results, committed=False)
+        if isinstance(e, APIException):
+            # Malformed or oversized body, answered by DRF (see dosealert.syncbody)
+            raise
         return Response({
             'error': str(e),
             'details': [r for r in results if r['status'] == 'error']
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    metrics.record_sync('medications', results, committed=True)
     return Response(results, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -1,10 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
-from .models import Medication
-from .serializers import MedicationSerializer
+from dosealert.fastlists import ValuesListMixin
+from dosealert.replicas import replica_reads
+from dosealert.versions import VersionedListMixin
+from reminders.models import Reminder
+from schedules.models import Schedule
+from users.deletion import delete_medication, queue_deletion
+from users.serializers import DeletionJobSerializer
+from .inventory import restock
+from .models import Medication, MedicationInventory
+from .serializers import MedicationInventorySerializer, MedicationSerializer, MedicationValuesSerializer
 
-class MedicationViewSet(ModelViewSet):
+@replica_reads
+class MedicationViewSet(VersionedListMixin, ValuesListMixin, ModelViewSet):
     serializer_class = MedicationSerializer
+    values_serializer_class = MedicationValuesSerializer
+    version_collection = version_resource = 'medications'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -12,3 +31,48 @@ class MedicationViewSet(ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        """Delete the medication and its history, in the background when it has many reminders"""
+        medication = self.get_object()
+        reminders = Reminder.objects.filter(Q(schedule__medication=medication) | Q(medication=medication))
+        if reminders.count() > settings.DELETION_INLINE_LIMIT:
+            # No new doses of it while the job runs
+            Schedule.objects.filter(medication=medication).update(active=False)
+            job = queue_deletion(request.user, 'medication', medication.id)
+            return Response(DeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        delete_medication(medication.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get', 'put', 'delete'])
+    def inventory(self, request, pk=None):
+        """Get, set (refill or recount) or stop tracking the supply on hand"""
+        medication = self.get_object()
+        inventory = MedicationInventory.objects.select_related('medication').filter(medication=medication).first()
+        if request.method == 'PUT':
+            serializer = MedicationInventorySerializer(instance=inventory, data=request.data)
+            serializer.is_valid(raise_exception=True)
+            inventory = restock(medication, serializer.validated_data['quantity'])
+            return Response(MedicationInventorySerializer(inventory).data)
+        if inventory is None:
+            return Response(
+                {'error': 'Supply is not tracked for this medication.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if request.method == 'DELETE':
+            inventory.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(MedicationInventorySerializer(inventory).data)
+
+    @action(detail=False, methods=['get'], url_path='low-supply')
+    def low_supply(self, request):
+        """Tracked medications projected to run out within LOW_SUPPLY_DAYS (or ``days``)"""
+        try:
+            days = int(request.query_params.get('days', settings.LOW_SUPPLY_DAYS))
+        except ValueError:
+            return Response({'error': "'days' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        inventories = MedicationInventory.objects.filter(
+            medication__user=request.user,
+            projected_runout_date__lte=timezone.localdate() + timedelta(days=days),
+        ).select_related('medication').order_by('projected_runout_date')
+        return Response(MedicationInventorySerializer(inventories, many=True).data)
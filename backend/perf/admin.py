@@ -0,0 +1,44 @@
+from django.contrib import admin
+from django.utils.html import format_html, format_html_join
+
+from .models import ProfiledRequest
+
+
+@admin.register(ProfiledRequest)
+class ProfiledRequestAdmin(admin.ModelAdmin):
+    list_display = (
+        'created_at', 'method', 'path', 'status_code', 'duration_ms',
+        'query_count', 'sql_ms', 'duplicate_count', 'similar_count', 'trigger', 'user',
+    )
+    list_filter = ('trigger', 'method', 'status_code')
+    search_fields = ('path', 'view_name')
+    fields = (
+        'created_at', 'trigger', 'user', 'method', 'path', 'view_name', 'status_code',
+        'duration_ms', 'sql_ms', 'query_count', 'duplicate_count', 'similar_count',
+        'sql_table', 'call_tree_text',
+    )
+    readonly_fields = fields
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='SQL (duplicates / similar in the request)')
+    def sql_table(self, obj):
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td><code>{}</code></td></tr>',
+            ((i, q['ms'], q['duplicates'], q['similar'], q['sql']) for i, q in enumerate(obj.queries, 1)),
+        )
+        return format_html(
+            '<table><thead><tr><th>#</th><th>ms</th><th>dup</th><th>similar</th><th>SQL</th></tr></thead>'
+            '<tbody>{}</tbody></table>',
+            rows,
+        )
+
+    @admin.display(description='Call tree')
+    def call_tree_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', obj.call_tree)
@@ -0,0 +1,333 @@
+"""
+API benchmark harness.
+
+Every endpoint in ``ENDPOINTS`` is requested through Django's test client
+against a synthetic dataset. Each request runs inside a transaction that is
+rolled back, so write endpoints can be repeated against identical state.
+Per endpoint we record the query count, p50/p95 latency and the peak Python
+memory allocated while handling one request.
+"""
+import json
+import statistics
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import timedelta
+from time import perf_counter
+
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, get_resolver, resolve
+from django.urls.resolvers import URLResolver
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from adherence.models import AdherenceRecord, AdherenceStreak
+from meds.models import Medication
+from reminders.models import Reminder
+from schedules.models import Schedule
+from users.models import DeletionJob
+from webhooks.models import WebhookEndpoint
+
+from .factories import PASSWORD
+
+# Routes that are not part of the API surface being benchmarked
+# Event streams never finish, so they cannot be timed
+IGNORED_ROUTE_PREFIXES = ("admin/", "api/events/")
+
+# Set as METRICS_TOKEN while benchmarking, since /metrics needs one
+METRICS_TOKEN = "benchmark"
+FORMAT_SUFFIXES = ("(?P<format>", "<drf_format_suffix:format>")
+
+# The runner's own BEGIN/ROLLBACK are not part of the endpoint's cost
+TRANSACTION_STATEMENTS = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK")
+
+# Ignore regressions smaller than these, they are measurement noise
+LATENCY_NOISE_MS = 3.0
+MEMORY_NOISE_KB = 64.0
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    body: object = None
+    auth: bool = True
+    expect: tuple = (200,)
+    iterations: int = None
+    headers: dict = None
+
+
+@dataclass
+class BenchmarkContext:
+    """Ids of rows owned by the benchmark user, used to fill endpoint paths and bodies"""
+    username: str
+    access: str
+    refresh: str
+    medication: int
+    schedule: int
+    reminder: int
+    open_reminder: int
+    record: int
+    streak: int
+    deletion: int
+    webhook: int
+    extra: dict = field(default_factory=dict)
+
+    def format(self, value):
+        if isinstance(value, str):
+            return value.format(ctx=self)
+        if isinstance(value, list):
+            return [self.format(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.format(v) for k, v in value.items()}
+        return value
+
+
+def build_context(username):
+    from django.contrib.auth import get_user_model
+
+    user = get_user_model().objects.get(username=username)
+    refresh = RefreshToken.for_user(user)
+    record = AdherenceRecord.objects.filter(user=user).exclude(status='pending').first()
+    open_reminder = (
+        Reminder.objects.filter(schedule__user=user, scheduled_at__lte=timezone.now())
+        .filter(adherence_record__status='pending').order_by('-scheduled_at').first()
+        or Reminder.objects.filter(schedule__user=user, adherence_record__isnull=True).first()
+    )
+    return BenchmarkContext(
+        username=username,
+        access=str(refresh.access_token),
+        refresh=str(refresh),
+        medication=Medication.objects.filter(user=user).latest('id').id,
+        schedule=Schedule.objects.filter(user=user).latest('id').id,
+        reminder=Reminder.objects.filter(schedule__user=user).latest('id').id,
+        open_reminder=open_reminder.id if open_reminder else 0,
+        record=record.id,
+        streak=AdherenceStreak.objects.filter(user=user).first().id,
+        deletion=DeletionJob.objects.get_or_create(
+            user=user, kind='reminders', target_id=user.id, defaults={'status': 'done'},
+        )[0].id,
+        webhook=WebhookEndpoint.objects.get_or_create(user=user, url='https://127.0.0.1/dosealert')[0].id,
+    )
+
+
+TOMORROW = (timezone.now() + timedelta(days=1)).date().isoformat()
+
+ENDPOINTS = [
+    Endpoint("api-root", "GET", "/api/"),
+    Endpoint("metrics", "GET", "/metrics", auth=False, headers={"HTTP_AUTHORIZATION": f"Bearer {METRICS_TOKEN}"}),
+
+    # Auth and users
+    Endpoint("auth-token", "POST", "/api/auth/token/",
+             {"username": "{ctx.username}", "password": PASSWORD}, auth=False, iterations=5),
+    Endpoint("auth-refresh", "POST", "/api/auth/refresh/", {"refresh": "{ctx.refresh}"}, auth=False),
+    Endpoint("users-register", "POST", "/api/users/register/", {
+        "username": "bench-new", "email": "bench-new@example.com",
+        "password": "Xq7!benchmark-pass", "password_confirm": "Xq7!benchmark-pass",
+    }, auth=False, expect=(201,), iterations=5),
+    Endpoint("users-login", "POST", "/api/users/login/",
+             {"username": "{ctx.username}", "password": PASSWORD}, auth=False, iterations=5),
+    Endpoint("users-logout", "POST", "/api/users/logout/", {"refresh": "{ctx.refresh}"}),
+    Endpoint("users-profile", "GET", "/api/users/profile/"),
+    Endpoint("users-profile-update", "PATCH", "/api/users/profile/", {"first_name": "Bench"}),
+    Endpoint("users-token-refresh", "POST", "/api/users/token/refresh/", {"refresh": "{ctx.refresh}"}, auth=False),
+    Endpoint("users-deletion", "GET", "/api/users/deletions/{ctx.deletion}/"),
+
+    # Medications
+    Endpoint("meds-list", "GET", "/api/meds/"),
+    Endpoint("meds-create", "POST", "/api/meds/", {"name": "Bench Med", "start_date": TOMORROW}, expect=(201,)),
+    Endpoint("meds-detail", "GET", "/api/meds/{ctx.medication}/"),
+    Endpoint("meds-update", "PATCH", "/api/meds/{ctx.medication}/", {"notes": "benchmark"}),
+    Endpoint("meds-delete", "DELETE", "/api/meds/{ctx.medication}/", expect=(204,)),
+    Endpoint("meds-inventory", "PUT", "/api/meds/{ctx.medication}/inventory/", {"quantity": 60}),
+    Endpoint("meds-low-supply", "GET", "/api/meds/low-supply/"),
+    Endpoint("meds-sync", "POST", "/api/meds/sync/", [
+        {"id": "{ctx.medication}", "notes": "synced"},
+        {"name": "Bench Sync Med", "start_date": TOMORROW},
+    ]),
+
+    # Schedules
+    Endpoint("schedules-list", "GET", "/api/schedules/"),
+    Endpoint("schedules-create", "POST", "/api/schedules/",
+             {"medication": "{ctx.medication}", "time_of_day": "09:00:00"}, expect=(201,)),
+    Endpoint("schedules-detail", "GET", "/api/schedules/{ctx.schedule}/"),
+    Endpoint("schedules-update", "PATCH", "/api/schedules/{ctx.schedule}/", {"days_of_week": "Mon,Wed,Fri"}),
+    Endpoint("schedules-delete", "DELETE", "/api/schedules/{ctx.schedule}/", expect=(204,)),
+    Endpoint("schedules-upcoming", "GET", "/api/schedules/upcoming/"),
+    Endpoint("schedules-sync", "POST", "/api/schedules/sync/", [
+        {"id": "{ctx.schedule}", "days_of_week": "Mon,Tue"},
+        {"medication": "{ctx.medication}", "time_of_day": "21:00:00"},
+    ]),
+
+    # Reminders
+    Endpoint("reminders-list", "GET", "/api/reminders/"),
+    Endpoint("reminders-create", "POST", "/api/reminders/",
+             {"schedule": "{ctx.schedule}", "scheduled_at": TOMORROW + "T09:00:00Z"}, expect=(201,)),
+    Endpoint("reminders-detail", "GET", "/api/reminders/{ctx.reminder}/"),
+    Endpoint("reminders-update", "PATCH", "/api/reminders/{ctx.reminder}/", {"status": "sent"}),
+    Endpoint("reminders-delete", "DELETE", "/api/reminders/{ctx.reminder}/", expect=(204,)),
+    Endpoint("reminders-delete-all", "DELETE", "/api/reminders/delete_all/", expect=(204,)),
+    Endpoint("reminders-sync", "POST", "/api/reminders/sync/", [
+        {"id": "{ctx.reminder}", "status": "sent"},
+        {"schedule": "{ctx.schedule}", "scheduled_at": TOMORROW + "T10:00:00Z"},
+    ]),
+
+    # Adherence
+    Endpoint("adherence-root", "GET", "/api/adherence/"),
+    Endpoint("adherence-records-list", "GET", "/api/adherence/records/"),
+    Endpoint("adherence-records-detail", "GET", "/api/adherence/records/{ctx.record}/"),
+    Endpoint("adherence-records-update", "PATCH", "/api/adherence/records/{ctx.record}/", {"notes": "benchmark"}),
+    Endpoint("adherence-records-delete", "DELETE", "/api/adherence/records/{ctx.record}/", expect=(204,)),
+    Endpoint("adherence-records-pending", "GET", "/api/adherence/records/pending/"),
+    Endpoint("adherence-records-overdue", "GET", "/api/adherence/records/overdue/"),
+    Endpoint("adherence-streaks-list", "GET", "/api/adherence/streaks/"),
+    Endpoint("adherence-streaks-detail", "GET", "/api/adherence/streaks/{ctx.streak}/"),
+    Endpoint("adherence-heatmap", "GET", "/api/adherence/heatmap/"),
+    Endpoint("adherence-respond", "POST", "/api/adherence/respond/",
+             {"reminder_id": "{ctx.open_reminder}", "status": "taken"}),
+    Endpoint("adherence-summary", "GET", "/api/adherence/summary/"),
+    Endpoint("adherence-report", "GET", "/api/adherence/report/"),
+    Endpoint("adherence-dashboard", "GET", "/api/adherence/dashboard/"),
+    Endpoint("adherence-sync", "POST", "/api/adherence/sync/", [
+        {"id": "{ctx.record}", "notes": "synced"},
+    ]),
+
+    # Analytics
+    Endpoint("analytics-summary", "GET", "/api/analytics/summary/"),
+
+    # Webhooks
+    Endpoint("webhooks-root", "GET", "/api/webhooks/"),
+    Endpoint("webhooks-list", "GET", "/api/webhooks/endpoints/"),
+    Endpoint("webhooks-create", "POST", "/api/webhooks/endpoints/",
+             {"url": "https://127.0.0.1/bench", "event_types": ["adherence.missed"]}, expect=(201,)),
+    Endpoint("webhooks-detail", "GET", "/api/webhooks/endpoints/{ctx.webhook}/"),
+    Endpoint("webhooks-update", "PATCH", "/api/webhooks/endpoints/{ctx.webhook}/", {"is_active": False}),
+    Endpoint("webhooks-delete", "DELETE", "/api/webhooks/endpoints/{ctx.webhook}/", expect=(204,)),
+    Endpoint("webhooks-deliveries", "GET", "/api/webhooks/endpoints/{ctx.webhook}/deliveries/"),
+]
+
+
+def iter_routes(patterns=None, prefix=""):
+    """Yield the full route string of every URL pattern, as ``ResolverMatch.route`` reports it"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        # Django drops the leading "^" of regex patterns when joining routes
+        route = prefix + str(pattern.pattern).removeprefix("^")
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        else:
+            yield route
+
+
+def _is_shadowed(route):
+    """A literal route that resolves to an earlier pattern can never be reached"""
+    if any(c in route for c in '<($'):
+        return False
+    try:
+        return resolve('/' + route).route != route
+    except Resolver404:
+        return False
+
+
+def uncovered_routes(endpoints=ENDPOINTS, ctx=None):
+    """Routes in the URLconf that no benchmark endpoint exercises"""
+    covered = {resolve(ctx.format(e.path) if ctx else e.path).route for e in endpoints}
+    return sorted(
+        route for route in set(iter_routes())
+        if route not in covered
+        and not route.startswith(IGNORED_ROUTE_PREFIXES)
+        and not any(suffix in route for suffix in FORMAT_SUFFIXES)
+        and not _is_shadowed(route)
+    )
+
+
+def _percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+class BenchmarkRunner:
+    def __init__(self, ctx, iterations=20):
+        self.ctx = ctx
+        self.iterations = iterations
+        self.client = Client()
+
+    def _request(self, endpoint):
+        kwargs = {'secure': True}
+        if endpoint.auth:
+            kwargs['HTTP_AUTHORIZATION'] = f"Bearer {self.ctx.access}"
+        kwargs.update(endpoint.headers or {})
+        body = self.ctx.format(endpoint.body)
+        data = json.dumps(body) if body is not None else ''
+        with transaction.atomic():
+            response = self.client.generic(
+                endpoint.method, self.ctx.format(endpoint.path), data,
+                content_type='application/json', **kwargs
+            )
+            if response.streaming:
+                # Streamed bodies are produced lazily; time them with the request
+                b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        return response
+
+    def run(self, endpoint):
+        # Query count (doubles as warm-up); read it before the next request resets the log
+        with CaptureQueriesContext(connection) as queries:
+            response = self._request(endpoint)
+        query_count = sum(
+            1 for q in queries.captured_queries
+            if not q['sql'].startswith(TRANSACTION_STATEMENTS)
+        )
+        if response.status_code not in endpoint.expect:
+            raise RuntimeError(
+                f"{endpoint.name}: {endpoint.method} {endpoint.path} returned "
+                f"{response.status_code}: {response.content[:300]!r}"
+            )
+
+        # Peak memory for a single request
+        tracemalloc.start()
+        self._request(endpoint)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        samples = []
+        for _ in range(endpoint.iterations or self.iterations):
+            start = perf_counter()
+            self._request(endpoint)
+            samples.append((perf_counter() - start) * 1000)
+
+        return {
+            'method': endpoint.method,
+            'path': endpoint.path,
+            'queries': query_count,
+            'p50_ms': round(_percentile(samples, 50), 3),
+            'p95_ms': round(_percentile(samples, 95), 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+
+def compare(baseline, results, threshold):
+    """
+    List regressions of ``results`` against ``baseline``.
+
+    Any increase in query count is a regression; median latency and memory
+    regress when they exceed the baseline by more than ``threshold`` (a
+    fraction) and by more than the noise floor. p95 is recorded but too
+    noisy at a few dozen samples to gate on.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+        for metric, noise in (('p50_ms', LATENCY_NOISE_MS), ('peak_kb', MEMORY_NOISE_KB)):
+            limit = base[metric] * (1 + threshold)
+            if result[metric] > limit and result[metric] - base[metric] > noise:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+    return regressions
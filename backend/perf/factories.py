@@ -0,0 +1,292 @@
+"""
+Synthetic data factory for benchmarks and capacity planning.
+
+Generates users with medications, schedules, reminders, adherence records
+and streaks using realistic distributions: several doses a day, weekday
+patterns in ``days_of_week``, a taken/missed/skipped mix with lateness, and
+a share of medications that have already ended. Rows are built in user
+batches and handed to a writer, so memory stays flat however many users
+are generated.
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils import timezone
+
+from adherence.calendars import build_calendars
+from adherence.models import AdherenceCalendar, AdherenceRecord, AdherenceStreak
+from meds.models import Medication
+from reminders.models import Reminder
+from schedules.models import Schedule
+
+User = get_user_model()
+
+# Dose slots, in the order a multi-dose regimen fills them
+DOSE_TIMES = [time(8, 0), time(20, 0), time(13, 0), time(22, 0), time(6, 30)]
+
+WEEKDAY_PATTERNS = [
+    ("Mon,Tue,Wed,Thu,Fri,Sat,Sun", 70),
+    ("Mon,Tue,Wed,Thu,Fri", 12),
+    ("Mon,Wed,Fri", 10),
+    ("Sun", 5),
+    ("Sat,Sun", 3),
+]
+
+STATUS_WEIGHTS = [("taken", 80), ("missed", 13), ("skipped", 7)]
+
+MEDICATION_NAMES = [
+    "Lisinopril", "Metformin", "Atorvastatin", "Levothyroxine", "Amlodipine",
+    "Omeprazole", "Sertraline", "Vitamin D", "Ibuprofen", "Amoxicillin",
+]
+
+DAY_INDEX = {'Mon': 0, 'Tue': 1, 'Wed': 2, 'Thu': 3, 'Fri': 4, 'Sat': 5, 'Sun': 6}
+
+PASSWORD = "benchmark-password"
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 10
+    meds_per_user: int = 3
+    schedules_per_med: int = 2    # dose times per medication, on a single schedule row
+    days: int = 30
+    expired_ratio: float = 0.15
+    seed: int = 0
+    username_prefix: str = "bench"
+
+
+class BulkCreateWriter:
+    """Persist generated rows with ``bulk_create``, which fills in primary keys"""
+
+    def __init__(self, batch_size=2000):
+        self.batch_size = batch_size
+
+    def write(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        return objs
+
+
+class CopyWriter:
+    """
+    Persist generated rows with PostgreSQL ``COPY ... FROM STDIN``.
+
+    COPY cannot return generated keys, so primary keys are reserved from the
+    table's sequence up front and assigned to the objects before streaming,
+    which keeps foreign keys between batches consistent and the sequences
+    correct afterwards. Requires psycopg 3.
+    """
+
+    # Field types whose Python values psycopg adapts directly; everything
+    # else goes through the field's own get_db_prep_save()
+    PASSTHROUGH_TYPES = {
+        'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'BooleanField',
+        'CharField', 'TextField', 'DateField', 'DateTimeField', 'TimeField',
+        'DecimalField', 'ForeignKey', 'OneToOneField',
+    }
+
+    def write(self, model, objs):
+        if not objs:
+            return objs
+        conn = connections[DEFAULT_DB_ALIAS]
+        meta = model._meta
+        table = meta.db_table
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [table, meta.pk.column, len(objs)]
+            )
+            for obj, (pk,) in zip(objs, cursor.fetchall()):
+                obj.pk = pk
+
+            fields = meta.local_concrete_fields
+            prepared = [
+                (f, f.get_internal_type() not in self.PASSTHROUGH_TYPES) for f in fields
+            ]
+            columns = ", ".join(conn.ops.quote_name(f.column) for f in fields)
+            statement = f"COPY {conn.ops.quote_name(table)} ({columns}) FROM STDIN"
+            with cursor.copy(statement) as copy:
+                for obj in objs:
+                    copy.write_row([
+                        f.get_db_prep_save(f.pre_save(obj, True), conn) if prep else f.pre_save(obj, True)
+                        for f, prep in prepared
+                    ])
+        return objs
+
+
+def default_writer(batch_size=2000):
+    """COPY on PostgreSQL with psycopg 3, ``bulk_create`` everywhere else"""
+    if connection.vendor == 'postgresql':
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+        if is_psycopg3:
+            return CopyWriter()
+    return BulkCreateWriter(batch_size)
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+def update_streak_counts(streak, status):
+    """In-memory mirror of ``AdherenceStreak.update_streak`` without the save"""
+    if status == 'taken':
+        streak.current_taken_streak += 1
+        streak.current_missed_streak = 0
+        streak.total_taken += 1
+        streak.longest_taken_streak = max(streak.longest_taken_streak, streak.current_taken_streak)
+    elif status in ('missed', 'skipped'):
+        streak.current_missed_streak += 1
+        streak.current_taken_streak = 0
+        streak.total_missed += 1
+        streak.longest_missed_streak = max(streak.longest_missed_streak, streak.current_missed_streak)
+    streak.total_scheduled += 1
+
+
+class DatasetFactory:
+    """
+    Generate a dataset described by a ``DatasetSpec``.
+
+    ``build()`` creates users ``[start, stop)`` of the spec so that several
+    processes can each generate a disjoint partition of one dataset.
+    """
+
+    def __init__(self, spec, writer=None, now=None, user_batch=100):
+        self.spec = spec
+        self.writer = writer or BulkCreateWriter()
+        self.now = now or timezone.now()
+        self.user_batch = user_batch
+        self.password_hash = make_password(PASSWORD)
+
+    def build(self, start=0, stop=None, progress=None):
+        stop = self.spec.users if stop is None else stop
+        counts = Counter()
+        for batch_start in range(start, stop, self.user_batch):
+            batch_stop = min(batch_start + self.user_batch, stop)
+            # Seed per batch so partitions generate the same rows as a single run
+            rng = random.Random(f"{self.spec.seed}:{batch_start}")
+            with transaction.atomic():
+                counts.update(self._build_batch(rng, batch_start, batch_stop))
+            if progress:
+                progress(batch_stop - start, stop - start, counts)
+        return counts
+
+    def _build_batch(self, rng, start, stop):
+        spec = self.spec
+        today = self.now.date()
+        window_start = today - timedelta(days=spec.days)
+
+        users = self.writer.write(User, [
+            User(
+                username=f"{spec.username_prefix}{i}",
+                email=f"{spec.username_prefix}{i}@example.com",
+                password=self.password_hash,
+                date_joined=self.now,
+            )
+            for i in range(start, stop)
+        ])
+
+        medications = []
+        for user in users:
+            for m in range(spec.meds_per_user):
+                expired = rng.random() < spec.expired_ratio
+                end_date = today - timedelta(days=rng.randint(1, max(spec.days // 2, 1))) if expired else None
+                medications.append(Medication(
+                    user=user,
+                    name=f"{rng.choice(MEDICATION_NAMES)} {m + 1}",
+                    dosage_amount=Decimal(rng.choice(["1.00", "2.00", "0.50", "10.00"])),
+                    dosage_unit=rng.choice(["pills", "pills", "mg", "ml"]),
+                    start_date=window_start,
+                    end_date=end_date,
+                    frequency=f"{spec.schedules_per_med} times daily",
+                ))
+        self.writer.write(Medication, medications)
+
+        schedules = []
+        for med in medications:
+            times = sorted({DOSE_TIMES[slot % len(DOSE_TIMES)] for slot in range(spec.schedules_per_med)})
+            schedules.append(Schedule(
+                user_id=med.user_id,
+                medication=med,
+                time_of_day=times[0],
+                times_of_day=[t.isoformat() for t in times],
+                days_of_week=_weighted(rng, WEEKDAY_PATTERNS),
+                active=med.end_date is None,
+            ))
+        self.writer.write(Schedule, schedules)
+
+        reminders = []
+        for schedule in schedules:
+            weekdays = {DAY_INDEX[d] for d in schedule.days_of_week.split(',')}
+            dose_times = schedule.get_times()
+            last_day = schedule.medication.end_date or today + timedelta(days=1)
+            day = window_start
+            while day <= last_day:
+                if day.weekday() in weekdays:
+                    for dose_time in dose_times:
+                        scheduled_at = timezone.make_aware(datetime.combine(day, dose_time))
+                        past = scheduled_at <= self.now
+                        reminders.append(Reminder(
+                            schedule=schedule,
+                            medication_id=schedule.medication_id,
+                            scheduled_at=scheduled_at,
+                            sent_at=scheduled_at if past else None,
+                            status="sent" if past else "pending",
+                        ))
+                day += timedelta(days=1)
+        self.writer.write(Reminder, reminders)
+
+        records = []
+        streaks = {}
+        past_reminders = sorted(
+            (r for r in reminders if r.scheduled_at <= self.now),
+            key=lambda r: r.scheduled_at
+        )
+        for reminder in past_reminders:
+            user_id = reminder.schedule.user_id
+            record = AdherenceRecord(
+                user_id=user_id,
+                medication_id=reminder.medication_id,
+                reminder=reminder,
+                scheduled_time=reminder.scheduled_at,
+            )
+            if self.now - reminder.scheduled_at < timedelta(hours=6):
+                # Recent doses the user has not answered yet
+                record.status = 'pending'
+            else:
+                record.status = _weighted(rng, STATUS_WEIGHTS)
+                # Most doses are on time, a tail is taken hours late
+                delay = int(rng.expovariate(1 / 20))
+                record.response_time = reminder.scheduled_at + timedelta(minutes=delay)
+                if record.status == 'taken':
+                    record.actual_time = record.response_time
+                    record.minutes_late = delay
+                    record.is_late = delay > 30
+
+                key = (user_id, reminder.medication_id)
+                if key not in streaks:
+                    streaks[key] = AdherenceStreak(user_id=user_id, medication_id=reminder.medication_id)
+                update_streak_counts(streaks[key], record.status)
+            records.append(record)
+        self.writer.write(AdherenceRecord, records)
+        self.writer.write(AdherenceStreak, list(streaks.values()))
+        calendars = build_calendars(
+            (r.user_id, r.medication_id, timezone.localtime(r.scheduled_time).date(), r.status, 1)
+            for r in records
+        )
+        self.writer.write(AdherenceCalendar, calendars)
+
+        return Counter({
+            'users': len(users),
+            'medications': len(medications),
+            'schedules': len(schedules),
+            'reminders': len(reminders),
+            'adherence_records': len(records),
+            'adherence_streaks': len(streaks),
+            'adherence_calendars': len(calendars),
+        })
@@ -0,0 +1,146 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from perf.benchmark import ENDPOINTS, METRICS_TOKEN, BenchmarkRunner, build_context, compare, uncovered_routes
+from perf.factories import DatasetFactory, DatasetSpec
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), '..', '..', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API endpoint against a synthetic dataset in a throwaway '
+        'test database, recording query count, p50/p95 latency and peak memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Synthetic users to generate')
+        parser.add_argument('--meds', type=int, default=3, help='Medications per user')
+        parser.add_argument('--schedules', type=int, default=2, help='Daily doses per medication (times on one schedule)')
+        parser.add_argument('--days', type=int, default=30, help='Days of reminder/adherence history')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--only', nargs='*', help='Benchmark only these endpoint names')
+        parser.add_argument(
+            '--baseline',
+            default=os.path.normpath(DEFAULT_BASELINE),
+            help='Baseline JSON file to compare against (written if missing)',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.5,
+            help='Allowed latency/memory growth over the baseline as a fraction (default 0.5)',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Write the results as the new baseline instead of comparing',
+        )
+        parser.add_argument(
+            '--require-baseline',
+            action='store_true',
+            help='Fail when the baseline file is missing instead of writing it (for CI)',
+        )
+        parser.add_argument('--output', help='Also write the raw results to this JSON file')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline']
+        if options['require_baseline'] and not options['update_baseline'] and not os.path.exists(baseline_path):
+            raise CommandError(f'No baseline at {baseline_path}; record one with --update-baseline')
+
+        spec = DatasetSpec(
+            users=options['users'],
+            meds_per_user=options['meds'],
+            schedules_per_med=options['schedules'],
+            days=options['days'],
+            seed=options['seed'],
+        )
+        endpoints = [e for e in ENDPOINTS if not options['only'] or e.name in options['only']]
+
+        # One client requests every endpoint many times: keep the throttles
+        # running, since they are part of each request's cost, but never reject
+        unthrottled = override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {scope: '1000000/min' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+        })
+        # The benchmark's webhook URLs point at this machine, so no DNS is needed
+        local_webhooks = override_settings(WEBHOOK_ALLOW_PRIVATE_ADDRESSES=True)
+        metrics_token = override_settings(METRICS_TOKEN=METRICS_TOKEN)
+
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'], aliases={'default'})
+        unthrottled.enable()
+        local_webhooks.enable()
+        metrics_token.enable()
+        try:
+            counts = DatasetFactory(spec).build()
+            self.stdout.write('Dataset: ' + ', '.join(f'{k}={v}' for k, v in counts.items()))
+
+            ctx = build_context(f'{spec.username_prefix}0')
+            if not options['only']:
+                for route in uncovered_routes(ctx=ctx):
+                    self.stdout.write(self.style.WARNING(f'No benchmark for route: {route}'))
+
+            runner = BenchmarkRunner(ctx, iterations=options['iterations'])
+            results = {}
+            self.stdout.write(f"{'endpoint':32} {'queries':>7} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>9}")
+            for endpoint in endpoints:
+                try:
+                    result = runner.run(endpoint)
+                except RuntimeError as e:
+                    raise CommandError(str(e))
+                results[endpoint.name] = result
+                self.stdout.write(
+                    f"{endpoint.name:32} {result['queries']:>7} {result['p50_ms']:>9} "
+                    f"{result['p95_ms']:>9} {result['peak_kb']:>9}"
+                )
+        finally:
+            metrics_token.disable()
+            local_webhooks.disable()
+            unthrottled.disable()
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        document = {
+            'dataset': spec.__dict__,
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }
+        if options['output']:
+            self._write(options['output'], document)
+
+        if options['update_baseline'] or not os.path.exists(baseline_path):
+            self._write(baseline_path, document)
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get('dataset') != document['dataset']:
+            self.stdout.write(self.style.WARNING(
+                'Baseline was recorded with a different dataset; comparison may not be meaningful.'
+            ))
+
+        regressions = compare(baseline.get('endpoints', {}), results, options['threshold'])
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f'  - {line}')
+            raise CommandError(f'{len(regressions)} benchmark regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}'))
+
+    def _write(self, path, document):
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,83 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from meds.models import Medication
+from perf.factories import DOSE_TIMES, WEEKDAY_PATTERNS
+from schedules.expansion import iter_occurrences
+from schedules.models import Schedule
+from schedules.recurrence import compile_rule
+
+# Mix of rules expanded by the benchmark; "" is a plain days_of_week schedule
+RULES = [
+    ("", 50),
+    ("FREQ=DAILY;INTERVAL=2", 10),
+    ("FREQ=DAILY;BYHOUR=8,14,20;BYMINUTE=0", 10),
+    ("FREQ=HOURLY;INTERVAL=8", 5),
+    ("FREQ=WEEKLY;BYDAY=MO,TH", 10),
+    ("FREQ=MONTHLY;BYMONTHDAY=1", 5),
+    ("FREQ=MONTHLY;BYDAY=-1FR", 5),
+    ("FREQ=DAILY;COUNT=60", 5),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure schedule expansion throughput (expansions and occurrences per second) in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedules', type=int, default=100000, help='Schedules to expand')
+        parser.add_argument('--days', type=int, default=14, help='Window length in days')
+        parser.add_argument('--history-days', type=int, default=730, help='Spread of medication start dates')
+        parser.add_argument('--passes', type=int, default=2, help='Passes over all schedules (first one is cold)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        today = timezone.localdate()
+        rules, weights = zip(*RULES)
+        patterns, pattern_weights = zip(*WEEKDAY_PATTERNS)
+
+        # Unsaved instances: expansion never touches the database
+        schedules = []
+        for i in range(options['schedules']):
+            medication = Medication(
+                id=i + 1,
+                name=f"Medication {i}",
+                start_date=today - timedelta(days=rng.randint(0, options['history_days'])),
+            )
+            times = sorted(rng.sample(DOSE_TIMES, rng.choices([1, 2, 3], [60, 30, 10])[0]))
+            schedules.append(Schedule(
+                id=i + 1,
+                medication=medication,
+                time_of_day=times[0],
+                times_of_day=[t.isoformat() for t in times],
+                days_of_week=rng.choices(patterns, pattern_weights)[0],
+                recurrence=rng.choices(rules, weights)[0],
+            ))
+
+        start = timezone.now()
+        end = start + timedelta(days=options['days'])
+        compile_rule.cache_clear()
+        self.stdout.write(
+            f"Expanding {len(schedules)} schedules over {options['days']} days "
+            f"({sum(1 for s in schedules if s.recurrence)} with RRULEs)..."
+        )
+        for n in range(options['passes']):
+            started = time.perf_counter()
+            occurrences = 0
+            for schedule in schedules:
+                for _ in iter_occurrences(schedule, start, end):
+                    occurrences += 1
+            elapsed = time.perf_counter() - started
+            label = 'cold' if n == 0 else 'warm'
+            self.stdout.write(
+                f"  pass {n + 1} ({label}): {elapsed:.2f}s, "
+                f"{len(schedules) / elapsed:,.0f} expansions/s, {occurrences / elapsed:,.0f} occurrences/s"
+            )
+        info = compile_rule.cache_info()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rule cache: {info.hits} hits, {info.misses} misses, {info.currsize} entries"
+        ))
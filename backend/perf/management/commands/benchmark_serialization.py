@@ -0,0 +1,102 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from adherence.models import AdherenceRecord
+from adherence.reports import get_report
+from adherence.serializers import AdherenceRecordSerializer
+from dosealert.parsers import MessagePackParser, ORJSONParser
+from dosealert.renderers import MessagePackRenderer, ORJSONRenderer
+from perf.factories import DatasetFactory, DatasetSpec
+
+# name -> (renderer, parser); the first one is the baseline
+FORMATS = {
+    'drf-json': (JSONRenderer(), JSONParser()),
+    'orjson': (ORJSONRenderer(), ORJSONParser()),
+    'msgpack': (MessagePackRenderer(), MessagePackParser()),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare render and parse throughput of DRF JSON, orjson and MessagePack on '
+        'report, list and sync payloads built from a synthetic dataset'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Days of adherence history to generate')
+        parser.add_argument('--meds', type=int, default=4, help='Medications of the benchmark user')
+        parser.add_argument('--batch', type=int, default=200, help='Items in the sync payload')
+        parser.add_argument('--iterations', type=int, default=200, help='Renders and parses per payload and format')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        spec = DatasetSpec(users=1, meds_per_user=options['meds'], days=options['days'], seed=options['seed'])
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            DatasetFactory(spec).build()
+            payloads = self._payloads(f'{spec.username_prefix}0', options['batch'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'payload':16} {'format':9} {'KB':>8} {'render/s':>10} {'parse/s':>10} "
+            f"{'render x':>9} {'parse x':>8}"
+        )
+        for name, data in payloads.items():
+            baseline = None
+            for format_name, (renderer, parser) in FORMATS.items():
+                result = self._measure(renderer, parser, data, options['iterations'])
+                baseline = baseline or result
+                self.stdout.write(
+                    f"{name:16} {format_name:9} {result['bytes'] / 1024:>8.1f} "
+                    f"{result['render']:>10,.0f} {result['parse']:>10,.0f} "
+                    f"{result['render'] / baseline['render']:>8.1f}x {result['parse'] / baseline['parse']:>7.1f}x"
+                )
+
+    def _payloads(self, username, batch):
+        records = (
+            AdherenceRecord.objects.filter(user__username=username)
+            .select_related('medication', 'reminder')
+            .order_by('-scheduled_time')
+        )
+        user = records[0].user
+        listed = AdherenceRecordSerializer(records[:500], many=True).data
+        return {
+            # /api/adherence/report/ with its daily and hourly breakdowns
+            'report-30d': get_report(user, 30),
+            # A page of /api/adherence/records/
+            'records-list': listed,
+            # A client's /api/adherence/sync/ batch
+            'sync-batch': [
+                {
+                    'id': None,
+                    'medication': item['medication'],
+                    'reminder': item['reminder'],
+                    'scheduled_time': item['scheduled_time'],
+                    'actual_time': item['actual_time'],
+                    'status': item['status'],
+                    'notes': item['notes'],
+                    'is_deleted': False,
+                }
+                for item in listed[:batch]
+            ],
+        }
+
+    def _measure(self, renderer, parser, data, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            body = renderer.render(data, renderer.media_type, {})
+        render_rate = iterations / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            parser.parse(io.BytesIO(body), parser.media_type, {})
+        parse_rate = iterations / (time.perf_counter() - started)
+        return {'bytes': len(body), 'render': render_rate, 'parse': parse_rate}
@@ -0,0 +1,125 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from perf.factories import BulkCreateWriter, CopyWriter, DatasetFactory, DatasetSpec, default_writer
+
+
+def _writer(method, batch_size):
+    if method == 'copy':
+        return CopyWriter()
+    if method == 'bulk':
+        return BulkCreateWriter(batch_size)
+    return default_writer(batch_size)
+
+
+def _load_partition(args):
+    """Worker entry point: generate users [start, stop) in a forked process"""
+    spec, method, batch_size, user_batch, now, start, stop = args
+    # Connections inherited across fork must not be shared with the parent
+    connections.close_all()
+    factory = DatasetFactory(spec, _writer(method, batch_size), now=now, user_batch=user_batch)
+    try:
+        return factory.build(start, stop)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a large synthetic dataset (users, medications, schedules, reminders, '
+        'adherence records, streaks) for capacity planning'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to generate')
+        parser.add_argument('--meds', type=int, default=4, help='Medications per user')
+        parser.add_argument('--schedules', type=int, default=2, help='Daily doses per medication (times on one schedule)')
+        parser.add_argument('--days', type=int, default=90, help='Days of reminder/adherence history')
+        parser.add_argument('--expired-ratio', type=float, default=0.15, help='Share of medications already ended')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--prefix', default='load', help='Username prefix (must not collide with existing users)')
+        parser.add_argument(
+            '--method',
+            choices=['auto', 'copy', 'bulk'],
+            default='auto',
+            help='Row loading: COPY (PostgreSQL), bulk_create, or auto-detect',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='bulk_create batch size')
+        parser.add_argument('--user-batch', type=int, default=200, help='Users generated per transaction')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes loading disjoint user partitions in parallel',
+        )
+
+    def handle(self, *args, **options):
+        spec = DatasetSpec(
+            users=options['users'],
+            meds_per_user=options['meds'],
+            schedules_per_med=options['schedules'],
+            days=options['days'],
+            expired_ratio=options['expired_ratio'],
+            seed=options['seed'],
+            username_prefix=options['prefix'],
+        )
+        method = options['method']
+        workers = options['workers']
+        user_batch = options['user_batch']
+
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('--method copy requires PostgreSQL.')
+        if workers > 1 and connection.vendor == 'sqlite':
+            raise CommandError('--workers > 1 is not supported on SQLite (single writer).')
+
+        writer = _writer(method, options['batch_size'])
+        self.stdout.write(
+            f'Loading {spec.users} users x {spec.meds_per_user} meds x {spec.schedules_per_med} doses, '
+            f'{spec.days} days, with {type(writer).__name__} on {workers} worker(s)...'
+        )
+
+        started = time.monotonic()
+        now = timezone.now()
+        if workers <= 1:
+            counts = DatasetFactory(spec, writer, now=now, user_batch=user_batch).build(
+                progress=self._progress(started)
+            )
+        else:
+            counts = self._load_parallel(spec, method, options['batch_size'], user_batch, now, workers)
+
+        elapsed = time.monotonic() - started
+        total = sum(counts.values())
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).'
+        ))
+
+    def _progress(self, started):
+        def report(done, total, counts):
+            rows = sum(counts.values())
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {done}/{total} users, {rows} rows, {rows / max(elapsed, 1e-9):,.0f} rows/s')
+        return report
+
+    def _load_parallel(self, spec, method, batch_size, user_batch, now, workers):
+        # Partition on user_batch boundaries so each batch is seeded exactly as in a serial run
+        batches = list(range(0, spec.users, user_batch))
+        per_worker = -(-len(batches) // workers)
+        partitions = []
+        for i in range(0, len(batches), per_worker):
+            start = batches[i]
+            stop = min(batches[i + per_worker] if i + per_worker < len(batches) else spec.users, spec.users)
+            partitions.append((spec, method, batch_size, user_batch, now, start, stop))
+
+        connections.close_all()
+        total = None
+        with multiprocessing.get_context('fork').Pool(len(partitions)) as pool:
+            for counts in pool.imap_unordered(_load_partition, partitions):
+                total = counts if total is None else total + counts
+                self.stdout.write(f"  partition done: {sum(counts.values())} rows")
+        return total
@@ -0,0 +1,125 @@
+"""
+Opt-in request profiling.
+
+A request is profiled when a staff user sends the ``PROFILING_HEADER``
+header (``X-Profile: 1`` by default), or at random with probability
+``PROFILING_SAMPLE_RATE``. Profiled requests get their SQL statements and
+call tree captured by ``perf.profiling.RequestProfile`` and stored as a
+``ProfiledRequest``, browsable under Perf in the Django admin; the response
+carries an ``X-Profile-Id`` header pointing at the entry. Requests that are
+not profiled only pay for a header lookup and, when sampling is on, one
+random number.
+"""
+import logging
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+
+from users.authentication import aauthenticate
+
+from .models import ProfiledRequest
+from .profiling import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+# Never sampled: the admin (where profiles are read) and static files
+EXCLUDED_PREFIXES = ('/admin/', '/static/')
+
+
+def _session_staff(request):
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated and user.is_staff else None
+
+
+def _jwt_staff(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (APIException, TokenError):
+        return None
+    if result is None or not result[0].is_staff:
+        return None
+    return result[0]
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.PROFILING_HEADER.upper().replace('-', '_')
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _requested(self, request):
+        return request.META.get(self.header, '').lower() in ('1', 'true', 'yes')
+
+    def _sampled(self, request):
+        return (
+            self.sample_rate > 0
+            and random.random() < self.sample_rate
+            and not request.path.startswith(EXCLUDED_PREFIXES)
+        )
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        trigger = None
+        if self._requested(request) and (_session_staff(request) or _jwt_staff(request)):
+            trigger = 'header'
+        elif self._sampled(request):
+            trigger = 'sample'
+        if trigger is None:
+            return self.get_response(request)
+
+        with RequestProfile() as profile:
+            response = self.get_response(request)
+        self._store(request, response, trigger, profile)
+        return response
+
+    async def __acall__(self, request):
+        trigger = None
+        if self._requested(request):
+            staff = await sync_to_async(_session_staff)(request)
+            if staff is None:
+                user = await aauthenticate(request)
+                staff = user if user is not None and user.is_staff else None
+            if staff is not None:
+                trigger = 'header'
+        if trigger is None and self._sampled(request):
+            trigger = 'sample'
+        if trigger is None:
+            return await self.get_response(request)
+
+        async with RequestProfile() as profile:
+            response = await self.get_response(request)
+        await sync_to_async(self._store)(request, response, trigger, profile)
+        return response
+
+    def _store(self, request, response, trigger, profile):
+        result = profile.result()
+        user = getattr(request, 'user', None)
+        match = getattr(request, 'resolver_match', None)
+        try:
+            entry = ProfiledRequest.objects.record(
+                user=user if user is not None and user.is_authenticated else None,
+                trigger=trigger,
+                method=request.method,
+                path=request.get_full_path()[:512],
+                view_name=(match.view_name or '')[:200] if match else '',
+                status_code=response.status_code,
+                **result,
+            )
+        except DatabaseError:
+            # A broken profile store must never fail the request being profiled
+            logger.exception('Could not store request profile for %s', request.path)
+            return
+        response['X-Profile-Id'] = str(entry.pk)
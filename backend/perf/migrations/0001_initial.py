@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfiledRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('trigger', models.CharField(choices=[('header', 'Header'), ('sample', 'Sampled')], max_length=10)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=512)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('status_code', models.IntegerField(null=True)),
+                ('duration_ms', models.FloatField()),
+                ('sql_ms', models.FloatField(default=0)),
+                ('query_count', models.IntegerField(default=0)),
+                ('duplicate_count', models.IntegerField(default=0)),
+                ('similar_count', models.IntegerField(default=0)),
+                ('queries', models.JSONField(default=list)),
+                ('call_tree', models.TextField(blank=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfiledRequestManager(models.Manager):
+    def record(self, **fields):
+        """
+        Store a profile and drop the oldest ones beyond
+        ``PROFILING_BUFFER_SIZE``, so the table behaves as a ring buffer
+        """
+        profile = self.create(**fields)
+        self.filter(pk__lte=profile.pk - settings.PROFILING_BUFFER_SIZE).delete()
+        return profile
+
+
+class ProfiledRequest(models.Model):
+    """SQL and call-tree capture of one request, see perf.middleware"""
+
+    TRIGGER_CHOICES = [
+        ('header', 'Header'),
+        ('sample', 'Sampled'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=512)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.IntegerField(null=True)
+
+    duration_ms = models.FloatField()
+    sql_ms = models.FloatField(default=0)
+    query_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)  # Identical statement and parameters re-run
+    similar_count = models.IntegerField(default=0)  # Same SQL re-run with other parameters (N+1)
+
+    queries = models.JSONField(default=list)
+    call_tree = models.TextField(blank=True)
+
+    objects = ProfiledRequestManager()
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms, {self.query_count} queries)"
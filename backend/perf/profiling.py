@@ -0,0 +1,197 @@
+"""
+Per-request capture of SQL statements and a Python call tree.
+
+``RequestProfile`` wraps the handling of one request: every statement run on
+any database connection is recorded with its duration, and cProfile collects
+the call graph, which is folded into a pyinstrument-style tree of cumulative
+times. Only SQL templates are kept (never parameters), but parameters are
+hashed so exact repeats can be told apart from the same query run with
+different arguments, the usual N+1 shape.
+"""
+import cProfile
+import hashlib
+import os
+import pstats
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+# Call tree pruning: children under this share of the root are dropped
+MIN_TREE_FRACTION = 0.01
+MAX_TREE_DEPTH = 40
+MAX_TREE_LINES = 400
+MAX_QUERIES_KEPT = 500
+
+
+class QueryCollector:
+    """``execute_wrapper`` hook recording each statement with its duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.queries.append((
+                context['connection'].alias,
+                sql,
+                hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest(),
+                duration,
+            ))
+
+    def summary(self):
+        """
+        Return ``(queries, stats)``: one entry per executed statement in order,
+        annotated with how often the identical statement (same SQL and
+        parameters) and the same SQL template ran during the request.
+        """
+        exact = Counter((alias, sql, params) for alias, sql, params, _ in self.queries)
+        similar = Counter((alias, sql) for alias, sql, _, _ in self.queries)
+        queries = [
+            {
+                'db': alias,
+                'sql': sql,
+                'ms': round(duration, 3),
+                'duplicates': exact[(alias, sql, params)],
+                'similar': similar[(alias, sql)],
+            }
+            for alias, sql, params, duration in self.queries[:MAX_QUERIES_KEPT]
+        ]
+        stats = {
+            'query_count': len(self.queries),
+            'sql_ms': round(sum(q[3] for q in self.queries), 3),
+            # Statements beyond the first run of each distinct query
+            'duplicate_count': sum(n - 1 for n in exact.values()),
+            'similar_count': sum(n - 1 for n in similar.values()),
+        }
+        return queries, stats
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        # Built-ins are reported as ('~', 0, "<built-in method ...>")
+        return name
+    parts = filename.split(os.sep)
+    return f"{name}  {os.sep.join(parts[-3:])}:{line}"
+
+
+def build_call_tree(stats, min_fraction=MIN_TREE_FRACTION, max_depth=MAX_TREE_DEPTH, max_lines=MAX_TREE_LINES):
+    """
+    Fold cProfile caller/callee edges into an indented text tree of cumulative
+    times, starting from the entries with no recorded caller (or, when every
+    entry has one, as with coroutines resumed by the event loop, the most
+    expensive entry). Recursion is cut where a function reappears on its own
+    path. cProfile aggregates per function, so a function called from several
+    places shows its combined children under each caller.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            # edge is (primitive calls, calls, own time, cumulative time)
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    roots = sorted(
+        ((func, entry[3]) for func, entry in stats.items() if not entry[4]),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    if not roots and stats:
+        roots = [max(((func, entry[3]) for func, entry in stats.items()), key=lambda item: item[1])]
+    total = sum(ct for _, ct in roots) or 1e-9
+    lines = []
+
+    def walk(func, cumulative, depth, path):
+        if len(lines) >= max_lines:
+            return
+        lines.append(f"{'  ' * depth}{cumulative * 1000:9.1f} ms  {cumulative / total:6.1%}  {_label(func)}")
+        if depth >= max_depth:
+            return
+        for child, child_ct in sorted(children.get(func, ()), key=lambda item: item[1], reverse=True):
+            if child in path or child_ct / total < min_fraction:
+                continue
+            walk(child, child_ct, depth + 1, path | {child})
+
+    for func, cumulative in roots:
+        if cumulative / total >= min_fraction:
+            walk(func, cumulative, 0, {func})
+    if len(lines) >= max_lines:
+        lines.append(f"... truncated at {max_lines} lines")
+    return "\n".join(lines)
+
+
+class RequestProfile:
+    """
+    Context manager collecting SQL and a call tree for the enclosed code.
+
+    Database connections are thread-local, so async code must use
+    ``async with``: the SQL hooks are then installed in the thread where
+    ``sync_to_async`` runs the ORM for the current request.
+    """
+
+    def __init__(self, profile_python=True):
+        self.collector = QueryCollector()
+        self.profiler = cProfile.Profile() if profile_python else None
+        self.call_tree = ''
+        self.duration_ms = 0.0
+        self._stack = None
+        self._started = None
+
+    def _hook_connections(self):
+        self._stack = ExitStack()
+        for conn in connections.all():
+            self._stack.enter_context(conn.execute_wrapper(self.collector))
+
+    def _unhook_connections(self):
+        self._stack.close()
+
+    def _start(self):
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiler (another thread's request, a debugger) is active
+                self.profiler = None
+                self.call_tree = '(call tree unavailable: another profiler was active)'
+        self._started = time.perf_counter()
+
+    def _stop(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.call_tree = build_call_tree(pstats.Stats(self.profiler).stats)
+
+    def __enter__(self):
+        self._hook_connections()
+        self._start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop()
+        self._unhook_connections()
+        return False
+
+    async def __aenter__(self):
+        await sync_to_async(self._hook_connections)()
+        self._start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._stop()
+        await sync_to_async(self._unhook_connections)()
+        return False
+
+    def result(self):
+        queries, stats = self.collector.summary()
+        return {
+            'duration_ms': round(self.duration_ms, 3),
+            'queries': queries,
+            'call_tree': self.call_tree,
+            **stats,
+        }
@@ -1,16 +1,25 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
+from dosealert.fastlists import ValuesListMixin
+from dosealert.replicas import replica_reads
+from dosealert.versions import VersionedListMixin
+from users.deletion import delete_user_reminders, queue_deletion
+from users.serializers import DeletionJobSerializer
 from .models import Reminder
-from .serializers import ReminderSerializer
+from .serializers import ReminderSerializer, ReminderValuesSerializer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
 from .views import sync_reminders
 
-class ReminderViewSet(ModelViewSet):
+@replica_reads
+class ReminderViewSet(VersionedListMixin, ValuesListMixin, ModelViewSet):
     serializer_class = ReminderSerializer
+    values_serializer_class = ReminderValuesSerializer
+    version_collection = version_resource = 'reminders'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -28,8 +37,11 @@ class ReminderViewSet(ModelViewSet):
 
     @action(detail=False, methods=['delete'])
     def delete_all(self, request):
-        reminders = self.get_queryset()
-        reminders.delete()
+        """Delete every reminder of the user, in the background when there are many"""
+        if self.get_queryset().count() > settings.DELETION_INLINE_LIMIT:
+            job = queue_deletion(request.user, 'reminders', request.user.id)
+            return Response(DeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        delete_user_reminders(request.user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 router = DefaultRouter()
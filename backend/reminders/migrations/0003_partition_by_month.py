@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations
+
+from dosealert.partitioning import REMINDERS, partition_table
+
+
+def partition_reminders(apps, schema_editor):
+    # No-op outside PostgreSQL; see dosealert.partitioning
+    partition_table(REMINDERS, settings.PARTITION_MONTHS_AHEAD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reminders', '0002_reminder_medication_alter_reminder_scheduled_at'),
+        # adherence_adherencerecord.reminder_id references this table; its
+        # foreign key has to exist before it can be dropped here
+        ('adherence', '0003_adherence_calendar'),
+    ]
+
+    operations = [
+        # A partitioned table looks the same to the ORM, so there is nothing to undo
+        migrations.RunPython(partition_reminders, migrations.RunPython.noop),
+    ]
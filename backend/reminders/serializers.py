@@ -1,7 +1,11 @@
 
 from rest_framework import serializers
+from dosealert.fastlists import ValuesSerializer
 from .models import Reminder
 class ReminderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reminder
         fields = "__all__"
+
+class ReminderValuesSerializer(ValuesSerializer):
+    serializer_class = ReminderSerializer
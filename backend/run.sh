@@ -6,5 +6,5 @@ uv sync --frozen
 # Apply database migrations
 uv run python manage.py migrate
 
-# Start Gunicorn processes
-exec uv run gunicorn dosealert.wsgi:application --bind 0.0.0.0:8000 --workers 3
+# Start Gunicorn processes (gunicorn.conf.py picks WSGI or ASGI from SERVER_MODE)
+exec uv run gunicorn --config gunicorn.conf.py
@@ -1,12 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .viewsets import ScheduleViewSet
-from .views import sync_schedules
+from .views import sync_schedules, upcoming_doses
 
 router = DefaultRouter()
 router.register(r'', ScheduleViewSet, basename='schedules')
 
 urlpatterns = [
     path('sync/', sync_schedules, name='sync-schedules'),
+    path('upcoming/', upcoming_doses, name='upcoming-doses'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,147 @@
+"""
+On-the-fly expansion of schedules into dose occurrences.
+
+Reminder generation (``Schedule.regenerate_reminders``) writes reminders
+from these same occurrences, so a virtual occurrence and the reminder
+written for it carry the same timestamp and can be matched exactly. Nothing here
+touches the database: callers load schedules (with their medication) and
+the reminders of the window first, then stream the merged result.
+"""
+import heapq
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .recurrence import iter_rule_occurrences, rule_start, sets_time
+
+DEFAULT_WINDOW_DAYS = 7
+# Upper bound on a requested window, to keep a single response bounded
+MAX_WINDOW_DAYS = 366
+
+
+def _parse_bound(value, name):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{name}' must be an ISO 8601 date or datetime.")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_window(from_value=None, to_value=None, now=None):
+    """
+    Parse the ``from``/``to`` query parameters into an aware ``[start, end)``
+    window. ``from`` defaults to now and ``to`` to a week after ``from``;
+    raises ``ValueError`` for malformed, inverted or oversized windows.
+    """
+    start = _parse_bound(from_value, 'from') if from_value else (now or timezone.now())
+    end = _parse_bound(to_value, 'to') if to_value else start + timedelta(days=DEFAULT_WINDOW_DAYS)
+    if end <= start:
+        raise ValueError("'to' must be after 'from'.")
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise ValueError(f"The window cannot span more than {MAX_WINDOW_DAYS} days.")
+    return start, end
+
+
+def iter_occurrences(schedule, start, end):
+    """
+    Yield the aware datetimes in ``[start, end)`` at which ``schedule`` is
+    due, in order. Days outside the medication's start/end dates are skipped.
+
+    Schedules with a ``recurrence`` rule are expanded by
+    ``schedules.recurrence``; the others recur weekly on ``days_of_week``.
+    Either way every time in ``times_of_day`` yields a dose.
+    """
+    # make_aware() looks the zone up on every call; resolve it once
+    tz = timezone.get_current_timezone()
+    medication = schedule.medication
+    if medication.start_date:
+        start = max(start, datetime.combine(medication.start_date, time.min, tzinfo=tz))
+    if medication.end_date:
+        end = min(end, datetime.combine(medication.end_date + timedelta(days=1), time.min, tzinfo=tz))
+    if start >= end:
+        return
+
+    times = schedule.get_times()
+    rule = schedule.recurrence
+    if rule:
+        if sets_time(rule) or len(times) < 2:
+            yield from iter_rule_occurrences(rule, rule_start(schedule, tz), start, end)
+            return
+        streams = [iter_rule_occurrences(rule, rule_start(schedule, tz, t), start, end) for t in times]
+        last = None
+        for at in heapq.merge(*streams):
+            # HOURLY rules started at different times can coincide
+            if at != last:
+                yield at
+            last = at
+        return
+
+    weekdays = set(schedule.get_scheduled_weekdays())
+    day = start.astimezone(tz).date()
+    last_day = end.astimezone(tz).date()
+    while day <= last_day:
+        if day.weekday() in weekdays:
+            for t in times:
+                at = datetime.combine(day, t, tzinfo=tz)
+                if start <= at < end:
+                    yield at
+        day += timedelta(days=1)
+
+
+def count_occurrences(schedules, start, end):
+    """Number of doses each medication of ``schedules`` was due in ``[start, end)``"""
+    counts = Counter()
+    for schedule in schedules:
+        counts[schedule.medication_id] += sum(1 for _ in iter_occurrences(schedule, start, end))
+    return counts
+
+
+def iter_upcoming(schedules, reminders, start, end):
+    """
+    Merge virtual occurrences of ``schedules`` with the real ``reminders``
+    of the window (dicts as produced by ``.values()``, ordered by
+    ``scheduled_at``), yielding one dict per dose in time order.
+
+    A reminder that matches an occurrence is folded into it; reminders with
+    no matching occurrence (one-off reminders, or reminders of a schedule
+    that has since changed) are yielded on their own.
+    """
+    by_key = {(r['schedule_id'], r['scheduled_at']): r for r in reminders}
+
+    def occurrences(schedule):
+        for at in iter_occurrences(schedule, start, end):
+            # Second key element sorts an occurrence before a reminder at the same time
+            yield at, 0, schedule.id, schedule
+
+    streams = [occurrences(schedule) for schedule in schedules]
+    streams.append((r['scheduled_at'], 1, r['schedule_id'], r) for r in reminders)
+
+    matched = set()
+    for at, kind, schedule_id, item in heapq.merge(*streams, key=lambda entry: entry[:3]):
+        if kind == 0:
+            reminder = by_key.get((schedule_id, at))
+            if reminder is not None:
+                matched.add(reminder['id'])
+            yield _occurrence(at, item.id, item.medication_id, item.medication.name, reminder)
+        elif item['id'] not in matched:
+            yield _occurrence(at, schedule_id, item['resolved_medication_id'], item['medication_name'], item)
+
+
+def _occurrence(at, schedule_id, medication_id, medication_name, reminder):
+    return {
+        'scheduled_at': at,
+        'schedule_id': schedule_id,
+        'medication_id': medication_id,
+        'medication_name': medication_name,
+        'virtual': reminder is None,
+        'reminder_id': reminder['id'] if reminder else None,
+        'reminder_status': reminder['status'] if reminder else None,
+        'adherence_record_id': reminder['adherence_record_id'] if reminder else None,
+        'adherence_status': reminder['adherence_status'] if reminder else None,
+    }
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from dosealert import versions
 from schedules.models import Schedule
 from datetime import date
 
@@ -51,14 +52,16 @@ class Command(BaseCommand):
             user = schedule.user
             
             if verbose or dry_run:
+                times = ', '.join(str(t) for t in schedule.get_times())
                 self.stdout.write(
                     f'  - {medication.name} for {user.username} '
-                    f'(ended: {medication.end_date}, schedule: {schedule.time_of_day})'
+                    f'(ended: {medication.end_date}, schedule: {times})'
                 )
             
             if not dry_run:
                 schedule.active = False
                 schedule.save()
+                versions.bump(schedule.user_id, 'schedules')
         
         if not dry_run:
             self.stdout.write(
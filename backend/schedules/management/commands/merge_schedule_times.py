@@ -0,0 +1,96 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dosealert import versions
+from reminders.models import Reminder
+from schedules.models import MAX_TIMES_PER_DAY, Schedule, normalize_times
+from schedules.recurrence import sets_time
+
+# Rows that share all of these only differ in their dose time
+GROUP_FIELDS = ('user_id', 'medication_id', 'days_of_week', 'recurrence', 'timezone', 'active')
+
+
+class Command(BaseCommand):
+    help = 'Merge schedules that only differ in their time of day into one row with several times_of_day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be merged without making changes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Merged groups per transaction',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Show each merged group',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        rows = Schedule.objects.order_by(*GROUP_FIELDS, 'id').values(
+            'id', 'time_of_day', 'times_of_day', *GROUP_FIELDS
+        )
+
+        merges = []
+        for key, group in groupby(rows.iterator(chunk_size=2000), key=lambda row: tuple(row[f] for f in GROUP_FIELDS)):
+            group = list(group)
+            # A rule with BYHOUR ignores the schedule's times, so its rows are not interchangeable
+            if len(group) < 2 or sets_time(key[3]):
+                continue
+            times = normalize_times(
+                t for row in group for t in (row['times_of_day'] or [row['time_of_day']])
+            )
+            if len(times) > MAX_TIMES_PER_DAY:
+                continue
+            merges.append((group[0]['id'], [row['id'] for row in group[1:]], times))
+
+        if not merges:
+            self.stdout.write(self.style.SUCCESS('No schedules to merge.'))
+            return
+
+        removed = sum(len(others) for _, others, _ in merges)
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'DRY RUN: Would merge {removed + len(merges)} schedules into {len(merges)}:'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Merging {removed + len(merges)} schedules into {len(merges)}...'
+            ))
+
+        for i in range(0, len(merges), options['batch_size']):
+            batch = merges[i:i + options['batch_size']]
+            if options['verbose'] or dry_run:
+                for keep, others, times in batch:
+                    self.stdout.write(
+                        f'  - schedule {keep} <- {", ".join(map(str, others))} '
+                        f'({", ".join(str(t) for t in times)})'
+                    )
+            if dry_run:
+                continue
+            with transaction.atomic():
+                versions.bump(
+                    Schedule.objects.filter(id__in=[keep for keep, _, _ in batch]).values_list('user_id', flat=True),
+                    'schedules',
+                )
+                for keep, others, times in batch:
+                    Reminder.objects.filter(schedule_id__in=others).update(schedule_id=keep)
+                    Schedule.objects.filter(id__in=others).delete()
+                    Schedule.objects.filter(id=keep).update(
+                        time_of_day=times[0],
+                        times_of_day=[t.isoformat() for t in times],
+                    )
+
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully merged schedules: {removed} rows removed, '
+                f'{Schedule.objects.count()} remaining.'
+            ))
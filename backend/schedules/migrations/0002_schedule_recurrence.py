@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:30
+
+import schedules.recurrence
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='recurrence',
+            field=models.CharField(blank=True, default='', max_length=255, validators=[schedules.recurrence.validate_recurrence]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:37
+
+import schedules.models
+from django.db import migrations, models
+
+
+def backfill_times_of_day(apps, schema_editor):
+    """Give every existing row a one-element list holding its time_of_day"""
+    Schedule = apps.get_model('schedules', 'Schedule')
+    batch = []
+    for schedule in Schedule.objects.filter(times_of_day=[]).only('id', 'time_of_day').iterator(chunk_size=2000):
+        schedule.times_of_day = [schedule.time_of_day.isoformat()]
+        batch.append(schedule)
+        if len(batch) == 2000:
+            Schedule.objects.bulk_update(batch, ['times_of_day'])
+            batch = []
+    if batch:
+        Schedule.objects.bulk_update(batch, ['times_of_day'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0002_schedule_recurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='times_of_day',
+            field=models.JSONField(blank=True, default=list, validators=[schedules.models.validate_times_of_day]),
+        ),
+        # time_of_day keeps the first time, so reversing needs no data change
+        migrations.RunPython(backfill_times_of_day, migrations.RunPython.noop),
+    ]
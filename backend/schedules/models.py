@@ -1,19 +1,52 @@
 
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from dosealert import metrics
 from meds.models import Medication
-from datetime import date
+from datetime import date, datetime, time, timedelta
+from .expansion import iter_occurrences
+from .recurrence import validate_recurrence
 User = get_user_model()
 
+# Upper bound on dose times per schedule row
+MAX_TIMES_PER_DAY = 24
+
+
+def _as_time(value):
+    if isinstance(value, time):
+        return value
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"'{value}' is not a valid time (HH:MM[:SS]).")
+
+
+def normalize_times(values):
+    """Sorted, de-duplicated ``time`` objects from times or ISO strings"""
+    return sorted({_as_time(value) for value in values})
+
+
+def validate_times_of_day(value):
+    """Model field validator for ``Schedule.times_of_day``"""
+    if not isinstance(value, list):
+        raise ValidationError('times_of_day must be a list of times.')
+    if len(value) > MAX_TIMES_PER_DAY:
+        raise ValidationError(f'A schedule can have at most {MAX_TIMES_PER_DAY} dose times.')
+    normalize_times(value)
+
+
 class ScheduleManager(models.Manager):
     def active(self):
         """Get schedules that are active AND not expired"""
+        # The expiry check already joins medication, and expanding
+        # times_of_day needs its dates, so load it in the same query
         return self.filter(
             active=True
         ).exclude(
             medication__end_date__lt=date.today()
-        )
+        ).select_related('medication')
     
     def expired(self):
         """Get schedules with expired medications"""
@@ -24,9 +57,12 @@ class ScheduleManager(models.Manager):
 class Schedule(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="schedules")
     medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name="schedules")
-    # simple: times per day; expand to RRULE later
-    time_of_day = models.TimeField()      # e.g., 08:00
+    time_of_day = models.TimeField()      # e.g., 08:00; always the first of times_of_day
+    # All dose times of the day in order, stored as "HH:MM:SS" strings
+    times_of_day = models.JSONField(default=list, blank=True, validators=[validate_times_of_day])
     days_of_week = models.CharField(max_length=32, default="Mon,Tue,Wed,Thu,Fri,Sat,Sun")
+    # Optional RRULE (e.g. "FREQ=DAILY;INTERVAL=2"); replaces days_of_week when set
+    recurrence = models.CharField(max_length=255, blank=True, default="", validators=[validate_recurrence])
     timezone = models.CharField(max_length=64, default="UTC")
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -59,6 +95,12 @@ class Schedule(models.Model):
         # Convert to weekday numbers
         return [day_mapping[day] for day in scheduled_days if day in day_mapping]
     
+    def get_times(self):
+        """Dose times of the day in order (``time_of_day`` for rows without a list)"""
+        if self.times_of_day:
+            return normalize_times(self.times_of_day)
+        return [self.time_of_day] if self.time_of_day else []
+    
     def is_scheduled_for_date(self, date):
         """Check if this schedule should run on the given date"""
         scheduled_weekdays = self.get_scheduled_weekdays()
@@ -72,82 +114,87 @@ class Schedule(models.Model):
         if self.is_medication_expired:
             self.active = False
         
+        # Keep time_of_day and times_of_day consistent for clients that only know one time
+        times = self.get_times()
+        if times:
+            self.time_of_day = times[0]
+            self.times_of_day = [t.isoformat() for t in times]
+        
         super().save(*args, **kwargs)
+        self._refresh_inventory()
         
         # if is_new and self.active and not self.is_medication_expired:
         #     self.create_initial_reminders()
     
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._refresh_inventory()
+        return result
+    
+    def _refresh_inventory(self):
+        """A tracked supply is used up at the rate of the active schedules"""
+        from meds.inventory import refresh_daily_usage
+        refresh_daily_usage(self.medication_id)
+    
     def create_initial_reminders(self):
         """Create reminders for this schedule"""
         from reminders.models import Reminder
-        from datetime import timedelta
         
         # Generate reminders for the next 14 days (to ensure we get all scheduled days)
-        today = timezone.now().date()
+        now = timezone.now()
+        window_end = self._reminder_window_end(14)
         
-        for i in range(14):
-            reminder_date = today + timedelta(days=i)
-            
-            # Check if this day matches our schedule
-            if self.is_scheduled_for_date(reminder_date):
-                # Skip if reminder already exists for this date
-                existing_reminder = Reminder.objects.filter(
-                    schedule=self,
-                    scheduled_at__date=reminder_date
-                ).exists()
-                
-                if not existing_reminder:
-                    # Create reminder for the scheduled time on this date
-                    scheduled_datetime = timezone.datetime.combine(
-                        reminder_date, 
-                        self.time_of_day
-                    )
-                    scheduled_datetime = timezone.make_aware(scheduled_datetime)
-                    
-                    # Only create reminder if it's in the future
-                    if scheduled_datetime > timezone.now():
-                        Reminder.objects.create(
-                            schedule=self,
-                            medication=self.medication,  # Add direct medication reference
-                            scheduled_at=scheduled_datetime,
-                            status="pending"
-                        )
+        # Skip occurrences that already have a reminder
+        existing = set(Reminder.objects.filter(
+            schedule=self,
+            scheduled_at__gt=now,
+            scheduled_at__lt=window_end
+        ).values_list('scheduled_at', flat=True))
+        
+        # Only create reminders in the future
+        created = Reminder.objects.bulk_create([
+            Reminder(
+                schedule=self,
+                medication=self.medication,  # Add direct medication reference
+                scheduled_at=scheduled_at,
+                status="pending"
+            )
+            for scheduled_at in iter_occurrences(self, now, window_end)
+            if scheduled_at > now and scheduled_at not in existing
+        ])
+        metrics.REMINDERS_WRITTEN.labels('initial').inc(len(created))
     
     def regenerate_reminders(self, days_ahead=14):
         """Regenerate reminders for this schedule (useful when schedule is updated)"""
         from reminders.models import Reminder
-        from datetime import timedelta
+        
+        now = timezone.now()
         
         # Delete future pending reminders for this schedule
         Reminder.objects.filter(
             schedule=self,
-            scheduled_at__gt=timezone.now(),
+            scheduled_at__gt=now,
             status="pending"
         ).delete()
         
         # Create new reminders if schedule is active
         if self.active and not self.is_medication_expired:
-            today = timezone.now().date()
-            
-            for i in range(days_ahead):
-                reminder_date = today + timedelta(days=i)
-                
-                # Check if this day matches our schedule
-                if self.is_scheduled_for_date(reminder_date):
-                    scheduled_datetime = timezone.datetime.combine(
-                        reminder_date, 
-                        self.time_of_day
-                    )
-                    scheduled_datetime = timezone.make_aware(scheduled_datetime)
-                    
-                    # Only create reminder if it's in the future
-                    if scheduled_datetime > timezone.now():
-                        Reminder.objects.create(
-                            schedule=self,
-                            medication=self.medication,  # Add direct medication reference
-                            scheduled_at=scheduled_datetime,
-                            status="pending"
-                        )
+            created = Reminder.objects.bulk_create([
+                Reminder(
+                    schedule=self,
+                    medication=self.medication,  # Add direct medication reference
+                    scheduled_at=scheduled_at,
+                    status="pending"
+                )
+                for scheduled_at in iter_occurrences(self, now, self._reminder_window_end(days_ahead))
+                if scheduled_at > now
+            ])
+            metrics.REMINDERS_WRITTEN.labels('regenerate').inc(len(created))
+    
+    def _reminder_window_end(self, days_ahead):
+        """Midnight after the last of ``days_ahead`` days starting today"""
+        last_day = timezone.localdate() + timedelta(days=days_ahead)
+        return timezone.make_aware(datetime.combine(last_day, time.min))
     
     def __str__(self): 
         if self.is_medication_expired:
@@ -156,4 +203,5 @@ class Schedule(models.Model):
             status = "ACTIVE"
         else:
             status = "INACTIVE"
-        return f"{self.medication.name} @ {self.time_of_day} ({status})"
+        times = ", ".join(str(t) for t in self.get_times())
+        return f"{self.medication.name} @ {times} ({status})"
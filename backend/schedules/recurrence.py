@@ -0,0 +1,151 @@
+"""
+RRULE recurrence for schedules.
+
+``Schedule.recurrence`` holds the body of an RFC 5545 RRULE, for example
+``FREQ=DAILY;INTERVAL=2`` (every other day), ``FREQ=DAILY;BYHOUR=8,14,20``
+(three times a day), ``FREQ=MONTHLY;BYMONTHDAY=1;COUNT=6`` or
+``FREQ=WEEKLY;BYDAY=MO,TH;UNTIL=20251231T000000Z``. The rule starts at the
+medication's start date (or the schedule's creation date) at
+``time_of_day``, which also supplies the time for rules without BYHOUR.
+A rule without BYHOUR on a schedule with several ``times_of_day`` is
+expanded once per time and the results merged.
+
+Expanding a window must not cost more for an old schedule than for a new
+one. Rules without COUNT are therefore fast-forwarded: the start is moved
+by a whole number of intervals to just before the window, with the parts
+dateutil would derive from the original start (weekday, day of month,
+time) pinned explicitly so the occurrences stay the same. Compiled rules
+are cached per (rule, start, offset), so a window that moves day by day
+reuses them.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrule, rrulestr
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+RULE_CACHE_SIZE = 16384
+
+# Finer frequencies would let a single schedule produce thousands of doses a day
+ALLOWED_FREQS = ('YEARLY', 'MONTHLY', 'WEEKLY', 'DAILY', 'HOURLY')
+
+FREQ_UNITS = {'YEARLY': 'years', 'MONTHLY': 'months', 'WEEKLY': 'weeks', 'DAILY': 'days', 'HOURLY': 'hours'}
+WEEKDAY_CODES = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+DAY_SPEC_PARTS = ('BYWEEKNO', 'BYYEARDAY', 'BYMONTHDAY', 'BYDAY', 'BYEASTER')
+
+
+@lru_cache(maxsize=1024)
+def _parts(text):
+    parts = {}
+    for item in text.strip().upper().removeprefix('RRULE:').split(';'):
+        if item:
+            name, _, value = item.partition('=')
+            parts[name] = value
+    return parts
+
+
+def _pinned(parts, dtstart):
+    """
+    Spell out the parts dateutil derives from ``dtstart`` when the rule
+    leaves them out, so the rule no longer depends on where it starts
+    """
+    freq = parts['FREQ']
+    pinned = dict(parts)
+    if not any(name in parts for name in DAY_SPEC_PARTS):
+        if freq == 'YEARLY':
+            pinned.setdefault('BYMONTH', str(dtstart.month))
+            pinned['BYMONTHDAY'] = str(dtstart.day)
+        elif freq == 'MONTHLY':
+            pinned['BYMONTHDAY'] = str(dtstart.day)
+        elif freq == 'WEEKLY':
+            pinned['BYDAY'] = WEEKDAY_CODES[dtstart.weekday()]
+    if freq != 'HOURLY':
+        pinned.setdefault('BYHOUR', str(dtstart.hour))
+    pinned.setdefault('BYMINUTE', str(dtstart.minute))
+    pinned.setdefault('BYSECOND', str(dtstart.second))
+    return ';'.join(f"{name}={value}" for name, value in pinned.items())
+
+
+def _periods_between(unit, start, end):
+    """Whole ``unit`` periods from ``start`` to ``end`` (never more than elapsed)"""
+    if unit == 'years':
+        return end.year - start.year - 1
+    if unit == 'months':
+        return (end.year - start.year) * 12 + end.month - start.month - 1
+    seconds = (end - start).total_seconds()
+    if unit == 'weeks':
+        return int(seconds // (7 * 86400))
+    if unit == 'days':
+        return int(seconds // 86400)
+    return int(seconds // 3600)
+
+
+@lru_cache(maxsize=RULE_CACHE_SIZE)
+def compile_rule(text, dtstart, shift=0):
+    """
+    Compile ``text`` starting at ``dtstart``, moved forward by ``shift``
+    periods of the rule's frequency (a multiple of its interval)
+    """
+    # cache=True keeps generated occurrences on the rule, so expanding the
+    # same window again (or a COUNT rule's prefix) does not regenerate them
+    if not shift:
+        rule = rrulestr(text, dtstart=dtstart, cache=True)
+    else:
+        parts = _parts(text)
+        shifted = dtstart + relativedelta(**{FREQ_UNITS[parts['FREQ']]: shift})
+        rule = rrulestr(_pinned(parts, dtstart), dtstart=shifted, cache=True)
+    if not isinstance(rule, rrule):
+        raise ValueError('Only a single RRULE is supported.')
+    return rule
+
+
+def validate_recurrence(text):
+    """Model field validator: reject rules dateutil cannot compile or that fire too often"""
+    if not text:
+        return
+    parts = _parts(text)
+    if parts.get('FREQ') not in ALLOWED_FREQS:
+        raise ValidationError(f"FREQ must be one of {', '.join(ALLOWED_FREQS)}.")
+    if 'DTSTART' in text.upper():
+        raise ValidationError('DTSTART is taken from the medication start date and time of day.')
+    try:
+        compile_rule(text, timezone.make_aware(datetime(2000, 1, 1)))
+    except (ValueError, TypeError) as e:
+        raise ValidationError(f'Invalid recurrence rule: {e}')
+
+
+def sets_time(text):
+    """Whether the rule fixes its own time of day (BYHOUR) instead of using the schedule's"""
+    return 'BYHOUR' in _parts(text)
+
+
+def rule_start(schedule, tz=None, at=None):
+    """The first possible occurrence of ``schedule``'s rule (at ``at``, default ``time_of_day``)"""
+    tz = tz or timezone.get_current_timezone()
+    medication = schedule.medication
+    if medication.start_date:
+        day = medication.start_date
+    elif schedule.created_at:
+        day = schedule.created_at.astimezone(tz).date()
+    else:
+        day = timezone.localdate(timezone=tz)
+    return datetime.combine(day, at or schedule.time_of_day, tzinfo=tz)
+
+
+def iter_rule_occurrences(text, dtstart, start, end):
+    """Yield the occurrences of a rule in ``[start, end)``, in order"""
+    parts = _parts(text)
+    shift = 0
+    if 'COUNT' not in parts and start > dtstart:
+        interval = int(parts.get('INTERVAL', 1))
+        periods = _periods_between(FREQ_UNITS[parts['FREQ']], dtstart, start)
+        # Stay one interval early so rules with BYSETPOS or week numbers
+        # see the whole period the window starts in
+        shift = max(periods // interval - 1, 0) * interval
+
+    for at in compile_rule(text, dtstart, shift).xafter(start, inc=True):
+        if at >= end:
+            return
+        yield at
@@ -1,13 +1,49 @@
-
 from rest_framework import serializers
-from .models import Schedule
+from dosealert.fastlists import ValuesSerializer
+from .models import MAX_TIMES_PER_DAY, Schedule, normalize_times
 
 class ScheduleSerializer(serializers.ModelSerializer):
+    # Either field may be sent; the model keeps time_of_day as the first of times_of_day
+    time_of_day = serializers.TimeField(required=False)
+    times_of_day = serializers.ListField(
+        child=serializers.TimeField(),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_TIMES_PER_DAY,
+    )
+
     class Meta:
         model = Schedule
         fields = "__all__"
         read_only_fields = ("user","created_at")
 
+    def validate(self, attrs):
+        times = attrs.get('times_of_day')
+        if times is not None:
+            attrs['times_of_day'] = sorted({t.isoformat() for t in times})
+            # The list wins over a single time sent alongside it
+            attrs.pop('time_of_day', None)
+        elif 'time_of_day' in attrs:
+            # A client that only knows one time replaces the whole list
+            attrs['times_of_day'] = [attrs['time_of_day'].isoformat()]
+        elif self.instance is None:
+            raise serializers.ValidationError({'times_of_day': 'Provide time_of_day or times_of_day.'})
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['times_of_day'] = [t.isoformat() for t in instance.get_times()]
+        return data
+
+class ScheduleValuesSerializer(ValuesSerializer):
+    serializer_class = ScheduleSerializer
+    computed_fields = ('times_of_day',)
+
+    def compute_times_of_day(self, row):
+        # Schedule.get_times() on the row; time_of_day is already an ISO string here
+        times = row['times_of_day'] or ([row['time_of_day']] if row['time_of_day'] else [])
+        return [t.isoformat() for t in normalize_times(times)]
+
 class ScheduleSyncSerializer(serializers.ModelSerializer):
     class Meta:
         model = Schedule
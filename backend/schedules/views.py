@@ -1,13 +1,27 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from dosealert import metrics, versions
+from dosealert.syncbody import ExistingRows, sync_batches
+from dosealert.throttling import SyncThrottle
+from dosealert.replicas import replica_reads
+from reminders.models import Reminder
+from .expansion import iter_upcoming, parse_window
 from .models import Schedule
 from .serializers import ScheduleSerializer
 
+# Occurrences serialized per chunk of the streamed upcoming-doses response
+STREAM_CHUNK = 200
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SyncThrottle])
 def sync_schedules(request):
     """
     Synchronize a batch of schedules from a client.
@@ -17,61 +31,126 @@ def sync_schedules(request):
     - If ID is provided and 'is_deleted' is False/missing, updates the schedule
     - If ID is null/missing and 'is_deleted' is False/missing, creates a new schedule
     """
-    data = request.data
-    if not isinstance(data, list):
+    batches = sync_batches(request)
+    if batches is None:
         return Response({"error": "Request body must be a list of schedule objects."}, status=status.HTTP_400_BAD_REQUEST)
 
     results = []
     
     try:
         with transaction.atomic():
-            for item_data in data:
-                schedule_id = item_data.get('id')
-                is_deleted = item_data.get('is_deleted', False)
+            for batch in batches:
+                # One query for the existing rows the batch refers to
+                schedules = ExistingRows(Schedule.objects.filter(user=request.user), batch)
+                for item_data in batch:
+                    schedule_id = item_data.get('id')
+                    is_deleted = item_data.get('is_deleted', False)
                 
-                if is_deleted and schedule_id:
-                    # DELETE logic
-                    try:
-                        schedule = Schedule.objects.get(id=schedule_id, user=request.user)
-                        schedule.delete()
-                        results.append({'status': 'deleted', 'id': schedule_id})
-                    except Schedule.DoesNotExist:
-                        results.append({'status': 'error', 'id': schedule_id, 'errors': 'Schedule not found for deletion.'})
-                elif is_deleted and not schedule_id:
-                    # Can't delete without an ID
-                    results.append({'status': 'error', 'id': None, 'errors': 'Cannot delete schedule without ID.'})
-                elif schedule_id and not is_deleted:
-                    # UPDATE logic
-                    try:
-                        schedule = Schedule.objects.get(id=schedule_id, user=request.user)
-                        # Remove sync-specific fields that shouldn't be saved to the model
-                        clean_data = {k: v for k, v in item_data.items() if k not in ['user', 'is_deleted']}
-                        serializer = ScheduleSerializer(instance=schedule, data=clean_data, partial=True)
+                    if is_deleted and schedule_id:
+                        # DELETE logic
+                        schedule = schedules.pop(schedule_id)
+                        if schedule is not None:
+                            schedule.delete()
+                            results.append({'status': 'deleted', 'id': schedule_id})
+                        else:
+                            results.append({'status': 'error', 'id': schedule_id, 'errors': 'Schedule not found for deletion.'})
+                    elif is_deleted and not schedule_id:
+                        # Can't delete without an ID
+                        results.append({'status': 'error', 'id': None, 'errors': 'Cannot delete schedule without ID.'})
+                    elif schedule_id and not is_deleted:
+                        # UPDATE logic
+                        schedule = schedules.get(schedule_id)
+                        if schedule is not None:
+                            # Remove sync-specific fields that shouldn't be saved to the model
+                            clean_data = {k: v for k, v in item_data.items() if k not in ['user', 'is_deleted']}
+                            serializer = ScheduleSerializer(instance=schedule, data=clean_data, partial=True)
+                            if serializer.is_valid():
+                                serializer.save()
+                                results.append({'status': 'updated', 'id': schedule.id})
+                            else:
+                                results.append({'status': 'error', 'id': schedule_id, 'errors': serializer.errors})
+                        else:
+                            results.append({'status': 'error', 'id': schedule_id, 'errors': 'Schedule not found.'})
+                    elif not schedule_id and not is_deleted:
+                        # CREATE logic
+                        clean_data = {k: v for k, v in item_data.items() if k not in ['id', 'user', 'is_deleted']}
+                        serializer = ScheduleSerializer(data=clean_data)
                         if serializer.is_valid():
-                            serializer.save()
-                            results.append({'status': 'updated', 'id': schedule.id})
+                            new_schedule = serializer.save(user=request.user)
+                            results.append({'status': 'created', 'id': new_schedule.id})
                         else:
-                            results.append({'status': 'error', 'id': schedule_id, 'errors': serializer.errors})
-                    except Schedule.DoesNotExist:
-                        results.append({'status': 'error', 'id': schedule_id, 'errors': 'Schedule not found.'})
-                elif not schedule_id and not is_deleted:
-                    # CREATE logic
-                    clean_data = {k: v for k, v in item_data.items() if k not in ['id', 'user', 'is_deleted']}
-                    serializer = ScheduleSerializer(data=clean_data)
-                    if serializer.is_valid():
-                        new_schedule = serializer.save(user=request.user)
-                        results.append({'status': 'created', 'id': new_schedule.id})
-                    else:
-                        results.append({'status': 'error', 'id': None, 'errors': serializer.errors})
+                            results.append({'status': 'error', 'id': None, 'errors': serializer.errors})
             
             has_errors = any(r['status'] == 'error' for r in results)
             if has_errors:
                 raise Exception("Errors occurred during sync, rolling back all changes.")
+            versions.bump(request.user.id, 'schedules')
 
     except Exception as e:
+        metrics.record_sync('schedules', results, committed=False)
+        if isinstance(e, APIException):
+            # Malformed or oversized body, answered by DRF (see dosealert.syncbody)
+            raise
         return Response({
             'error': str(e),
             'details': [r for r in results if r['status'] == 'error']
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    metrics.record_sync('schedules', results, committed=True)
     return Response(results, status=status.HTTP_200_OK)
+
+
+def _stream_json_array(items, renderer, media_type):
+    """Render ``items`` as a JSON array with ``renderer``, STREAM_CHUNK at a time"""
+    yield b'['
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == STREAM_CHUNK:
+            # The rendered chunk without its brackets
+            yield (b'' if first else b',') + renderer.render(chunk, media_type)[1:-1]
+            first, chunk = False, []
+    if chunk:
+        yield (b'' if first else b',') + renderer.render(chunk, media_type)[1:-1]
+    yield b']'
+
+
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upcoming_doses(request):
+    """
+    List dose occurrences between ``from`` and ``to`` without materializing
+    reminders: active schedules are expanded on the fly and merged with the
+    reminders and adherence records that already exist in the window.
+    """
+    try:
+        start, end = parse_window(request.query_params.get('from'), request.query_params.get('to'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Both queries run here so that streaming the response needs no database access
+    schedules = list(Schedule.objects.active().filter(user=request.user))
+    reminders = list(
+        Reminder.objects.filter(
+            schedule__user=request.user,
+            scheduled_at__gte=start,
+            scheduled_at__lt=end,
+        ).order_by('scheduled_at', 'schedule_id', 'id').values(
+            'id', 'schedule_id', 'scheduled_at', 'status',
+            resolved_medication_id=Coalesce('medication_id', 'schedule__medication_id'),
+            medication_name=Coalesce('medication__name', 'schedule__medication__name'),
+            adherence_record_id=F('adherence_record__id'),
+            adherence_status=F('adherence_record__status'),
+        )
+    )
+    occurrences = iter_upcoming(schedules, reminders, start, end)
+    if request.accepted_renderer.format != 'json':
+        # A MessagePack array starts with its length, and the browsable API
+        # renders a whole page: both get the list rendered at once
+        return Response(list(occurrences))
+    return StreamingHttpResponse(
+        _stream_json_array(occurrences, request.accepted_renderer, request.accepted_media_type),
+        content_type=request.accepted_media_type,
+    )
@@ -1,10 +1,16 @@
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
+from dosealert.fastlists import ValuesListMixin
+from dosealert.replicas import replica_reads
+from dosealert.versions import VersionedListMixin
 from .models import Schedule
-from .serializers import ScheduleSerializer
+from .serializers import ScheduleSerializer, ScheduleValuesSerializer
 
-class ScheduleViewSet(ModelViewSet):
+@replica_reads
+class ScheduleViewSet(VersionedListMixin, ValuesListMixin, ModelViewSet):
     serializer_class = ScheduleSerializer
+    values_serializer_class = ScheduleValuesSerializer
+    version_collection = version_resource = 'schedules'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DeletionJob
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'target_id', 'user', 'status', 'created_at', 'updated_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    fields = ('kind', 'target_id', 'user', 'status', 'progress', 'error', 'created_at', 'updated_at', 'finished_at')
+    readonly_fields = fields
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
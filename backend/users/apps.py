@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from dosealert.throttling import warn_unshared_cache
+        # The login and token endpoints depend on these budgets
+        warn_unshared_cache()
@@ -0,0 +1,191 @@
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+# What is cached of a user: the authenticators read nothing else, and the
+# perf middleware reads is_staff. Other fields load from the row on access.
+CACHED_FIELDS = ('id', 'is_active', 'is_staff')
+
+
+def _user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def _password_hash(password):
+    # Only the revoke check needs it, and only this digest of it
+    return get_md5_hash_password(password) if api_settings.CHECK_REVOKE_TOKEN else None
+
+
+def _entry(row):
+    *values, password = row
+    return values, _password_hash(password)
+
+
+def _from_entry(entry):
+    values, password_hash = entry
+    # The instance User.objects.only(*CACHED_FIELDS) would load: the other
+    # fields are deferred. from_db() takes the values in the order of the
+    # model's fields.
+    fields = dict(zip(CACHED_FIELDS, values))
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+    return User.from_db(User.objects.db, names, [fields[name] for name in names]), password_hash
+
+
+def get_cached_user(user_id):
+    """
+    The user with ``user_id`` and the ``get_md5_hash_password`` digest of its
+    password (``None`` unless ``CHECK_REVOKE_TOKEN``), from the cache when it
+    was resolved within the last ``AUTH_USER_CACHE_SECONDS``. Only the
+    ``CACHED_FIELDS`` of the user are loaded. Raises ``User.DoesNotExist``.
+    """
+    lookup = {api_settings.USER_ID_FIELD: user_id}
+    if not settings.AUTH_USER_CACHE_SECONDS:
+        user = User.objects.get(**lookup)
+        return user, _password_hash(user.password)
+    key = _user_cache_key(user_id)
+    try:
+        entry = cache.get(key)
+    except Exception:
+        logger.warning('Could not read the cached user %s', user_id, exc_info=True)
+        entry = None
+    if entry is None:
+        entry = _entry(User.objects.values_list(*CACHED_FIELDS, 'password').get(**lookup))
+        try:
+            cache.set(key, entry, settings.AUTH_USER_CACHE_SECONDS)
+        except Exception:
+            logger.warning('Could not cache user %s', user_id, exc_info=True)
+    return _from_entry(entry)
+
+
+async def aget_cached_user(user_id):
+    """Async ``get_cached_user``"""
+    lookup = {api_settings.USER_ID_FIELD: user_id}
+    if not settings.AUTH_USER_CACHE_SECONDS:
+        user = await User.objects.aget(**lookup)
+        return user, _password_hash(user.password)
+    key = _user_cache_key(user_id)
+    try:
+        entry = await cache.aget(key)
+    except Exception:
+        logger.warning('Could not read the cached user %s', user_id, exc_info=True)
+        entry = None
+    if entry is None:
+        entry = _entry(await User.objects.values_list(*CACHED_FIELDS, 'password').aget(**lookup))
+        try:
+            await cache.aset(key, entry, settings.AUTH_USER_CACHE_SECONDS)
+        except Exception:
+            logger.warning('Could not cache user %s', user_id, exc_info=True)
+    return _from_entry(entry)
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached user so the next request reads the row again"""
+    try:
+        cache.delete(_user_cache_key(user_id))
+    except Exception:
+        # The entry expires after AUTH_USER_CACHE_SECONDS anyway
+        logger.warning('Could not invalidate the cached user %s', user_id, exc_info=True)
+
+
+def _check_user(user, password_hash, validated_token):
+    """Raise ``AuthenticationFailed`` like ``JWTAuthentication.get_user`` for an inactive user or a revoked token"""
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that resolves the token's user through
+    ``get_cached_user`` instead of querying the user row on every request.
+    The same checks are applied to the cached user.
+
+    ``request.user`` is deferred like ``User.objects.only(*CACHED_FIELDS)``:
+    reading any other field, such as ``username`` or ``email``, runs a query
+    for that field. Views that use more of the user should fetch the row
+    once (``UserProfileView.get_object`` does).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user, password_hash = get_cached_user(user_id)
+        except User.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        _check_user(user, password_hash, validated_token)
+        return user
+
+
+async def aauthenticate(request):
+    """
+    Resolve the JWT user for a plain async Django view.
+
+    DRF views are sync-only, so the async read endpoints authenticate here:
+    token validation is pure CPU and the user row is fetched through the
+    async ORM (or the cache, see ``aget_cached_user``), and checked like
+    ``CachedJWTAuthentication`` does. Returns ``None`` for missing or
+    invalid credentials; like DRF, sets ``request.auth`` to the validated
+    token.
+    """
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        return None
+
+    raw_token = auth.get_raw_token(header)
+    if raw_token is None:
+        return None
+
+    try:
+        validated_token = auth.get_validated_token(raw_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+    try:
+        user, password_hash = await aget_cached_user(user_id)
+        _check_user(user, password_hash, validated_token)
+    except (User.DoesNotExist, AuthenticationFailed):
+        return None
+
+    request.auth = validated_token
+    return user
+
+
+def async_jwt_required(view):
+    """Authenticate an async view with JWT, answering 401 like DRF does"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aauthenticate(request)
+        if user is None:
+            response = JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=401
+            )
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
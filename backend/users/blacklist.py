@@ -0,0 +1,194 @@
+"""
+Refresh-token blacklist lookups through a bloom filter, and pruning of the
+token tables.
+
+simplejwt checks every refresh token it reads (refresh, logout) against
+``BlacklistedToken`` with a join on ``OutstandingToken``. Here each process
+keeps a bloom filter of the blacklisted JTIs; a token the filter has never
+seen is not blacklisted and skips the query. Only possible hits, a small
+share of false positives among them, reach the database.
+
+The filter is loaded from the table on first use and then follows it by
+primary key: at most every ``TOKEN_BLACKLIST_SYNC_SECONDS`` the rows added
+since the last sync are read with one indexed query. Tokens this process
+blacklists are added at once, so only a token blacklisted by another
+worker within the sync interval can get past the filter. Once more than
+``TOKEN_BLACKLIST_FILTER_CAPACITY`` JTIs were added, the filter is rebuilt
+from the blacklisted tokens that have not expired. The new filter is built
+aside, without holding the lock, and replaces the old one only once the
+scan completed; until then the old filter keeps answering, and a process
+with no filter yet sends every token to the database.
+
+``purge_expired_tokens`` deletes expired outstanding tokens and their
+blacklist entries in chunks; see the ``purge_expired_tokens`` command.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .deletion import raw_delete
+
+# False positive rate of a filter holding its full capacity
+FALSE_POSITIVE_RATE = 0.001
+# Each sync rereads this many rows before the last one seen, so rows that
+# committed after a row with a higher id are still picked up
+SYNC_OVERLAP = 1000
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings, with double hashing"""
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        new = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        # Values already present do not count towards the capacity
+        self.count += new
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class _FilterState:
+    __slots__ = ('filter', 'last_id', 'synced_at', 'rebuilding')
+
+    def __init__(self):
+        self.filter = None
+        self.last_id = 0
+        self.synced_at = 0.0
+        self.rebuilding = False
+
+
+_state = _FilterState()
+_lock = threading.Lock()
+
+
+def _build():
+    """A new filter of the blacklisted JTIs that have not expired, and the last row id it holds"""
+    bloom = BloomFilter(settings.TOKEN_BLACKLIST_FILTER_CAPACITY)
+    last_id = 0
+    rows = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        .order_by('id')
+        .values_list('id', 'token__jti')
+    )
+    for row_id, jti in rows.iterator(chunk_size=10000):
+        bloom.add(jti)
+        last_id = row_id
+    return bloom, last_id
+
+
+def _rebuild():
+    """Replace the filter with a new one, built without holding ``_lock``"""
+    try:
+        bloom, last_id = _build()
+    except BaseException:
+        with _lock:
+            _state.rebuilding = False
+        raise
+    with _lock:
+        _state.filter = bloom
+        _state.last_id = last_id
+        _state.rebuilding = False
+        # Rows committed during the scan, and tokens remembered meanwhile
+        _sync()
+
+
+def _sync():
+    rows = (
+        BlacklistedToken.objects.filter(id__gt=_state.last_id - SYNC_OVERLAP)
+        .order_by('id')
+        .values_list('id', 'token__jti')
+    )
+    for row_id, jti in rows.iterator(chunk_size=10000):
+        _state.filter.add(jti)
+        _state.last_id = max(_state.last_id, row_id)
+    _state.synced_at = time.monotonic()
+
+
+def might_be_blacklisted(jti):
+    """False when ``jti`` is certainly not blacklisted (up to the sync interval)"""
+    with _lock:
+        rebuild = not _state.rebuilding and (
+            _state.filter is None or _state.filter.count > settings.TOKEN_BLACKLIST_FILTER_CAPACITY
+        )
+        if rebuild:
+            _state.rebuilding = True
+        elif _state.filter is not None and time.monotonic() - _state.synced_at >= settings.TOKEN_BLACKLIST_SYNC_SECONDS:
+            _sync()
+    if rebuild:
+        _rebuild()
+    with _lock:
+        # No filter while the first one is built: ask the database
+        return _state.filter is None or jti in _state.filter
+
+
+def remember_blacklisted(jti):
+    with _lock:
+        if _state.filter is not None:
+            _state.filter.add(jti)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """``RefreshToken`` whose blacklist check consults the bloom filter first"""
+
+    def check_blacklist(self):
+        if might_be_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        remember_blacklisted(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+def purge_expired_tokens(now=None, chunk_size=5000, progress=None):
+    """
+    Delete outstanding tokens that expired before ``now`` with their
+    blacklist entries, ``chunk_size`` tokens per transaction.
+
+    Tokens are walked by primary key from the oldest, so no chunk rescans
+    the rows deleted before it. Reports each chunk to ``progress(tokens,
+    blacklisted)``. Returns the number of outstanding tokens deleted.
+    """
+    now = now or timezone.now()
+    purged = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                OutstandingToken.objects.filter(id__gt=last_id, expires_at__lt=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return purged
+            blacklisted = raw_delete(BlacklistedToken.objects.filter(token_id__in=ids))
+            count = raw_delete(OutstandingToken.objects.filter(id__in=ids))
+        last_id = ids[-1]
+        purged += count
+        if progress is not None:
+            progress(count, blacklisted)
@@ -0,0 +1,164 @@
+"""
+Chunked removal of a user's reminders, a medication or a whole account.
+
+Deleting through the ORM makes Django's collector load every reminder and
+adherence record that cascades from the deleted row, then delete them all
+in one transaction. Here the large tables are emptied child-first in
+chunks of ``DELETION_CHUNK_SIZE`` primary keys, with one short transaction
+and one raw ``DELETE ... WHERE id IN (...)`` per chunk. Only the few rows
+left at the end (the medication or user itself, its schedules, streaks,
+calendars and tokens) go through the ORM.
+
+Views run removals of up to ``DELETION_INLINE_LIMIT`` reminders in the
+request. Larger ones are queued as a ``DeletionJob`` for the
+``process_deletions`` command, which records progress on the job.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from adherence.calendars import rebuild_calendars
+from dosealert import versions
+from adherence.models import AdherenceRecord
+from meds.models import Medication
+from reminders.models import Reminder
+from schedules.models import Schedule
+
+from .models import DeletionJob
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# A running job that has not reported progress for this long is taken over
+STALE_AFTER = timedelta(minutes=30)
+
+
+def raw_delete(queryset):
+    """Delete ``queryset`` with one DELETE statement: no collector, no signals, no cascades"""
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
+
+def delete_in_chunks(queryset, chunk_size=None, progress=None, before_chunk=None):
+    """
+    Delete the rows of ``queryset`` ``chunk_size`` at a time, bypassing the
+    collector. Rows that reference them must be gone already, or be removed
+    by ``before_chunk(ids)`` in the chunk's transaction. Reports each chunk
+    to ``progress(label, count)``. Returns the number of rows deleted.
+    """
+    chunk_size = chunk_size or settings.DELETION_CHUNK_SIZE
+    model = queryset.model
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            if before_chunk is not None:
+                before_chunk(ids)
+            count = raw_delete(model.objects.filter(pk__in=ids))
+        deleted += count
+        if progress is not None:
+            progress(model._meta.label, count)
+
+
+def _delete_reminders(reminders, chunk_size, progress):
+    """Delete ``reminders`` together with their adherence records"""
+    def delete_records(ids):
+        count = raw_delete(AdherenceRecord.objects.filter(reminder_id__in=ids))
+        if progress is not None and count:
+            progress(AdherenceRecord._meta.label, count)
+
+    return delete_in_chunks(reminders, chunk_size, progress, before_chunk=delete_records)
+
+
+def delete_user_reminders(user_id, chunk_size=None, progress=None):
+    """Delete every reminder of the user and the adherence records answering them"""
+    schedule_ids = list(Schedule.objects.filter(user_id=user_id).values_list('id', flat=True))
+    _delete_reminders(Reminder.objects.filter(schedule_id__in=schedule_ids), chunk_size, progress)
+    # The records went by raw deletes, which skip the receiver that keeps the calendars
+    rebuild_calendars(users=[user_id])
+    versions.bump(user_id, 'reminders')
+
+
+def delete_medication(medication_id, chunk_size=None, progress=None):
+    """Delete a medication with its reminders, adherence records and schedules"""
+    user_ids = list(Medication.objects.filter(pk=medication_id).values_list('user_id', flat=True))
+    schedule_ids = list(Schedule.objects.filter(medication_id=medication_id).values_list('id', flat=True))
+    # Each pass filters on one indexed column
+    _delete_reminders(Reminder.objects.filter(schedule_id__in=schedule_ids), chunk_size, progress)
+    _delete_reminders(Reminder.objects.filter(medication_id=medication_id), chunk_size, progress)
+    delete_in_chunks(AdherenceRecord.objects.filter(medication_id=medication_id), chunk_size, progress)
+    with transaction.atomic():
+        Medication.objects.filter(pk=medication_id).delete()
+    versions.bump(user_ids, 'medications')
+
+
+def delete_account(user_id, chunk_size=None, progress=None):
+    """Delete a user and everything they own"""
+    schedule_ids = list(Schedule.objects.filter(user_id=user_id).values_list('id', flat=True))
+    medication_ids = list(Medication.objects.filter(user_id=user_id).values_list('id', flat=True))
+    _delete_reminders(Reminder.objects.filter(schedule_id__in=schedule_ids), chunk_size, progress)
+    _delete_reminders(Reminder.objects.filter(medication_id__in=medication_ids), chunk_size, progress)
+    delete_in_chunks(AdherenceRecord.objects.filter(user_id=user_id), chunk_size, progress)
+    with transaction.atomic():
+        User.objects.filter(pk=user_id).delete()
+
+
+RUNNERS = {
+    'reminders': delete_user_reminders,
+    'medication': delete_medication,
+    'account': delete_account,
+}
+
+
+def queue_deletion(user, kind, target_id):
+    """The unfinished job removing ``target_id``, created if there is none"""
+    job = DeletionJob.objects.filter(kind=kind, target_id=target_id, status__in=('pending', 'running')).first()
+    return job or DeletionJob.objects.create(user=user, kind=kind, target_id=target_id)
+
+
+def claim_job():
+    """Mark the oldest pending (or abandoned) job as running and return it"""
+    with transaction.atomic():
+        job = (
+            DeletionJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='running', updated_at__lt=timezone.now() - STALE_AFTER))
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def run_job(job, chunk_size=None, progress=None):
+    """
+    Carry out ``job``, saving its progress after every chunk. Deletions are
+    idempotent, so a job that failed or was abandoned can simply run again.
+    """
+    def record(label, count):
+        job.progress[label] = job.progress.get(label, 0) + count
+        DeletionJob.objects.filter(pk=job.pk).update(progress=job.progress, updated_at=timezone.now())
+        if progress is not None:
+            progress(label, count)
+
+    try:
+        RUNNERS[job.kind](job.target_id, chunk_size, record)
+    except Exception as e:
+        logger.exception('Deletion job %s failed', job.pk)
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'done'
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'progress', 'finished_at', 'updated_at'])
+    return job
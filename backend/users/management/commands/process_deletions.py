@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from users.deletion import claim_job, queue_deletion, run_job
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Carry out queued deletions (reminders, medications, accounts) in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account',
+            metavar='USERNAME',
+            help='Deactivate this account and queue the removal of it and all its data first',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.DELETION_CHUNK_SIZE,
+            help='Rows deleted per transaction',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Stop after this many jobs (0: until the queue is empty)',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Show progress after every chunk',
+        )
+
+    def handle(self, *args, **options):
+        if options['account']:
+            try:
+                user = User.objects.get(username=options['account'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['account']!r}.")
+            # Signed-in clients are rejected from now on; the data goes with the job
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            job = queue_deletion(None, 'account', user.pk)
+            self.stdout.write(f'Queued removal of account {user.username} (job {job.pk}).')
+
+        def progress(label, count):
+            if options['verbose']:
+                self.stdout.write(f'    {label}: {count} rows')
+
+        processed = failed = 0
+        while not options['max_jobs'] or processed < options['max_jobs']:
+            job = claim_job()
+            if job is None:
+                break
+            self.stdout.write(f'  - job {job.pk}: deleting {job.kind} {job.target_id}...')
+            started = time.monotonic()
+            run_job(job, options['chunk_size'], progress)
+            processed += 1
+            counts = ', '.join(f'{label} {count}' for label, count in sorted(job.progress.items())) or 'nothing'
+            if job.status == 'failed':
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'    failed after {counts}: {job.error}'))
+            else:
+                self.stdout.write(f'    deleted {counts} in {time.monotonic() - started:.1f}s')
+
+        if processed == 0:
+            self.stdout.write(self.style.SUCCESS('No deletions queued.'))
+        elif failed:
+            self.stdout.write(self.style.WARNING(f'Processed {processed} deletion jobs, {failed} failed.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} deletion jobs.'))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from users.blacklist import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding refresh tokens and their blacklist entries in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Tokens deleted per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many tokens would be deleted without making changes',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Show progress after every chunk',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        if options['dry_run']:
+            count = OutstandingToken.objects.filter(expires_at__lt=now).count()
+            self.stdout.write(self.style.WARNING(f'DRY RUN: Would delete {count} tokens that expired before {now}.'))
+            return
+
+        deleted = {'tokens': 0, 'blacklisted': 0}
+
+        def progress(tokens, blacklisted):
+            deleted['tokens'] += tokens
+            deleted['blacklisted'] += blacklisted
+            if options['verbose']:
+                self.stdout.write(f"  {deleted['tokens']} tokens deleted...")
+
+        started = time.monotonic()
+        purge_expired_tokens(now, chunk_size=options['chunk_size'], progress=progress)
+        if deleted['tokens'] == 0:
+            self.stdout.write(self.style.SUCCESS('No expired tokens found.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted['tokens']} expired tokens ({deleted['blacklisted']} blacklisted) "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
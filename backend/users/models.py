@@ -1,3 +1,43 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class DeletionJob(models.Model):
+    """
+    A removal too large to run inside a request, carried out in chunks by
+    the ``process_deletions`` command. See ``users.deletion``.
+    """
+    KIND_CHOICES = [
+        ('reminders', 'All reminders of the user'),
+        ('medication', 'Medication'),
+        ('account', 'Account'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # Kept after an account deletion with the user unset; target_id still names it
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="deletion_jobs"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    target_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Rows deleted so far, per table
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='users_deletion_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delete {self.kind} {self.target_id} ({self.status})"
@@ -2,6 +2,10 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from .blacklist import FilteredRefreshToken
+from .models import DeletionJob
 
 User = get_user_model()
 
@@ -66,3 +70,15 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'date_joined')
         read_only_fields = ('id', 'date_joined')
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ('id', 'kind', 'target_id', 'status', 'progress', 'error', 'created_at', 'updated_at', 'finished_at')
+        read_only_fields = fields
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the blacklist through ``users.blacklist``"""
+    token_class = FilteredRefreshToken
@@ -1,3 +1,166 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from dosealert.throttling import TokenBucketThrottle
+
+from . import blacklist
+from .blacklist import BloomFilter, FilteredRefreshToken, might_be_blacklisted
+
+User = get_user_model()
+
+
+def throttle_rates(**rates):
+    """``override_settings`` with only the given throttle scopes turned on"""
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {'auth_ip': None, 'auth_username': None, 'sync': None, **rates},
+    })
+
+
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1_000_000.0
+        timer = mock.patch.object(TokenBucketThrottle, 'timer', new=lambda throttle: self.now)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def login(self, username='alice'):
+        return self.client.post(
+            '/api/users/login/', {'username': username, 'password': 'wrong'}, secure=True,
+        )
+
+    @throttle_rates(auth_username='2/min')
+    def test_rejects_over_budget_with_retry_after(self):
+        self.assertEqual([self.login().status_code for _ in range(2)], [400, 400])
+
+        response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        # Two requests drew the bucket down; one token comes back every 30s
+        self.assertEqual(response['Retry-After'], '30')
+
+    @throttle_rates(auth_username='2/min')
+    def test_bucket_refills(self):
+        for _ in range(2):
+            self.login()
+        self.now += 29
+        self.assertEqual(self.login()['Retry-After'], '1')
+
+        self.now += 1
+        self.assertEqual(self.login().status_code, 400)
+
+    @throttle_rates(auth_username='1/min')
+    def test_username_budget_is_per_account(self):
+        self.login('alice')
+        self.assertEqual(self.login('ALICE ').status_code, 429)
+        self.assertEqual(self.login('bob').status_code, 400)
+
+    @throttle_rates(auth_ip='1/min')
+    def test_token_refresh_is_throttled_per_ip(self):
+        for path in ('/api/auth/refresh/', '/api/users/token/refresh/'):
+            cache.clear()
+            self.assertEqual(self.client.post(path, {'refresh': 'x'}, secure=True).status_code, 401)
+            response = self.client.post(path, {'refresh': 'x'}, secure=True)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '60')
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        values = [str(uuid.uuid4()) for _ in range(1000)]
+        for value in values:
+            bloom.add(value)
+
+        self.assertEqual([value for value in values if value not in bloom], [])
+
+    def test_false_positive_rate_at_capacity(self):
+        bloom = BloomFilter(1000)
+        for _ in range(1000):
+            bloom.add(str(uuid.uuid4()))
+
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+
+        # About 10 expected at the 0.1% rate
+        self.assertLess(false_positives, 60)
+
+    def test_duplicates_do_not_count(self):
+        bloom = BloomFilter(10)
+        bloom.add('a')
+        bloom.add('a')
+        self.assertEqual(bloom.count, 1)
+
+
+@override_settings(TOKEN_BLACKLIST_FILTER_CAPACITY=10000, TOKEN_BLACKLIST_SYNC_SECONDS=3600)
+class BlacklistFilterTests(TestCase):
+    def setUp(self):
+        state = mock.patch.object(blacklist, '_state', blacklist._FilterState())
+        state.start()
+        self.addCleanup(state.stop)
+        self.user = User.objects.create_user(username='alice', password='correct-horse-9')
+
+    def tokens(self, n):
+        return [RefreshToken.for_user(self.user) for _ in range(n)]
+
+    def blacklist_elsewhere(self, token):
+        """Blacklist ``token`` the way another worker would, behind this filter's back"""
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+
+    def assertBlacklisted(self, tokens):
+        self.assertEqual([t['jti'] for t in tokens if not might_be_blacklisted(t['jti'])], [])
+        for token in tokens:
+            with self.assertRaises(TokenError):
+                FilteredRefreshToken(str(token))
+
+    def test_tokens_blacklisted_before_the_filter_is_built(self):
+        tokens = self.tokens(5)
+        for token in tokens:
+            self.blacklist_elsewhere(token)
+
+        self.assertBlacklisted(tokens)
+
+    def test_tokens_blacklisted_by_this_process(self):
+        might_be_blacklisted('build the filter')
+        tokens = self.tokens(5)
+        for token in tokens:
+            FilteredRefreshToken(str(token)).blacklist()
+
+        self.assertBlacklisted(tokens)
+
+    @override_settings(TOKEN_BLACKLIST_SYNC_SECONDS=0)
+    def test_tokens_blacklisted_by_another_process(self):
+        might_be_blacklisted('build the filter')
+        tokens = self.tokens(5)
+        for token in tokens:
+            self.blacklist_elsewhere(token)
+
+        self.assertBlacklisted(tokens)
+
+    @override_settings(TOKEN_BLACKLIST_FILTER_CAPACITY=3)
+    def test_rebuilt_filter_keeps_every_token(self):
+        might_be_blacklisted('build the filter')
+        tokens = self.tokens(8)
+        for token in tokens:
+            FilteredRefreshToken(str(token)).blacklist()
+        self.assertGreater(blacklist._state.filter.count, 3)
+
+        self.assertBlacklisted(tokens)
+        self.assertLessEqual(blacklist._state.filter.count, len(tokens))
+
+    def test_unknown_tokens_skip_the_database(self):
+        for token in self.tokens(3):
+            self.blacklist_elsewhere(token)
+        might_be_blacklisted('build the filter')
+        token = self.tokens(1)[0]
+
+        with self.assertNumQueries(0):
+            self.assertFalse(might_be_blacklisted(token['jti']))
@@ -1,11 +1,13 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, LoginView, LogoutView, UserProfileView
+from dosealert.throttling import AUTH_THROTTLES
+from .views import DeletionJobView, RegisterView, LoginView, LogoutView, UserProfileView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='user-register'),
     path('login/', LoginView.as_view(), name='user-login'),
     path('logout/', LogoutView.as_view(), name='user-logout'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('token/refresh/', TokenRefreshView.as_view(throttle_classes=AUTH_THROTTLES), name='token-refresh'),
+    path('deletions/<int:pk>/', DeletionJobView.as_view(), name='user-deletion'),
 ]
@@ -6,7 +6,10 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
+from dosealert.throttling import AUTH_THROTTLES, AuthIPThrottle
+from .blacklist import FilteredRefreshToken
+from .models import DeletionJob
+from .serializers import DeletionJobSerializer, UserRegistrationSerializer, UserLoginSerializer, UserSerializer
 
 User = get_user_model()
 
@@ -41,6 +44,8 @@ class RegisterView(generics.CreateAPIView):
     """
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
+    # Every registration is for a new username, so only the address is budgeted
+    throttle_classes = [AuthIPThrottle]
     serializer_class = UserRegistrationSerializer
 
     def create(self, request, *args, **kwargs):
@@ -100,6 +105,7 @@ class LoginView(generics.GenericAPIView):
     User login endpoint
     """
     permission_classes = (AllowAny,)
+    throttle_classes = AUTH_THROTTLES
     serializer_class = UserLoginSerializer
 
     def post(self, request, *args, **kwargs):
@@ -127,7 +133,7 @@ class LogoutView(generics.GenericAPIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response({
                 'message': 'Logout successful'
@@ -146,7 +152,20 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # The authenticated user only has the cached fields loaded
+        return User.objects.get(pk=self.request.user.pk)
+
+
+class DeletionJobView(generics.RetrieveAPIView):
+    """
+    Progress of a background deletion, as returned by the 202 responses of
+    the removals that were too large to run in the request
+    """
+    serializer_class = DeletionJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return DeletionJob.objects.filter(user=self.request.user)
 
 ALLOWED_HOSTS = [
    '*' 
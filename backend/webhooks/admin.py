@@ -0,0 +1,41 @@
+from django.contrib import admin
+
+from .models import OutboxEvent, WebhookDelivery, WebhookEndpoint
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('id', 'url', 'user', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'user', 'created_at', 'dispatched_at')
+    list_filter = ('event_type',)
+    fields = ('event_type', 'user', 'payload', 'created_at', 'dispatched_at')
+    readonly_fields = fields
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'endpoint', 'event', 'status', 'attempts', 'next_attempt_at', 'delivered_at')
+    list_filter = ('status',)
+    fields = ('endpoint', 'event', 'status', 'attempts', 'next_attempt_at', 'last_error', 'delivered_at')
+    readonly_fields = fields
+    list_select_related = ('endpoint', 'event')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
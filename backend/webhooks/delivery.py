@@ -0,0 +1,330 @@
+"""
+Delivery of outbox events to webhook endpoints, run by ``deliver_webhooks``.
+
+Each pass of ``deliver`` does the following:
+
+1. Fans out new outbox events: one ``WebhookDelivery`` for each active
+   endpoint of the event's user that accepts its type. The events are
+   then marked dispatched.
+2. Claims due deliveries. They are leased for ``LEASE_SECONDS`` past the
+   request timeout, so a worker that dies mid-send only delays them. The
+   deliveries are grouped into batches of up to ``WEBHOOK_BATCH_SIZE``
+   per endpoint.
+3. POSTs the batches, ``WEBHOOK_CONCURRENCY`` at a time, so one slow
+   endpoint does not hold up the others.
+4. Records the results. On a 2xx answer a batch is delivered. Otherwise
+   each of its deliveries is retried after an exponential backoff with
+   jitter, starting at ``WEBHOOK_RETRY_BASE_SECONDS`` and capped at
+   ``WEBHOOK_RETRY_MAX_SECONDS``. A delivery fails after
+   ``WEBHOOK_MAX_ATTEMPTS`` attempts.
+
+Every step locks rows with ``SKIP LOCKED``, so several workers can run at
+once. Delivery is at least once: receivers should skip event ids they have
+seen.
+
+Batches are signed like this::
+
+    X-DoseAlert-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">
+
+The HMAC key is the endpoint's secret. ``verify_signature`` checks a
+signature for receivers written in Python.
+
+Endpoints must resolve to public addresses only, unless
+``WEBHOOK_ALLOW_PRIVATE_ADDRESSES``: otherwise any user could make the
+server POST to the internal network and read the outcome in ``last_error``.
+``public_addresses`` is checked when an endpoint is registered and again on
+every connection, which goes to the address that was checked, so a DNS
+answer that changes in between cannot get around it. Proxies and redirects
+are not followed.
+"""
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from dosealert import metrics
+
+from .models import OutboxEvent, WebhookDelivery, WebhookEndpoint
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-DoseAlert-Signature'
+# Receivers reject signatures older than this, against replays
+SIGNATURE_TOLERANCE_SECONDS = 300
+LEASE_SECONDS = 60
+USER_AGENT = 'DoseAlert-Webhooks/1.0'
+
+
+def sign(secret, timestamp, body):
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+def verify_signature(secret, header, body, tolerance=SIGNATURE_TOLERANCE_SECONDS, now=None):
+    """Whether ``header`` is a valid, recent signature of ``body`` with ``secret``"""
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (AttributeError, KeyError, ValueError):
+        return False
+    if abs((now or time.time()) - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), f"t={timestamp},v1={parts.get('v1', '')}")
+
+
+def dispatch_events(limit=1000, now=None):
+    """Create the deliveries of up to ``limit`` new outbox events; returns how many events were dispatched"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(dispatched_at__isnull=True)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .only('id', 'user_id', 'event_type')[:limit]
+        )
+        if not events:
+            return 0
+        endpoints = defaultdict(list)
+        for endpoint in WebhookEndpoint.objects.filter(user_id__in={e.user_id for e in events}, is_active=True):
+            endpoints[endpoint.user_id].append(endpoint)
+        WebhookDelivery.objects.bulk_create(
+            [
+                WebhookDelivery(endpoint=endpoint, event=event, next_attempt_at=now)
+                for event in events
+                for endpoint in endpoints[event.user_id]
+                if endpoint.accepts(event.event_type)
+            ],
+            ignore_conflicts=True,
+        )
+        OutboxEvent.objects.filter(id__in=[e.id for e in events]).update(dispatched_at=now)
+    return len(events)
+
+
+def claim_batches(limit=1000, now=None):
+    """Lease up to ``limit`` due deliveries and return them as ``(endpoint, deliveries)`` batches"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            # Deliveries of deactivated endpoints wait until they are active again, or expire (see purge)
+            WebhookDelivery.objects.filter(status='pending', next_attempt_at__lte=now, endpoint__is_active=True)
+            .select_for_update(skip_locked=True, of=('self',))
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        lease = timedelta(seconds=settings.WEBHOOK_TIMEOUT_SECONDS + LEASE_SECONDS)
+        WebhookDelivery.objects.filter(id__in=ids).update(next_attempt_at=now + lease)
+
+    by_endpoint = defaultdict(list)
+    for delivery in (
+        WebhookDelivery.objects.filter(id__in=ids)
+        .select_related('endpoint', 'event')
+        .order_by('event_id')
+    ):
+        by_endpoint[delivery.endpoint_id].append(delivery)
+    size = settings.WEBHOOK_BATCH_SIZE
+    return [
+        (deliveries[0].endpoint, deliveries[start:start + size])
+        for deliveries in by_endpoint.values()
+        for start in range(0, len(deliveries), size)
+    ]
+
+
+def public_addresses(host, port):
+    """
+    The addresses ``host`` resolves to. Raises ``ValueError`` if it does not
+    resolve, or if any of them is not a public (global) address, unless
+    ``WEBHOOK_ALLOW_PRIVATE_ADDRESSES``.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f'Cannot resolve {host}') from e
+    addresses = []
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+        mapped = getattr(address, 'ipv4_mapped', None)
+        if not settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES and not (mapped or address).is_global:
+            raise ValueError(f'{host} does not resolve to a public address')
+        addresses.append(sockaddr[0])
+    return addresses
+
+
+def _connect(connection):
+    error = None
+    for address in public_addresses(connection.host, connection.port):
+        try:
+            return socket.create_connection((address, connection.port), connection.timeout, connection.source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        self.sock = _connect(self)
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        # Certificates are still checked against the host name
+        self.sock = self._context.wrap_socket(_connect(self), server_hostname=self.host)
+
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req, context=self._context)
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    # A redirect would resend the batch somewhere the user did not register
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler, _NoRedirects,
+)
+
+
+def send_batch(endpoint, deliveries):
+    """POST the events of ``deliveries`` to ``endpoint``; returns None on success, else the error"""
+    body = json.dumps(
+        {
+            'events': [
+                {
+                    'id': delivery.event.id,
+                    'type': delivery.event.event_type,
+                    'created_at': delivery.event.created_at,
+                    'data': delivery.event.payload,
+                }
+                for delivery in deliveries
+            ],
+        },
+        cls=DjangoJSONEncoder,
+    ).encode()
+    request = urllib.request.Request(
+        endpoint.url,
+        data=body,
+        method='POST',
+        headers={
+            'Content-Type': 'application/json',
+            'User-Agent': USER_AGENT,
+            SIGNATURE_HEADER: sign(endpoint.secret, int(time.time()), body),
+        },
+    )
+    try:
+        with _opener.open(request, timeout=settings.WEBHOOK_TIMEOUT_SECONDS) as response:
+            if 200 <= response.status < 300:
+                return None
+            return f'HTTP {response.status}'
+    except urllib.error.HTTPError as e:
+        return f'HTTP {e.code}'
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return str(getattr(e, 'reason', e)) or type(e).__name__
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``: exponential, capped, with jitter"""
+    delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.WEBHOOK_RETRY_MAX_SECONDS)
+    return random.uniform(delay / 2, delay)
+
+
+def record_result(deliveries, error, now=None):
+    now = now or timezone.now()
+    ids = [delivery.id for delivery in deliveries]
+    if error is None:
+        WebhookDelivery.objects.filter(id__in=ids).update(
+            status='delivered', attempts=F('attempts') + 1, delivered_at=now, last_error='',
+        )
+        metrics.WEBHOOK_EVENTS.labels('delivered').inc(len(ids))
+        latency = metrics.WEBHOOK_LATENCY
+        for delivery in deliveries:
+            latency.observe((now - delivery.event.created_at).total_seconds())
+        return
+
+    by_attempts = defaultdict(list)
+    for delivery in deliveries:
+        by_attempts[delivery.attempts + 1].append(delivery.id)
+    for attempts, ids in by_attempts.items():
+        if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            changes = {'status': 'failed'}
+            result = 'failed'
+        else:
+            changes = {'next_attempt_at': now + timedelta(seconds=retry_delay(attempts))}
+            result = 'retried'
+        WebhookDelivery.objects.filter(id__in=ids).update(attempts=attempts, last_error=error[:1000], **changes)
+        metrics.WEBHOOK_EVENTS.labels(result).inc(len(ids))
+
+
+def deliver(limit=1000):
+    """
+    One pass: dispatch new events, then send the due deliveries. Returns
+    ``(events dispatched, deliveries attempted, attempts that failed)``.
+    """
+    dispatched = dispatch_events(limit)
+    batches = claim_batches(limit)
+    if not batches:
+        return dispatched, 0, 0
+    with ThreadPoolExecutor(max_workers=settings.WEBHOOK_CONCURRENCY) as executor:
+        errors = list(executor.map(lambda batch: send_batch(*batch), batches))
+
+    sent = failed = 0
+    for (endpoint, deliveries), error in zip(batches, errors):
+        if error is not None:
+            logger.warning('Webhook batch of %s events to %s failed: %s', len(deliveries), endpoint.url, error)
+            failed += len(deliveries)
+        sent += len(deliveries)
+        record_result(deliveries, error)
+    return dispatched, sent, failed
+
+
+def purge(now=None, chunk_size=5000):
+    """
+    Delete events dispatched more than WEBHOOK_RETENTION_DAYS ago that have
+    nothing left to send, with their deliveries. Returns the number of events.
+
+    Pending deliveries of such events to an endpoint that is not active fail
+    first: deliveries wait for a deactivated endpoint only that long.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.WEBHOOK_RETENTION_DAYS)
+    expired = WebhookDelivery.objects.filter(
+        status='pending', endpoint__is_active=False, event__dispatched_at__lt=cutoff,
+    ).update(status='failed', last_error='Expired while the endpoint was inactive')
+    if expired:
+        metrics.WEBHOOK_EVENTS.labels('failed').inc(expired)
+    purged = 0
+    while True:
+        ids = list(
+            OutboxEvent.objects.filter(dispatched_at__lt=cutoff)
+            .exclude(deliveries__status='pending')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return purged
+        with transaction.atomic():
+            WebhookDelivery.objects.filter(event_id__in=ids).delete()
+            OutboxEvent.objects.filter(id__in=ids).delete()
+        purged += len(ids)
@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webhooks.delivery import deliver, purge
+
+# Seconds between purges of old events while running continuously
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Send adherence events from the outbox to webhook endpoints in signed batches, retrying failures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Stop when nothing is due instead of polling for new events',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.WEBHOOK_POLL_SECONDS,
+            help='Seconds to wait for new events when nothing is due',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=1000,
+            help='Events dispatched and deliveries sent per pass',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'dispatched': 0, 'sent': 0, 'failed': 0}
+        last_purge = None
+        try:
+            while True:
+                if last_purge is None or time.monotonic() - last_purge > PURGE_INTERVAL:
+                    purged = purge()
+                    last_purge = time.monotonic()
+                    if purged:
+                        self.stdout.write(f'  purged {purged} old events')
+
+                dispatched, sent, failed = deliver(options['limit'])
+                totals['dispatched'] += dispatched
+                totals['sent'] += sent
+                totals['failed'] += failed
+                if sent:
+                    self.stdout.write(f'  sent {sent} events, {failed} to retry or failed')
+                if dispatched or sent:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        summary = (
+            f"Dispatched {totals['dispatched']} events, sent {totals['sent']} deliveries "
+            f"({totals['failed']} not accepted)."
+        )
+        self.stdout.write(self.style.WARNING(summary) if totals['failed'] else self.style.SUCCESS(summary))
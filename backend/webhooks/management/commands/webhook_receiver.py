@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from webhooks.testing import WebhookReceiver
+
+
+class Command(BaseCommand):
+    help = 'Run a local webhook endpoint that prints the signed batches it receives, for development'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8099, help='Port to listen on (127.0.0.1)')
+        parser.add_argument('--secret', required=True, help="Secret of the webhook endpoint pointed here")
+        parser.add_argument('--fail', type=int, default=0, help='Answer this many batches with 503 first')
+
+    def handle(self, *args, **options):
+        def on_batch(batch):
+            events = batch['events'] or []
+            style = self.style.SUCCESS if batch['status'] < 300 else self.style.ERROR
+            self.stdout.write(style(
+                f"{batch['status']} {len(events)} events, signature {'valid' if batch['signed'] else 'INVALID'}"
+            ))
+            for event in events:
+                self.stdout.write(f"    {event['id']} {event['type']} record {event['data'].get('id')}")
+
+        receiver = WebhookReceiver(options['secret'], fail=options['fail'], port=options['port'], on_batch=on_batch)
+        self.stdout.write(f'Receiving webhooks at {receiver.url} (Ctrl+C to stop)')
+        try:
+            receiver.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            receiver.server.server_close()
@@ -0,0 +1,94 @@
+import secrets
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+
+def generate_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookEndpoint(models.Model):
+    """
+    A URL of an integrator (a caregiver, a clinic) that receives the user's
+    adherence events, signed with ``secret``. See ``webhooks.delivery``.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="webhook_endpoints")
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, default=generate_secret)
+    # Event types to send, all of them when empty
+    event_types = models.JSONField(default=list, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.url} ({self.user_id})"
+
+    def accepts(self, event_type):
+        return not self.event_types or event_type in self.event_types
+
+
+class OutboxEvent(models.Model):
+    """
+    An adherence event, written in the transaction of the change it
+    describes (see ``webhooks.outbox``) and fanned out to the user's
+    endpoints by ``deliver_webhooks``.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="outbox_events")
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    # When deliveries were created for the user's endpoints
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Events waiting to be fanned out, see webhooks.delivery
+            models.Index(
+                fields=['id'],
+                condition=models.Q(dispatched_at__isnull=True),
+                name='webhooks_outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.payload.get('id')} ({self.user_id})"
+
+
+class WebhookDelivery(models.Model):
+    """One event for one endpoint, sent in a batch with the endpoint's other due events"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    ]
+
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name="deliveries")
+    event = models.ForeignKey(OutboxEvent, on_delete=models.CASCADE, related_name="deliveries")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-id']
+        unique_together = ['endpoint', 'event']
+        indexes = [
+            # Deliveries due for an attempt, see webhooks.delivery
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status='pending'),
+                name='webhooks_delivery_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Event {self.event_id} to endpoint {self.endpoint_id} ({self.status})"
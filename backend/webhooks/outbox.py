@@ -0,0 +1,62 @@
+"""
+Adherence events for webhooks, written to the outbox table.
+
+Writers add events inside the transaction of the change they describe, so
+an event is stored if and only if its change is committed. Writing is all
+a request pays: one INSERT for all of its events. Finding the user's
+endpoints and sending is left to the ``deliver_webhooks`` command
+(``webhooks.delivery``).
+
+Events are sent when a record's status changes (``adherence.taken``,
+``.missed``, ``.skipped``, ``.pending``) and when a record is deleted
+(``adherence.deleted``).
+"""
+from .models import OutboxEvent
+
+STATUS_EVENT_TYPES = ('adherence.taken', 'adherence.missed', 'adherence.skipped', 'adherence.pending')
+EVENT_TYPES = STATUS_EVENT_TYPES + ('adherence.deleted',)
+
+
+def _event(event_type, user_id, record_id, medication_id, reminder_id, status, scheduled_time, **fields):
+    return OutboxEvent(
+        user_id=user_id,
+        event_type=event_type,
+        payload={
+            'id': record_id,
+            'medication': medication_id,
+            'reminder': reminder_id,
+            'status': status,
+            'scheduled_time': scheduled_time,
+            **fields,
+        },
+    )
+
+
+def status_event(record, previous_status=None):
+    """The event for a new ``record``, or one whose status was ``previous_status``"""
+    return _event(
+        f'adherence.{record.status}', record.user_id, record.id, record.medication_id, record.reminder_id,
+        record.status, record.scheduled_time, previous_status=previous_status, actual_time=record.actual_time,
+    )
+
+
+def deleted_event(record):
+    """The event for deleting ``record``; build it before the delete, which clears the id"""
+    return _event(
+        'adherence.deleted', record.user_id, record.id, record.medication_id, record.reminder_id,
+        record.status, record.scheduled_time,
+    )
+
+
+def missed_event(record_id, user_id, medication_id, reminder_id, scheduled_time):
+    """The event for a pending record the sweep marked missed"""
+    return _event(
+        'adherence.missed', user_id, record_id, medication_id, reminder_id, 'missed', scheduled_time,
+        previous_status='pending', actual_time=None,
+    )
+
+
+def add(events):
+    """Write ``events`` with one INSERT, in the caller's transaction"""
+    if events:
+        OutboxEvent.objects.bulk_create(events)
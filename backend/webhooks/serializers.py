@@ -0,0 +1,37 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .delivery import public_addresses
+from .models import WebhookDelivery, WebhookEndpoint
+from .outbox import EVENT_TYPES
+
+
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    event_types = serializers.ListField(child=serializers.ChoiceField(choices=EVENT_TYPES), required=False)
+
+    class Meta:
+        model = WebhookEndpoint
+        fields = ("id", "url", "secret", "event_types", "is_active", "created_at", "updated_at")
+        read_only_fields = ("secret", "created_at", "updated_at")
+
+    def validate_url(self, value):
+        if urlsplit(value).scheme != 'https' and not settings.WEBHOOK_ALLOW_HTTP:
+            raise serializers.ValidationError('Webhook URLs must use https.')
+        url = urlsplit(value)
+        try:
+            public_addresses(url.hostname, url.port or (443 if url.scheme == 'https' else 80))
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+
+class WebhookDeliverySerializer(serializers.ModelSerializer):
+    event_type = serializers.CharField(source='event.event_type', read_only=True)
+    record = serializers.IntegerField(source='event.payload.id', read_only=True)
+
+    class Meta:
+        model = WebhookDelivery
+        fields = ("id", "event", "event_type", "record", "status", "attempts", "next_attempt_at", "last_error", "delivered_at")
+        read_only_fields = fields
@@ -0,0 +1,85 @@
+"""
+A local stand-in for an integrator's webhook endpoint.
+
+``WebhookReceiver`` serves HTTP on 127.0.0.1 in a background thread and
+records each batch POSTed to it, together with whether its signature
+checked out. Tests point an endpoint at ``receiver.url``; the
+``webhook_receiver`` command runs one in the foreground for development.
+``fail`` makes the first batches fail, to exercise retries.
+
+    with WebhookReceiver(endpoint.secret, fail=1) as receiver:
+        endpoint.url = receiver.url
+        ...
+        receiver.batches  # [{'events': [...], 'signed': True, 'status': 503}, ...]
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .delivery import SIGNATURE_HEADER, verify_signature
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        receiver = self.server.receiver
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        signed = verify_signature(receiver.secret, self.headers.get(SIGNATURE_HEADER, ''), body)
+        with receiver.lock:
+            if not signed:
+                status = 401
+            elif receiver.fail > 0:
+                receiver.fail -= 1
+                status = receiver.fail_status
+            else:
+                status = 200
+            try:
+                events = json.loads(body)['events']
+            except (ValueError, KeyError, TypeError):
+                events = None
+            receiver.batches.append({'events': events, 'signed': signed, 'status': status})
+        if receiver.on_batch is not None:
+            receiver.on_batch(receiver.batches[-1])
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookReceiver:
+    def __init__(self, secret, fail=0, fail_status=503, port=0, on_batch=None):
+        self.secret = secret
+        self.fail = fail
+        self.fail_status = fail_status
+        self.on_batch = on_batch
+        self.batches = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.receiver = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    @property
+    def events(self):
+        """Events of the batches that were answered with 2xx"""
+        return [event for batch in self.batches if batch['status'] < 300 for event in batch['events']]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,28 @@
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet
+
+from .models import WebhookEndpoint
+from .serializers import WebhookDeliverySerializer, WebhookEndpointSerializer
+
+# Deliveries listed per endpoint, newest first
+RECENT_DELIVERIES = 50
+
+
+class WebhookEndpointViewSet(ModelViewSet):
+    serializer_class = WebhookEndpointSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WebhookEndpoint.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def deliveries(self, request, pk=None):
+        """The endpoint's most recent deliveries, to see what was sent and why attempts failed"""
+        endpoint = self.get_object()
+        deliveries = endpoint.deliveries.select_related('event')[:RECENT_DELIVERIES]
+        return Response(WebhookDeliverySerializer(deliveries, many=True).data)